@@ -0,0 +1,114 @@
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+
+CACHE_DB = "analysis_cache.db"
+MAX_ENTRIES = 50000
+MAX_AGE = 30 * 24 * 3600
+EVICT_EVERY = 500
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def create_db(db_path=CACHE_DB):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_results (
+            content_hash TEXT,
+            tool TEXT,
+            version TEXT,
+            prompt_hash TEXT,
+            result TEXT,
+            created_at REAL,
+            accessed_at REAL,
+            PRIMARY KEY (content_hash, tool, version, prompt_hash)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_analysis_accessed ON analysis_results (accessed_at)")
+    conn.commit()
+    return conn
+
+
+class AnalysisCache:
+    """
+    Resultatcache för radon, bandit och LLM-granskningar, nycklad på
+    (innehållshash, verktyg, verktygs-/modellversion, prompthash).
+    """
+
+    def __init__(self, db_path=CACHE_DB, max_entries=MAX_ENTRIES, max_age=MAX_AGE):
+        self.conn = create_db(db_path)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.puts = 0
+        self.stats = {}
+
+    def _count(self, tool, key):
+        tool_stats = self.stats.setdefault(tool, {"hits": 0, "misses": 0})
+        tool_stats[key] += 1
+
+    def get(self, digest, tool, version, prompt_hash=""):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute('''
+                SELECT result, created_at FROM analysis_results
+                WHERE content_hash = ? AND tool = ? AND version = ? AND prompt_hash = ?
+            ''', (digest, tool, version, prompt_hash)).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self._count(tool, "misses")
+                return None
+            self.conn.execute('''
+                UPDATE analysis_results SET accessed_at = ?
+                WHERE content_hash = ? AND tool = ? AND version = ? AND prompt_hash = ?
+            ''', (now, digest, tool, version, prompt_hash))
+            self.conn.commit()
+            self._count(tool, "hits")
+        return json.loads(row[0])
+
+    def put(self, digest, tool, version, result, prompt_hash=""):
+        now = time.time()
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO analysis_results
+                (content_hash, tool, version, prompt_hash, result, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (digest, tool, version, prompt_hash, json.dumps(result), now, now))
+            self.conn.commit()
+            self.puts += 1
+            if self.puts % EVICT_EVERY == 0:
+                self._evict()
+
+    def evict(self):
+        with self.lock:
+            return self._evict()
+
+    def _evict(self):
+        # Ta bort för gamla rader och sedan de minst nyligen använda över max_entries
+        c = self.conn.cursor()
+        removed = 0
+        if self.max_age:
+            c.execute("DELETE FROM analysis_results WHERE created_at < ?", (time.time() - self.max_age,))
+            removed += c.rowcount
+        if self.max_entries:
+            c.execute('''
+                DELETE FROM analysis_results WHERE rowid IN (
+                    SELECT rowid FROM analysis_results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            removed += c.rowcount
+        self.conn.commit()
+        return removed
+
+    def print_stats(self):
+        for tool, tool_stats in sorted(self.stats.items()):
+            total = tool_stats["hits"] + tool_stats["misses"]
+            print(f"Cache {tool}: {tool_stats['hits']}/{total} träffar")
+
+    def close(self):
+        self.evict()
+        self.conn.close()
@@ -1,7 +1,9 @@
 import os
-from radon.complexity import cc_visit
-from bandit.core import config, manager
+import io
+from file_unit import FileUnit
+from instrumentation import timed
 
+@timed("discovery")
 def get_python_files(repo_path):
     python_files = []
     for root, _, files in os.walk(repo_path):
@@ -10,14 +12,42 @@ def get_python_files(repo_path):
                 python_files.append(os.path.join(root, file))
     return python_files
 
-def analyze_complexity(filepath):
-    with open(filepath, "r") as f:
-        code = f.read()
-    return cc_visit(code)
+def issue_to_dict(issue):
+    return {"test_id": issue.test_id, "text": issue.text, "lineno": issue.lineno, "severity": issue.severity}
 
-def run_bandit(filepath):
+def _run_bandit_sources(m, filepaths, sources):
+    # Som BanditManager.run_tests, men med källkoden ur FileUnit i stället för att läsa filen igen
+    m.files_list = list(filepaths)
+    new_files_list = list(filepaths)
+    for filepath in filepaths:
+        m._parse_file(filepath, io.BytesIO(sources[filepath].encode("utf-8")), new_files_list)
+    m.files_list = new_files_list
+    m.metrics.aggregate()
+
+def run_bandit_files(filepaths, sources=None):
+    # En BanditConfig/BanditManager för hela sharden i stället för en per fil
+    from bandit.core import config, manager
     b_conf = config.BanditConfig()
     m = manager.BanditManager(b_conf, "file", True)
-    m.discover_files([filepath])
-    m.run_tests()
-    return m.get_issue_list()
+    if sources is not None:
+        _run_bandit_sources(m, filepaths, sources)
+    else:
+        m.discover_files(filepaths)
+        m.run_tests()
+
+    by_path = {os.path.normpath(f): f for f in filepaths}
+    grouped = {f: [] for f in filepaths}
+    for issue in m.get_issue_list():
+        filepath = by_path.get(os.path.normpath(issue.fname), issue.fname)
+        grouped.setdefault(filepath, []).append(issue_to_dict(issue))
+    return grouped
+
+def run_radon_files(filepaths, sources):
+    # Radon för en shard i en worker-process; fel per fil så att en trasig fil inte fäller hela sharden
+    metrics = {}
+    for filepath in filepaths:
+        try:
+            metrics[filepath] = FileUnit(filepath, sources[filepath]).metrics()
+        except Exception as e:
+            metrics[filepath] = {"error": str(e)}
+    return metrics
@@ -0,0 +1,190 @@
+import os
+import numpy as np
+
+NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+KMEANS_ITERS = 20
+MAX_TRAIN_SAMPLE = 100000
+ASSIGN_BATCH = 8192
+RETRAIN_FACTOR = 4
+FINGERPRINT_KEYS = ("rows", "dim", "first_sha", "last_sha")
+
+
+def normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def default_nlist(n):
+    return max(1, int(4 * np.sqrt(n)))
+
+
+class IVFIndex:
+    """
+    Inverterat filindex (IVF) för cosinussökning: sfärisk k-means delar in
+    vektorerna i nlist listor och en sökning läser bara de nprobe närmaste
+    listorna. nprobe styr avvägningen mellan recall och latens.
+    Indexet lagrar bara centroider och listtillhörighet per rad; själva
+    vektorerna läses ur den normaliserade matrisen som skickas in.
+    fingerprint beskriver storen indexet byggdes mot, se store_fingerprint.
+    """
+
+    def __init__(self, centroids, assignments=None, trained_on=0, fingerprint=None):
+        self.centroids = normalize(centroids)
+        self.assignments = np.asarray(assignments if assignments is not None else [], dtype=np.int32)
+        self.trained_on = trained_on or len(self.assignments)
+        self.fingerprint = fingerprint
+        self._lists = None
+
+    @classmethod
+    def train(cls, matrix, nlist=None, iters=KMEANS_ITERS, seed=0, normalized=False):
+        """
+        Tränar på ett stickprov och fördelar sedan alla rader blockvis, så att
+        en memmap aldrig läses in i sin helhet. Med normalized=True används
+        raderna som de är.
+        """
+        n = matrix.shape[0]
+        nlist = min(n, nlist or default_nlist(n))
+        rng = np.random.default_rng(seed)
+        # Sorterade radnummer läser memmapen framåt i stället för hoppvis
+        sample = np.asarray(matrix[np.sort(rng.choice(n, size=min(n, MAX_TRAIN_SAMPLE), replace=False))],
+                            dtype=np.float32)
+        if not normalized:
+            sample = normalize(sample)
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            labels = _nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # Tomma listor får en slumpvis ny startpunkt
+            sums[empty] = sample[rng.choice(sample.shape[0], size=int(empty.sum()))]
+            centroids = normalize(sums)
+        index = cls(centroids)
+        index.add(matrix)
+        index.trained_on = n
+        return index
+
+    def __len__(self):
+        return len(self.assignments)
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    def add(self, vectors):
+        """
+        Lägger till rader i slutet; radnumren fortsätter från len(self).
+        Raderna behöver inte vara normaliserade: närmaste centroid beror inte
+        på radens längd, så de fördelas blockvis utan kopia.
+        """
+        vectors = np.asarray(vectors)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        self.assignments = np.concatenate([self.assignments, _nearest(vectors, self.centroids)])
+        self._lists = None
+
+    def needs_retrain(self):
+        return len(self) > RETRAIN_FACTOR * max(1, self.trained_on)
+
+    def lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            bounds = np.searchsorted(self.assignments[order], np.arange(self.nlist + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+        return self._lists
+
+    def search_batch(self, matrix, queries, top_k=3, nprobe=NPROBE):
+        """Returnerar [(radindex, poäng)]-listor; matrix ska vara radnormaliserad."""
+        queries = normalize(queries)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = queries @ self.centroids.T
+        probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        lists = self.lists()
+        results = []
+        for query, probe in zip(queries, probes):
+            candidates = np.concatenate([lists[p] for p in probe])
+            if candidates.size == 0:
+                results.append([])
+                continue
+            scores = np.asarray(matrix[candidates]) @ query
+            k = min(top_k, candidates.size)
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            results.append([(int(candidates[i]), float(scores[i])) for i in best])
+        return results
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        fingerprint = self.fingerprint or {}
+        np.savez(tmp_path, centroids=self.centroids, assignments=self.assignments,
+                 trained_on=np.array(self.trained_on),
+                 **{f"store_{key}": np.array(value) for key, value in fingerprint.items()})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            fingerprint = None
+            # Äldre index saknar fingeravtryck och byggs därför om
+            if all(f"store_{key}" in data.files for key in FINGERPRINT_KEYS):
+                fingerprint = {key: data[f"store_{key}"].item() for key in FINGERPRINT_KEYS}
+            return cls(data["centroids"], data["assignments"], int(data["trained_on"]), fingerprint)
+
+
+def _nearest(vectors, centroids):
+    labels = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], ASSIGN_BATCH):
+        block = np.asarray(vectors[start:start + ASSIGN_BATCH], dtype=np.float32)
+        labels[start:start + ASSIGN_BATCH] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def index_path(store):
+    return f"{store.path}.ivf.npz"
+
+
+def store_fingerprint(store, rows=None):
+    """Antal rader samt första och sista sha bland storens första rows rader."""
+    rows = len(store) if rows is None else rows
+    shas = store.shas[:rows]
+    return {"rows": rows, "dim": store.dim or 0,
+            "first_sha": shas[0] if shas else "", "last_sha": shas[-1] if shas else ""}
+
+
+def matches_store(index, store):
+    # Storen växer bara i slutet, så indexets rader ska vara storens första rader
+    return (index.fingerprint is not None and len(index) <= len(store)
+            and index.dim == store.dim
+            and index.fingerprint == store_fingerprint(store, len(index)))
+
+
+def load_or_build_index(store, matrix, normalized=True):
+    """
+    Läser indexet bredvid storen, lägger till rader som tillkommit sedan sist
+    och tränar om när storen vuxit mycket sedan träningen eller när indexet
+    byggts mot en annan store (annan dimension eller andra rader).
+    matrix är storens radnormaliserade matris, t.ex. SearchEngine.matrix.
+    """
+    path = index_path(store)
+    index = IVFIndex.load(path) if os.path.exists(path) else None
+    if index is not None and not matches_store(index, store):
+        print(f"IVF-indexet {path} hör inte till storen; tränar om.")
+        index = None
+    if index is None or index.needs_retrain():
+        index = IVFIndex.train(matrix, normalized=normalized)
+    elif len(index) < len(store):
+        index.add(matrix[len(index):])
+    else:
+        return index
+    index.fingerprint = store_fingerprint(store)
+    index.save(path)
+    return index
@@ -0,0 +1,203 @@
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+MAX_INPUT_TOKENS = 8000
+MAX_BATCH_TOKENS = 250000
+MAX_BATCH_SIZE = 2048
+CHARS_PER_TOKEN = 3
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def estimate_tokens(text):
+    # Grov uppskattning utan tokenizer; kod ger fler tokens per tecken än prosa
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_text(text, max_tokens=MAX_INPUT_TOKENS):
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+def make_batches(texts, max_batch_tokens=MAX_BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE):
+    """Packar (index, text) i batcher som håller sig under token- och storleksgränsen."""
+    batches = []
+    current, current_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > max_batch_tokens or len(current) >= max_batch_size):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((i, text))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class AdaptiveLimiter:
+    """AIMD-begränsning: halvera samtidigheten vid 429, öka med ett efter en rad lyckade anrop."""
+
+    def __init__(self, initial, minimum=1, maximum=16, increase_after=4):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase_after = increase_after
+        self.active = 0
+        self.successes = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit:
+                self.cond.wait()
+            self.active += 1
+
+    def release(self, rate_limited=False):
+        with self.cond:
+            self.active -= 1
+            if rate_limited:
+                self.limit = max(self.minimum, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.increase_after and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+            self.cond.notify_all()
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class BatchEmbedder:
+    def __init__(self, client, model=EMBEDDING_MODEL, max_batch_tokens=MAX_BATCH_TOKENS,
+                 max_batch_size=MAX_BATCH_SIZE, concurrency=4, max_concurrency=16,
+                 max_retries=6, base_delay=1.0, max_delay=60.0):
+        self.client = client
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = AdaptiveLimiter(concurrency, maximum=max_concurrency)
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"requests": 0, "texts": 0, "tokens": 0, "retries": 0,
+                      "rate_limited": 0, "elapsed": 0.0, "latencies": []}
+
+    def _embed_batch(self, batch):
+        inputs = [text for _, text in batch]
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.client.embeddings.create(input=inputs, model=self.model)
+            except Exception as e:
+                status = getattr(e, "status_code", None)
+                self.limiter.release(rate_limited=status == 429)
+                if status not in RETRY_STATUS or attempt == self.max_retries:
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+                with self.stats_lock:
+                    self.stats["retries"] += 1
+                    if status == 429:
+                        self.stats["rate_limited"] += 1
+                time.sleep(delay)
+                continue
+            latency = time.perf_counter() - start
+            self.limiter.release()
+            with self.stats_lock:
+                self.stats["requests"] += 1
+                self.stats["texts"] += len(inputs)
+                self.stats["tokens"] += sum(estimate_tokens(t) for t in inputs)
+                self.stats["latencies"].append(latency)
+            data = sorted(response.data, key=lambda d: d.index)
+            return [(i, d.embedding) for (i, _), d in zip(batch, data)]
+
+    def embed(self, texts):
+        """Returnerar en embedding per text, i samma ordning som texts."""
+        texts = [truncate_text(t) or " " for t in texts]
+        if not texts:
+            return []
+        batches = make_batches(texts, self.max_batch_tokens, self.max_batch_size)
+        results = [None] * len(texts)
+        start = time.perf_counter()
+        workers = min(self.max_concurrency, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for batch_result in pool.map(self._embed_batch, batches):
+                for i, emb in batch_result:
+                    results[i] = emb
+        with self.stats_lock:
+            self.stats["elapsed"] += time.perf_counter() - start
+        return results
+
+    def report(self):
+        with self.stats_lock:
+            latencies = sorted(self.stats["latencies"])
+            elapsed = self.stats["elapsed"]
+
+            def percentile(p):
+                if not latencies:
+                    return 0.0
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+            return {
+                "requests": self.stats["requests"],
+                "texts": self.stats["texts"],
+                "tokens": self.stats["tokens"],
+                "retries": self.stats["retries"],
+                "rate_limited": self.stats["rate_limited"],
+                "elapsed_s": elapsed,
+                "texts_per_s": self.stats["texts"] / elapsed if elapsed else 0.0,
+                "tokens_per_s": self.stats["tokens"] / elapsed if elapsed else 0.0,
+                "latency_p50_s": percentile(0.5),
+                "latency_p95_s": percentile(0.95),
+                "concurrency": self.limiter.limit,
+            }
+
+
+def print_report(report):
+    print(f"{report['texts']} texter i {report['requests']} anrop på {report['elapsed_s']:.2f} s "
+          f"({report['texts_per_s']:.1f} texter/s, {report['tokens_per_s']:.0f} tokens/s)")
+    print(f"Latens p50 {report['latency_p50_s'] * 1000:.0f} ms, p95 {report['latency_p95_s'] * 1000:.0f} ms; "
+          f"{report['retries']} omförsök ({report['rate_limited']} st 429), slutlig samtidighet {report['concurrency']}")
+
+
+def main():
+    from fake_embeddings import FakeEmbeddingClient
+
+    parser = argparse.ArgumentParser(description="Kör BatchEmbedder offline mot en fejkad embeddings-klient")
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--capacity", type=int, default=4, help="Samtidiga anrop innan fejkservern svarar 429")
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    client = FakeEmbeddingClient(latency=args.latency, capacity=args.capacity)
+    texts = [f"Commit {i}: ändrade modul {i % 17}\n" + "x = 1\n" * (i % 50) for i in range(args.texts)]
+    embedder = BatchEmbedder(client, max_batch_size=args.batch_size, concurrency=args.concurrency,
+                             base_delay=0.05)
+    embeddings = embedder.embed(texts)
+    assert len(embeddings) == len(texts)
+    print_report(embedder.report())
+
+
+if __name__ == "__main__":
+    main()
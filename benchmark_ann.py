@@ -0,0 +1,70 @@
+import argparse
+import time
+import numpy as np
+
+from ann_index import IVFIndex, normalize
+
+
+def synthetic_data(n, dim, clusters, queries, seed=0):
+    # Klustrad data liknar riktiga embeddings bättre än helt slumpmässiga vektorer
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    matrix = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    query_labels = rng.integers(0, clusters, size=queries)
+    query_vecs = centers[query_labels] + 0.6 * rng.standard_normal((queries, dim)).astype(np.float32)
+    return normalize(matrix), normalize(query_vecs)
+
+
+def exact_search(matrix, queries, top_k):
+    scores = queries @ matrix.T
+    idx = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    return [set(row) for row in idx]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mät recall@k och QPS för IVF-indexet mot exakt sökning")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    matrix, queries = synthetic_data(args.vectors, args.dim, args.clusters, args.queries)
+
+    start = time.perf_counter()
+    index = IVFIndex.train(matrix, nlist=args.nlist, normalized=True)
+    train_time = time.perf_counter() - start
+
+    # Inkrementella inserts: lägg till en extra tiondel utan omträning
+    extra, _ = synthetic_data(args.vectors // 10, args.dim, args.clusters, 1, seed=1)
+    start = time.perf_counter()
+    index.add(extra)
+    add_time = time.perf_counter() - start
+    matrix = np.vstack([matrix, extra])
+
+    # Exakt sökning mäts på samma matris som IVF-indexet frågas mot
+    start = time.perf_counter()
+    truth = exact_search(matrix, queries, args.top_k)
+    exact_time = time.perf_counter() - start
+
+    print(f"{len(matrix)} vektorer x {args.dim} dim, {args.queries} frågor, top-{args.top_k}, nlist={index.nlist}")
+    print(f"Träning: {train_time:.2f} s, insert av {len(extra)} vektorer: {add_time * 1000:.0f} ms")
+    print(f"Exakt (batch-matmul): {args.queries / exact_time:10.0f} QPS")
+    print(f"{'nprobe':>6} {'recall@k':>9} {'QPS':>10}")
+    for nprobe in args.nprobe:
+        start = time.perf_counter()
+        results = index.search_batch(matrix, queries, args.top_k, nprobe=nprobe)
+        elapsed = time.perf_counter() - start
+        recall = np.mean([
+            len(truth_set & {i for i, _ in row}) / args.top_k
+            for truth_set, row in zip(truth, results)
+        ])
+        print(f"{nprobe:>6} {recall:>9.3f} {args.queries / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import ast
+import time
+import random
+import argparse
+
+from rule_engine import RULES, check_source
+from file_unit import split_lines
+
+TEMPLATES = [
+    "def {name}(items=[], options={{}}):\n    print(items)\n    for item in items:\n        if item == None:\n            continue\n        options[item] = True\n    return options\n",
+    "def {name}(path):\n    try:\n        with open(path) as f:\n            return f.read()\n    except:\n        return f\"saknas\"\n",
+    "class {cls}:\n    def __init__(self, value):\n        self.value = value\n\n    def {name}(self, other):\n        if self.value is \"x\" or other != None:\n            print(\"jämför\", other)\n        return self.value\n",
+    "def {name}(a, b):\n    total = 0\n    for i in range(a):\n        total += i * b\n    return total\n",
+]
+
+
+def synthetic_repo(files, functions, seed=0):
+    rng = random.Random(seed)
+    sources = []
+    for i in range(files):
+        parts = ['"""Syntetisk modul."""\nimport os\n\n']
+        for j in range(functions):
+            parts.append(rng.choice(TEMPLATES).format(name=f"func_{i}_{j}", cls=f"Klass{i}_{j}") + "\n\n")
+        sources.append((f"pkg/module_{i}.py", "".join(parts)))
+    return sources
+
+
+def multi_pass(source, path):
+    # Jämförelse: en egen ast.walk per regel, så som separata verktyg gör
+    tree = ast.parse(source)
+    ctx = {"path": path, "source": source, "lines": split_lines(source), "needs_logging": False}
+    findings = []
+    for node_type, funcs in RULES.items():
+        for func in funcs:
+            for node in ast.walk(tree):
+                if type(node) is node_type:
+                    result = func(node, ctx)
+                    if isinstance(result, list):
+                        findings.extend(result)
+                    elif result:
+                        findings.append(result)
+    return findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mät regelmotorns genomströmning på ett syntetiskt repo")
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--functions", type=int, default=40)
+    args = parser.parse_args()
+
+    sources = synthetic_repo(args.files, args.functions)
+    lines = sum(source.count("\n") for _, source in sources)
+    rule_count = sum(len(funcs) for funcs in RULES.values())
+    print(f"{len(sources)} filer, {lines} rader, {rule_count} registrerade regler")
+
+    start = time.perf_counter()
+    trees = [(path, source, ast.parse(source)) for path, source in sources]
+    parse_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    findings = nodes = checks = 0
+    for path, source, tree in trees:
+        report = check_source(source, path, tree)
+        findings += len(report["findings"])
+        nodes += report["nodes"]
+        checks += report["checks"]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    multi_findings = sum(len(multi_pass(source, path)) for path, source in sources)
+    multi_time = time.perf_counter() - start
+
+    print(f"Parsning: {parse_time:.2f} s ({lines / parse_time:,.0f} rader/s)")
+    print(f"En genomgång: {single_time:.2f} s, {nodes / single_time:,.0f} noder/s, "
+          f"{checks / single_time:,.0f} regelanrop/s, {findings} fynd ({findings / single_time:,.0f} fynd/s), "
+          f"{len(sources) / single_time:,.0f} filer/s")
+    print(f"En walk per regel (inkl. parsning): {multi_time:.2f} s, {multi_findings} fynd, "
+          f"{multi_time / (single_time + parse_time):.1f}x långsammare")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import time
+import numpy as np
+
+from search_cache import cosine_similarity
+from search_engine import SearchEngine
+
+
+def loop_search(cache, query_emb, top_k):
+    scores = [(sha, cosine_similarity(query_emb, emb)) for sha, emb in cache.items()]
+    scores.sort(key=lambda x: x[1], reverse=True)
+    return scores[:top_k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jämför loop-sökning mot SearchEngine")
+    parser.add_argument("--commits", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((args.commits, args.dim)).astype(np.float32)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    shas = [f"{i:07x}" for i in range(args.commits)]
+    cache = {sha: row.tolist() for sha, row in zip(shas, matrix)}
+    query_lists = [q.tolist() for q in queries]
+
+    start = time.perf_counter()
+    loop_results = [loop_search(cache, q, args.top_k) for q in query_lists]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine = SearchEngine(shas, matrix)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single_results = [engine.search(q, args.top_k) for q in queries]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_results = engine.search_batch(queries, args.top_k)
+    batch_time = time.perf_counter() - start
+
+    agree = all(
+        [sha for sha, _ in a] == [sha for sha, _ in b] == [sha for sha, _ in c]
+        for a, b, c in zip(loop_results, single_results, batch_results)
+    )
+
+    print(f"{args.commits} commits x {args.dim} dim, {args.queries} frågor, top-{args.top_k}")
+    print(f"Python-loop:       {loop_time / args.queries * 1000:9.2f} ms/fråga")
+    print(f"Engine (bygge):    {build_time * 1000:9.2f} ms totalt")
+    print(f"Engine (en åt g.): {single_time / args.queries * 1000:9.2f} ms/fråga")
+    print(f"Engine (batch):    {batch_time / args.queries * 1000:9.2f} ms/fråga")
+    print(f"Speedup (batch):   {loop_time / max(batch_time, 1e-9):9.1f}x")
+    print(f"Samma topplista:   {'ja' if agree else 'NEJ'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,57 @@
 import os
-import json
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import subprocess
+from itertools import islice
+from clients import get_openai_client
+from vector_store import EmbeddingStore, STORE_PATH, migrate_json
+from extract_commits import iter_commit_texts
+from batch_embedder import BatchEmbedder, print_report
 
 CACHE_FILE = "embedding_cache.json"
+APPEND_BATCH = 1000
+
+def is_ancestor(sha):
+    result = subprocess.run(["git", "merge-base", "--is-ancestor", sha, "HEAD"], capture_output=True)
+    return result.returncode == 0
 
-def get_embedding(text, model="text-embedding-3-small"):
-    response = client.embeddings.create(input=text, model=model)
-    return response.data[0].embedding
+def open_store():
+    store = EmbeddingStore(STORE_PATH)
+    if not store.exists() and os.path.exists(CACHE_FILE):
+        print(f"Migrerar {CACHE_FILE} till {STORE_PATH}...")
+        migrate_json(CACHE_FILE, store)
+    if not store.normalized:
+        print(f"Normaliserar {STORE_PATH} så att sökningen kan läsa den utan kopia...")
+        store.normalize()
+    return store
 
 def build_embedding_cache():
-    # Exempel: Läs commits eller textbitar från fil eller repo-historik
-    commits = [
-        {"sha": "0287623", "message": "Fixade bugg i funktion X"},
-        {"sha": "a3f8d1e", "message": "La till ny feature Y"},
-        {"sha": "9b7f3cd", "message": "Refaktorering av modul Z"},
-    ]
-
-    cache = {}
-    for commit in commits:
-        print(f"Embedding commit {commit['sha']}...")
-        emb = get_embedding(commit["message"])
-        cache[commit["sha"]] = emb
-
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f)
-    print(f"Cache byggd och sparad i {CACHE_FILE}")
+    store = open_store()
+
+    # Embedda bara commits efter den senast indexerade; om historiken har
+    # skrivits om (t.ex. rebase) går vi igenom allt och hoppar över kända shas.
+    since = store.last_sha
+    if since and not is_ancestor(since):
+        print(f"Senast indexerade commit {since} finns inte i HEAD, läser hela historiken.")
+        since = None
+    commits = ((sha, text) for sha, text in iter_commit_texts(since) if sha not in store)
+
+    # Läs historiken strömmande och skriv i omgångar så att ett avbrott inte kastar allt arbete
+    embedder = BatchEmbedder(get_openai_client())
+    added = 0
+    while True:
+        chunk = list(islice(commits, APPEND_BATCH))
+        if not chunk:
+            break
+        print(f"Embeddar commits {added + 1}-{added + len(chunk)}...")
+        embeddings = embedder.embed([text for _, text in chunk])
+        store.append([sha for sha, _ in chunk], embeddings)
+        added += len(chunk)
+
+    if not added:
+        print(f"Inga nya commits, {STORE_PATH} är uppdaterad ({len(store)} commits).")
+        return 0
+    print_report(embedder.report())
+    print(f"La till {added} commits, {STORE_PATH} innehåller nu {len(store)} commits.")
+    return added
 
 if __name__ == "__main__":
     build_embedding_cache()
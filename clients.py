@@ -0,0 +1,69 @@
+import os
+import atexit
+import threading
+
+# Delade klienter som skapas först när de behövs. Att importera en modul ska
+# inte läsa .env, ladda openai eller öppna anslutningar.
+_lock = threading.Lock()
+_config_loaded = False
+_openai_client = None
+_github_client = None
+
+
+def load_config():
+    """Läser .env en gång per process; senare anrop gör ingenting."""
+    global _config_loaded
+    if _config_loaded:
+        return
+    with _lock:
+        if not _config_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _config_loaded = True
+
+
+def get_setting(name, default=None):
+    load_config()
+    return os.getenv(name, default)
+
+
+def get_openai_client():
+    """
+    En OpenAI-klient för hela processen. Klienten har en egen pool av
+    keep-alive-anslutningar, så alla moduler och trådar som delar den
+    återanvänder samma anslutningar i stället för att öppna egna.
+    """
+    global _openai_client
+    if _openai_client is None:
+        load_config()
+        with _lock:
+            if _openai_client is None:
+                from openai import OpenAI
+                _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _openai_client
+
+
+def get_github_client():
+    """
+    Den delade GitHub-klienten (en session med anslutningspool och ETag-cache).
+    Klienten stängs när processen avslutas, vilket skriver ETag-cachen.
+    """
+    global _github_client
+    if _github_client is None:
+        load_config()
+        with _lock:
+            if _github_client is None:
+                from github_client import GitHubClient
+                _github_client = GitHubClient(os.getenv("GITHUB_TOKEN"))
+                atexit.register(_github_client.close)
+    return _github_client
+
+
+def set_clients(openai_client=None, github_client=None):
+    """Ersätter de delade klienterna, t.ex. med fejkade klienter vid offline-körning."""
+    global _openai_client, _github_client
+    with _lock:
+        if openai_client is not None:
+            _openai_client = openai_client
+        if github_client is not None:
+            _github_client = github_client
@@ -0,0 +1,101 @@
+import os
+import argparse
+from analyzer import get_python_files
+from analysis_cache import content_hash
+from clients import get_openai_client
+from batch_embedder import BatchEmbedder, print_report
+from embedding_cache import create_db, save_code_chunks, delete_code_chunks, load_code_chunks
+from review_engine import definition_chunks
+from file_unit import get_unit
+
+CODE_DB = "embedding_cache.db"
+# Mindre än granskningsbitarna så att en träff pekar ut en enskild funktion eller klass
+CHUNK_TOKENS = 800
+
+
+def chunk_file(path, code, max_tokens=CHUNK_TOKENS):
+    """
+    En bit per toppnivåfunktion och klass (bara för stora delas), så att en
+    träff pekar ut en enskild definition även i små filer. Hashen räknas på
+    filnamn och text men inte radnummer, så en funktion som bara flyttats
+    nedåt i filen behöver inte embeddas om.
+    """
+    chunks = []
+    for chunk in definition_chunks(code, max_tokens):
+        if not chunk["text"].strip():
+            continue
+        embed_text = f"# {path} ({chunk['label']})\n{chunk['text']}"
+        chunks.append(dict(chunk, path=path, embed_text=embed_text, hash=content_hash(embed_text)))
+    return chunks
+
+
+def index_repo(repo_path=".", db_path=None, client=None):
+    """
+    Indexerar alla Python-filer i repo_path och embeddar bara nya eller ändrade
+    bitar. Databasen hamnar som standard i repots rot, där retrieval letar.
+    """
+    conn = create_db(db_path or os.path.join(repo_path, CODE_DB))
+    known = {}
+    stored = {}
+    for row in load_code_chunks(conn):
+        known[row["hash"]] = row["embedding"]
+        stored.setdefault(row["path"], []).append((row["start"], row["end"], row["hash"]))
+
+    files = {}
+    for filepath in sorted(get_python_files(repo_path)):
+        path = os.path.relpath(filepath, repo_path)
+        try:
+            files[path] = chunk_file(path, get_unit(filepath).source)
+        except (UnicodeDecodeError, OSError) as e:
+            print(f"⚠️ Hoppar över {path}: {e}")
+
+    missing = {}
+    for chunks in files.values():
+        for chunk in chunks:
+            if chunk["hash"] not in known:
+                missing.setdefault(chunk["hash"], chunk["embed_text"])
+
+    report = None
+    if missing:
+        if client is None:
+            client = get_openai_client()
+        embedder = BatchEmbedder(client)
+        known.update(zip(missing.keys(), embedder.embed(list(missing.values()))))
+        report = embedder.report()
+
+    changed = 0
+    for path, chunks in files.items():
+        if [(ch["start"], ch["end"], ch["hash"]) for ch in chunks] == stored.get(path):
+            continue
+        for chunk in chunks:
+            chunk["embedding"] = known[chunk["hash"]]
+        save_code_chunks(conn, path, chunks)
+        changed += 1
+    removed = [path for path in stored if path not in files]
+    delete_code_chunks(conn, removed)
+    conn.close()
+
+    total = sum(len(chunks) for chunks in files.values())
+    print(f"✅ {len(files)} filer, {total} kodbitar: {len(missing)} embeddade, "
+          f"{total - len(missing)} återanvända, {changed} filer uppdaterade, {len(removed)} borttagna.")
+    if report:
+        print_report(report)
+    return {"files": len(files), "chunks": total, "embedded": len(missing),
+            "updated_files": changed, "removed_files": len(removed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedda funktioner och klasser i ett repo")
+    parser.add_argument("repo_path", nargs="?", default=".")
+    parser.add_argument("--db", default=None, help=f"Standard: {CODE_DB} i repots rot")
+    parser.add_argument("--fake", action="store_true", help="Använd fejkade embeddings (offline)")
+    args = parser.parse_args()
+    client = None
+    if args.fake:
+        from fake_embeddings import FakeEmbeddingClient
+        client = FakeEmbeddingClient()
+    index_repo(args.repo_path, args.db, client)
+
+
+if __name__ == "__main__":
+    main()
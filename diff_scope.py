@@ -0,0 +1,138 @@
+import re
+import ast
+import subprocess
+from file_unit import split_lines
+
+HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+CONTEXT_LINES = 3
+
+
+def parse_hunks(patch):
+    """Returnerar [(old_start, old_len, new_start, new_len, rader)] för en fils patch."""
+    hunks = []
+    for line in (patch or "").split("\n"):
+        m = HUNK_RE.match(line)
+        if m:
+            old_start, old_len, new_start, new_len = m.groups()
+            hunks.append([
+                int(old_start), int(old_len) if old_len is not None else 1,
+                int(new_start), int(new_len) if new_len is not None else 1,
+                [],
+            ])
+        elif hunks and line[:1] in ("+", "-", " ", "\\"):
+            hunks[-1][4].append(line)
+    return [tuple(h) for h in hunks]
+
+
+def iter_added_lines(patch):
+    """Ger (radnummer i nya filen, radens text) för varje tillagd rad i patchen."""
+    for _, _, new_start, _, body in parse_hunks(patch):
+        new_line = new_start
+        for line in body:
+            if line.startswith("+"):
+                yield new_line, line[1:]
+                new_line += 1
+            elif line.startswith(" "):
+                new_line += 1
+
+
+def changed_lines(patch):
+    """Radnummer i den nya filen som lagts till eller ändrats av patchen."""
+    lines = {line for line, _ in iter_added_lines(patch)}
+    for _, _, new_start, new_len, _ in parse_hunks(patch):
+        if new_len == 0:
+            # Ren borttagning: markera raden där koden försvann
+            lines.add(max(1, new_start))
+    return lines
+
+
+def split_git_diff(diff_text):
+    """Delar upp `git diff`-output i {sökväg i nya versionen: patch}."""
+    patches = {}
+    path, current = None, []
+    for line in diff_text.split("\n"):
+        if line.startswith("diff --git "):
+            if path is not None:
+                patches[path] = "\n".join(current)
+            path, current = None, []
+        elif line.startswith("+++ ") and not current:
+            target = line[4:].strip()
+            path = None if target == "/dev/null" else target[2:] if target.startswith("b/") else target
+        elif line.startswith("@@") or (current and line[:1] in ("+", "-", " ", "\\")):
+            current.append(line)
+    if path is not None:
+        patches[path] = "\n".join(current)
+    return patches
+
+
+def get_git_changed_lines(repo_path, base, head="HEAD", suffix=".py"):
+    result = subprocess.run(
+        ["git", "diff", "--unified=0", "--no-color", f"{base}...{head}"],
+        cwd=repo_path, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git diff misslyckades: {result.stderr.strip()}")
+    return {
+        path: changed_lines(patch)
+        for path, patch in split_git_diff(result.stdout).items()
+        if path.endswith(suffix)
+    }
+
+
+def get_pr_changed_lines(files, suffix=".py"):
+    # files är listan från GitHubs /pulls/{n}/files
+    return {
+        f["filename"]: changed_lines(f.get("patch"))
+        for f in files
+        if f["filename"].endswith(suffix) and f.get("status") != "removed"
+    }
+
+
+def _definition_spans(tree):
+    spans = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            spans.append((start, node.end_lineno, isinstance(node, ast.ClassDef)))
+    return spans
+
+
+def scoped_regions(code, lines, context=CONTEXT_LINES):
+    """
+    Hela funktioner som innehåller ändrade rader plus context rader runtom.
+    Ändringar utanför funktioner ger bara raden med kontext. Returnerar
+    sorterade, sammanslagna (start, slut)-intervall, 1-indexerade och inklusiva.
+    """
+    total = len(split_lines(code))
+    if not lines or not total:
+        return []
+    try:
+        spans = _definition_spans(ast.parse(code))
+    except SyntaxError:
+        spans = []
+
+    regions = []
+    for line in sorted(lines):
+        # Innersta funktionen som omsluter raden; klasser bara om ingen metod gör det
+        enclosing = [(s, e) for s, e, is_class in spans if s <= line <= e and not is_class]
+        if enclosing:
+            start, end = max(enclosing)
+        else:
+            start, end = line, line
+        regions.append((max(1, start - context), min(total, end + context)))
+
+    merged = []
+    for start, end in sorted(regions):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def render_scoped_source(code, regions):
+    lines = split_lines(code)
+    parts = []
+    for start, end in regions:
+        parts.append(f"# Rader {start}-{end}\n" + "\n".join(lines[start - 1:end]))
+    return "\n\n".join(parts)
@@ -1,30 +1,129 @@
 import sqlite3
 import json
+import numpy as np
+
+# Version 1: embeddings som float32-BLOB i stället för JSON-text
+SCHEMA_VERSION = 1
+BATCH_SIZE = 1000
 
 def create_db(db_path="embedding_cache.db"):
     conn = sqlite3.connect(db_path)
+    # WAL låter läsare (sökning, retrieval) köra medan indexeraren skriver
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
     c = conn.cursor()
     c.execute('''
         CREATE TABLE IF NOT EXISTS commit_embeddings (
             commit_hash TEXT PRIMARY KEY,
             text TEXT,
-            embedding TEXT
+            embedding BLOB
         )
     ''')
     conn.commit()
+    create_code_table(conn)
+    migrate_schema(conn)
     return conn
 
+def to_blob(embedding):
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+def from_blob(blob):
+    return np.frombuffer(blob, dtype=np.float32)
+
+def _convert_column(conn, table, key_columns):
+    # Gamla rader har embedding som JSON-text; skriv om dem batchvis till BLOB
+    keys = ", ".join(key_columns)
+    where = " AND ".join(f"{k} = ?" for k in key_columns)
+    read = conn.cursor()
+    read.execute(f"SELECT {keys}, embedding FROM {table} WHERE typeof(embedding) = 'text'")
+    converted = 0
+    while True:
+        rows = read.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        conn.executemany(
+            f"UPDATE {table} SET embedding = ? WHERE {where}",
+            [(to_blob(json.loads(row[-1])),) + tuple(row[:-1]) for row in rows],
+        )
+        converted += len(rows)
+    return converted
+
+def migrate_schema(conn):
+    """Uppgraderar en befintlig databas till SCHEMA_VERSION i en transaktion."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return 0
+    with conn:
+        converted = _convert_column(conn, "commit_embeddings", ["commit_hash"])
+        converted += _convert_column(conn, "code_chunks", ["path", "start_line"])
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    if converted:
+        print(f"Migrerade {converted} embeddings från JSON till float32-BLOB.")
+    return converted
+
 def save_embedding(conn, commit_hash, text, embedding):
+    save_embeddings(conn, [(commit_hash, text, embedding)])
+
+def save_embeddings(conn, rows):
+    # Alla rader i en transaktion med executemany i stället för en commit per rad
+    with conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO commit_embeddings (commit_hash, text, embedding)
+            VALUES (?, ?, ?)
+        ''', ((commit_hash, text, to_blob(embedding)) for commit_hash, text, embedding in rows))
+
+def iter_embedding_batches(conn, batch_size=BATCH_SIZE):
+    """Ger (commit_hashes, texter, matris) batchvis utan att läsa in hela tabellen."""
     c = conn.cursor()
-    embedding_json = json.dumps(embedding)
-    c.execute('''
-        INSERT OR REPLACE INTO commit_embeddings (commit_hash, text, embedding)
-        VALUES (?, ?, ?)
-    ''', (commit_hash, text, embedding_json))
-    conn.commit()
+    c.execute("SELECT commit_hash, text, embedding FROM commit_embeddings ORDER BY rowid")
+    while True:
+        rows = c.fetchmany(batch_size)
+        if not rows:
+            break
+        yield [h for h, _, _ in rows], [t for _, t, _ in rows], np.stack([from_blob(e) for _, _, e in rows])
+
+def iter_embeddings(conn, batch_size=BATCH_SIZE):
+    for hashes, texts, matrix in iter_embedding_batches(conn, batch_size):
+        yield from zip(hashes, texts, matrix)
 
 def load_all_embeddings(conn):
+    return list(iter_embeddings(conn))
+
+def create_code_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS code_chunks (
+            path TEXT,
+            start_line INTEGER,
+            end_line INTEGER,
+            label TEXT,
+            content_hash TEXT,
+            text TEXT,
+            embedding BLOB,
+            PRIMARY KEY (path, start_line)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_code_chunks_hash ON code_chunks (content_hash)")
+    conn.commit()
+
+def save_code_chunks(conn, path, chunks):
+    # Ersätter alla bitar för filen i en transaktion
+    with conn:
+        conn.execute("DELETE FROM code_chunks WHERE path = ?", (path,))
+        conn.executemany('''
+            INSERT INTO code_chunks (path, start_line, end_line, label, content_hash, text, embedding)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(path, ch["start"], ch["end"], ch["label"], ch["hash"], ch["text"], to_blob(ch["embedding"]))
+              for ch in chunks])
+
+def delete_code_chunks(conn, paths):
+    with conn:
+        conn.executemany("DELETE FROM code_chunks WHERE path = ?", [(p,) for p in paths])
+
+def load_code_chunks(conn):
     c = conn.cursor()
-    c.execute("SELECT commit_hash, text, embedding FROM commit_embeddings")
-    rows = c.fetchall()
-    return [(h, t, json.loads(e)) for h, t, e in rows]
+    c.execute("SELECT path, start_line, end_line, label, content_hash, text, embedding FROM code_chunks "
+              "ORDER BY path, start_line")
+    return [
+        {"path": p, "start": s, "end": e, "label": l, "hash": h, "text": t, "embedding": from_blob(emb)}
+        for p, s, e, l, h, t, emb in c.fetchall()
+    ]
@@ -1,26 +1,80 @@
+import tempfile
 import subprocess
 
-def get_git_commits():
-    result = subprocess.run(["git", "rev-list", "--reverse", "HEAD"], capture_output=True, text=True)
-    return result.stdout.strip().split('\n')
-
-def get_commit_message(commit_hash):
-    result = subprocess.run(["git", "log", "-1", "--pretty=%B", commit_hash], capture_output=True, text=True)
-    return result.stdout.strip()
-
-def get_commit_diff(commit_hash):
-    result = subprocess.run(["git", "show", commit_hash, "--unified=0", "--pretty=format:"], capture_output=True, text=True)
-    return result.stdout.strip()
-
-def extract_commit_texts():
-    commits = get_git_commits()
-    commit_texts = []
-    for c in commits:
-        msg = get_commit_message(c)
-        diff = get_commit_diff(c)
-        combined_text = f"Commit message:\n{msg}\n\nDiff:\n{diff}"
-        commit_texts.append((c, combined_text))
-    return commit_texts
+MAX_DIFF_CHARS = 20000
+RECORD_SEP = "\x1e"
+FIELD_SEP = "\x1f"
+
+def format_commit_text(msg, diff):
+    return f"Commit message:\n{msg}\n\nDiff:\n{diff}"
+
+def iter_commit_texts(since=None, rev_range=None, max_diff_chars=MAX_DIFF_CHARS, repo_path=None):
+    """
+    Läser meddelanden och diffar ur en enda `git log -p`-pipe och ger (sha, text)
+    en commit i taget. Diffar kapas efter max_diff_chars tecken.
+    """
+    if rev_range is None:
+        rev_range = f"{since}..HEAD" if since else "HEAD"
+    cmd = [
+        "git", "log", "--reverse", "-p", "--cc", "--unified=0", "--no-color",
+        f"--format={RECORD_SEP}%H{FIELD_SEP}%B{FIELD_SEP}", rev_range,
+    ]
+    # stderr till en temporärfil: en full stderr-pipe som läses först i slutet kan låsa git
+    stderr_file = tempfile.TemporaryFile(mode="w+", encoding="utf-8", errors="replace")
+    proc = subprocess.Popen(
+        cmd, cwd=repo_path, stdout=subprocess.PIPE, stderr=stderr_file,
+        text=True, encoding="utf-8", errors="replace",
+    )
+
+    sha = None
+    msg_lines, diff_lines = [], []
+    in_message = False
+    diff_size = 0
+    at_eof = False
+
+    def finish():
+        diff = "".join(diff_lines).strip()
+        if diff_size > max_diff_chars:
+            diff += "\n[... diff kapad ...]"
+        return sha, format_commit_text("".join(msg_lines).strip(), diff)
+
+    try:
+        for line in proc.stdout:
+            if line.startswith(RECORD_SEP):
+                if sha is not None:
+                    yield finish()
+                sha, rest = line[1:].split(FIELD_SEP, 1)
+                msg_lines, diff_lines, diff_size = [], [], 0
+                in_message = True
+                line = rest
+            if in_message:
+                if FIELD_SEP in line:
+                    msg_lines.append(line.split(FIELD_SEP, 1)[0])
+                    in_message = False
+                else:
+                    msg_lines.append(line)
+                continue
+            remaining = max_diff_chars - diff_size
+            if remaining > 0:
+                diff_lines.append(line[:remaining])
+            diff_size += len(line)
+        at_eof = True
+        if sha is not None:
+            yield finish()
+    finally:
+        # Avbröts läsningen i förtid stoppas git; annars har den skrivit klart och får avsluta själv
+        if not at_eof:
+            proc.kill()
+        proc.stdout.close()
+        returncode = proc.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+        stderr_file.close()
+    if returncode != 0:
+        raise RuntimeError(f"git log misslyckades: {stderr.strip()}")
+
+def extract_commit_texts(since=None, rev_range=None, max_diff_chars=MAX_DIFF_CHARS):
+    return list(iter_commit_texts(since, rev_range, max_diff_chars))
 
 if __name__ == "__main__":
     commits_data = extract_commit_texts()
@@ -0,0 +1,73 @@
+import time
+import hashlib
+import threading
+import numpy as np
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, message="Rate limit reached"):
+        super().__init__(message)
+        self.response = None
+
+
+class FakeEmbedding:
+    def __init__(self, index, embedding):
+        self.index = index
+        self.embedding = embedding
+
+
+class FakeEmbeddingResponse:
+    def __init__(self, data, model):
+        self.data = data
+        self.model = model
+
+
+def fake_vector(text, dim):
+    # Deterministisk vektor per text så att samma text alltid ger samma embedding
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    vec /= np.linalg.norm(vec)
+    return vec.tolist()
+
+
+class FakeEmbeddings:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, input, model):
+        owner = self.owner
+        inputs = [input] if isinstance(input, str) else list(input)
+        with owner.lock:
+            owner.calls += 1
+            if owner.capacity and owner.active >= owner.capacity:
+                owner.rejected += 1
+                raise FakeRateLimitError()
+            owner.active += 1
+        try:
+            time.sleep(owner.latency + owner.per_text_latency * len(inputs))
+            data = [FakeEmbedding(i, fake_vector(text, owner.dim)) for i, text in enumerate(inputs)]
+            return FakeEmbeddingResponse(data, model)
+        finally:
+            with owner.lock:
+                owner.active -= 1
+
+
+class FakeEmbeddingClient:
+    """
+    Offline-ersättare för OpenAI-klienten (client.embeddings.create) med
+    deterministiska vektorer, simulerad latens och 429 när fler än capacity
+    anrop pågår samtidigt.
+    """
+
+    def __init__(self, dim=1536, latency=0.0, per_text_latency=0.0, capacity=None):
+        self.dim = dim
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.active = 0
+        self.calls = 0
+        self.rejected = 0
+        self.embeddings = FakeEmbeddings(self)
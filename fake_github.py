@@ -0,0 +1,175 @@
+import re
+import json
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGitHubState:
+    """
+    Minimal GitHub-API i minnet för lokala körningar: pull requests, ändrade
+    filer, kommentarer och reviews, med paginering, ETags och valfri rate limit.
+    """
+
+    def __init__(self, owner="gulcoder", repo="code-review-bot"):
+        self.owner = owner
+        self.repo = repo
+        self.base_url = None
+        self.pulls = {}
+        self.files = {}
+        self.issue_comments = {}
+        self.review_comments = {}
+        self.reviews = {}
+        self.requests = []
+        self.rate_limit_after = None
+        self.lock = threading.Lock()
+
+    def add_pull(self, number, head_branch, head_sha="0" * 40, files=None):
+        prefix = f"{self.base_url}/repos/{self.owner}/{self.repo}"
+        self.pulls[number] = {
+            "number": number,
+            "url": f"{prefix}/pulls/{number}",
+            "comments_url": f"{prefix}/issues/{number}/comments",
+            "review_comments_url": f"{prefix}/pulls/{number}/comments",
+            "head": {"ref": head_branch, "sha": head_sha, "label": f"{self.owner}:{head_branch}"},
+            "state": "open",
+        }
+        self.files[number] = list(files or [])
+        self.issue_comments.setdefault(number, [])
+        self.review_comments.setdefault(number, [])
+        self.reviews.setdefault(number, [])
+        return self.pulls[number]
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _rate_limited(self):
+        state = self.state
+        if state.rate_limit_after is None:
+            return False
+        if len(state.requests) > state.rate_limit_after:
+            state.rate_limit_after = None
+            self._send(403, {"message": "API rate limit exceeded"},
+                       {"Retry-After": "0", "X-RateLimit-Remaining": "0"})
+            return True
+        return False
+
+    def _paginate(self, items, path, query):
+        per_page = int(query.get("per_page", ["30"])[0])
+        page = int(query.get("page", ["1"])[0])
+        chunk = items[(page - 1) * per_page:page * per_page]
+        headers = {}
+        if page * per_page < len(items):
+            headers["Link"] = f'<{self.state.base_url}{path}?per_page={per_page}&page={page + 1}>; rel="next"'
+        return chunk, headers
+
+    def _respond_get(self, body, headers=None):
+        headers = dict(headers or {})
+        etag = '"' + hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest() + '"'
+        headers["ETag"] = etag
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, None, headers)
+        else:
+            self._send(200, body, headers)
+
+    def do_GET(self):
+        state = self.state
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        with state.lock:
+            state.requests.append(("GET", self.path))
+            if self._rate_limited():
+                return
+            prefix = f"/repos/{state.owner}/{state.repo}"
+            path = parsed.path
+            if path == f"{prefix}/pulls":
+                head = query.get("head", [None])[0]
+                pulls = [p for p in state.pulls.values() if head is None or p["head"]["label"] == head]
+                return self._respond_get(pulls)
+            m = re.fullmatch(rf"{prefix}/pulls/(\d+)(/files|/comments|/reviews)?", path)
+            if m and int(m.group(1)) in state.pulls:
+                number = int(m.group(1))
+                items = {
+                    None: None,
+                    "/files": state.files[number],
+                    "/comments": state.review_comments[number],
+                    "/reviews": state.reviews[number],
+                }[m.group(2)]
+                if items is None:
+                    return self._respond_get(state.pulls[number])
+                return self._respond_get(*self._paginate(items, path, query))
+            m = re.fullmatch(rf"{prefix}/issues/(\d+)/comments", path)
+            if m and int(m.group(1)) in state.pulls:
+                return self._respond_get(*self._paginate(state.issue_comments[int(m.group(1))], path, query))
+            self._send(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        state = self.state
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        path = urlparse(self.path).path
+        with state.lock:
+            state.requests.append(("POST", self.path))
+            if self._rate_limited():
+                return
+            prefix = f"/repos/{state.owner}/{state.repo}"
+            m = re.fullmatch(rf"{prefix}/(issues|pulls)/(\d+)/(comments|reviews)", path)
+            if not m or int(m.group(2)) not in state.pulls:
+                return self._send(404, {"message": "Not Found"})
+            number = int(m.group(2))
+            kind = (m.group(1), m.group(3))
+            if kind == ("issues", "comments"):
+                comment = dict(payload, id=len(state.issue_comments[number]) + 1)
+                state.issue_comments[number].append(comment)
+                return self._send(201, comment)
+            if kind == ("pulls", "comments"):
+                comment = dict(payload, id=len(state.review_comments[number]) + 1)
+                state.review_comments[number].append(comment)
+                return self._send(201, comment)
+            if kind == ("pulls", "reviews"):
+                review = dict(payload, id=len(state.reviews[number]) + 1)
+                state.reviews[number].append(review)
+                for comment in payload.get("comments", []):
+                    state.review_comments[number].append(
+                        dict(comment, id=len(state.review_comments[number]) + 1, pull_request_review_id=review["id"])
+                    )
+                return self._send(200, review)
+            self._send(404, {"message": "Not Found"})
+
+
+def start_fake_github(state=None, host="127.0.0.1", port=0):
+    """Startar servern i en bakgrundstråd och returnerar (server, state)."""
+    state = state or FakeGitHubState()
+    handler = type("BoundFakeGitHubHandler", (FakeGitHubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    state.base_url = f"http://{host}:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, state
+
+
+if __name__ == "__main__":
+    server, state = start_fake_github(port=8765)
+    state.add_pull(1, "test-pr2", files=[
+        {"filename": "example.py", "status": "modified", "patch": "@@ -1,0 +1,1 @@\n+print('hej')"},
+    ])
+    print(f"Fejkad GitHub på {state.base_url} (sätt GITHUB_API_URL), Ctrl+C för att avsluta")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,144 @@
+import os
+import re
+import ast
+import threading
+from collections import OrderedDict
+from analysis_cache import content_hash
+
+UNIT_CACHE_SIZE = 512
+# Radslut som ast räknar; str.splitlines delar även på \x0c, \x1c-\x1e, \x85, \u2028 och \u2029
+LINE_END_RE = re.compile(r"\r\n|\r|\n")
+
+
+def split_lines(text, keepends=False):
+    """Som str.splitlines, men med samma radnumrering som ast och tokenizern."""
+    if keepends:
+        return [m.group() for m in re.finditer(r"[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+\Z", text)]
+    lines = LINE_END_RE.split(text)
+    if lines and lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+class FileUnit:
+    """
+    En Python-fil läst och parsad en gång: källkod, innehållshash, AST och
+    radtabell. Delas av regelmotorn, radon, bandit, testgenerering och
+    granskning. Radons mått räknas ur samma AST och sparas på objektet.
+    """
+
+    __slots__ = ("path", "source", "hash", "mtime", "size", "_tree", "_parse_error", "_lines",
+                 "_blocks", "_raw", "_halstead")
+
+    def __init__(self, path, source, mtime=None, size=None):
+        self.path = path
+        self.source = source
+        self.hash = content_hash(source)
+        self.mtime = mtime
+        self.size = size
+        self._tree = None
+        self._parse_error = None
+        self._lines = None
+        self._blocks = None
+        self._raw = None
+        self._halstead = None
+
+    @property
+    def tree(self):
+        """AST:n, eller None vid syntaxfel (se parse_error)."""
+        if self._tree is None and self._parse_error is None:
+            try:
+                self._tree = ast.parse(self.source, filename=self.path)
+            except SyntaxError as e:
+                self._parse_error = e
+        return self._tree
+
+    @property
+    def parse_error(self):
+        self.tree
+        return self._parse_error
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = split_lines(self.source)
+        return self._lines
+
+    def line(self, lineno):
+        return self.lines[lineno - 1] if 0 < lineno <= len(self.lines) else ""
+
+    def complexity(self):
+        """Radons cyklomatiska komplexitet per block, ur den delade AST:n."""
+        if self._blocks is None:
+            from radon.complexity import cc_visit_ast
+            self._blocks = cc_visit_ast(self.tree) if self.tree is not None else []
+        return self._blocks
+
+    def complexity_dicts(self):
+        return [{"name": block.name, "complexity": block.complexity} for block in self.complexity()]
+
+    def raw(self):
+        # Råmåtten (sloc, kommentarer, ...) bygger på tokens, inte AST
+        if self._raw is None:
+            from radon.raw import analyze
+            self._raw = analyze(self.source)
+        return self._raw
+
+    def halstead(self):
+        if self._halstead is None and self.tree is not None:
+            from radon.metrics import h_visit_ast
+            self._halstead = h_visit_ast(self.tree)
+        return self._halstead
+
+    def maintainability(self, count_multi=True):
+        """Maintainability index som radon.metrics.mi_visit, utan att parsa om koden."""
+        if self.tree is None:
+            return None
+        from radon.metrics import mi_compute
+        from radon.visitors import ComplexityVisitor
+        raw = self.raw()
+        comment_lines = raw.comments + (raw.multi if count_multi else 0)
+        comments = comment_lines / float(raw.sloc) * 100 if raw.sloc else 0
+        complexity = ComplexityVisitor.from_ast(self.tree).total_complexity
+        return mi_compute(self.halstead().total.volume, complexity, raw.lloc, comments)
+
+    def metrics(self):
+        """Radons mått som enkla, picklebara typer."""
+        raw = self.raw()
+        return {
+            "complexity": self.complexity_dicts(),
+            "maintainability": self.maintainability(),
+            "raw": {"loc": raw.loc, "lloc": raw.lloc, "sloc": raw.sloc, "comments": raw.comments,
+                    "multi": raw.multi, "blank": raw.blank},
+        }
+
+
+_units = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_unit(path, max_size=UNIT_CACHE_SIZE):
+    """
+    Hämtar filens FileUnit ur en begränsad LRU. Filen läses om bara när
+    mtime eller storlek har ändrats sedan den lästes.
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    with _lock:
+        unit = _units.get(key)
+        if unit is not None and unit.mtime == stat.st_mtime_ns and unit.size == stat.st_size:
+            _units.move_to_end(key)
+            return unit
+    with open(path, "r") as f:
+        unit = FileUnit(path, f.read(), stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        _units[key] = unit
+        _units.move_to_end(key)
+        while len(_units) > max_size:
+            _units.popitem(last=False)
+    return unit
+
+
+def clear_units():
+    with _lock:
+        _units.clear()
@@ -1,8 +1,93 @@
-from git import Repo
 import os
 import shutil
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from instrumentation import timed
 
-def clone_repo(repo_url, branch_name, target_dir="temp_repo"):
-    if os.path.exists(target_dir):
-        shutil.rmtree(target_dir)
-    return Repo.clone_from(repo_url, target_dir, branch=branch_name)
+MIRROR_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "autonom_kodgranskare", "mirrors")
+FETCH_REFSPEC = "+refs/heads/*:refs/remotes/origin/*"
+
+@timed("clone")
+def clone_repo(repo_url, branch_name, target_dir="temp_repo", depth=None, partial=False,
+               mirror_root=MIRROR_ROOT):
+    # Återanvänder en lokal mirror och en worktree i stället för att klona om varje gång
+    return prepare_worktree(repo_url, branch_name, target_dir, depth=depth, partial=partial,
+                            mirror_root=mirror_root)
+
+def mirror_path(repo_url, mirror_root=MIRROR_ROOT):
+    name = os.path.basename(repo_url.rstrip("/")).removesuffix(".git") or "repo"
+    digest = hashlib.sha256(repo_url.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(mirror_root, f"{name}-{digest}.git")
+
+@contextmanager
+def _locked(path):
+    # Seriealiserar fetch/worktree-operationer mot samma mirror mellan processer
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _fetch_options(depth, partial):
+    options = []
+    if depth:
+        options.append(f"--depth={depth}")
+    if partial:
+        options.append("--filter=blob:none")
+    return options
+
+def ensure_mirror(repo_url, depth=None, partial=False, mirror_root=MIRROR_ROOT):
+    """
+    Bar mirror per remote som bara hämtar nya objekt vid varje körning.
+    depth ger en grund historik och partial hoppar över blobbar tills de behövs.
+    """
+    from git import Repo
+    path = mirror_path(repo_url, mirror_root)
+    with _locked(path):
+        if not os.path.exists(path):
+            options = ["--bare", "--no-single-branch"] if depth else ["--bare"]
+            mirror = Repo.clone_from(repo_url, path, multi_options=options + _fetch_options(depth, partial))
+            mirror.git.config("remote.origin.fetch", FETCH_REFSPEC)
+            # En bar klon skriver grenarna till refs/heads; flytta dem till origin/*
+            mirror.git.fetch("origin", "--prune", *_fetch_options(depth, False))
+        else:
+            mirror = Repo(path)
+            mirror.git.fetch("origin", "--prune", *_fetch_options(depth, False))
+    return mirror
+
+def _is_worktree_of(target_dir, mirror):
+    git_file = os.path.join(target_dir, ".git")
+    if not os.path.isfile(git_file):
+        return False
+    with open(git_file, "r") as f:
+        gitdir = f.read().strip().removeprefix("gitdir:").strip()
+    worktrees = os.path.join(os.path.realpath(mirror.git_dir), "worktrees")
+    return os.path.realpath(gitdir).startswith(worktrees + os.sep)
+
+def prepare_worktree(repo_url, branch_name, target_dir, depth=None, partial=False,
+                     mirror_root=MIRROR_ROOT):
+    """
+    Ger en worktree i target_dir med branch_name utcheckad som frånkopplad HEAD. En befintlig worktree
+    från samma mirror återställs och städas i stället för att skapas om.
+    """
+    from git import Repo
+    mirror = ensure_mirror(repo_url, depth=depth, partial=partial, mirror_root=mirror_root)
+    target_dir = os.path.abspath(target_dir)
+    start_point = f"origin/{branch_name}"
+
+    with _locked(mirror.git_dir):
+        if _is_worktree_of(target_dir, mirror):
+            repo = Repo(target_dir)
+            repo.git.checkout("--force", "--detach", start_point)
+            repo.git.clean("-ffdx")
+            return repo
+
+        if os.path.exists(target_dir):
+            shutil.rmtree(target_dir)
+        mirror.git.worktree("prune")
+        # Frånkopplad HEAD så att flera jobb kan ha samma gren utcheckad; pusha med HEAD:<gren>
+        mirror.git.worktree("add", "--detach", target_dir, start_point)
+        return Repo(target_dir)
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from clients import get_setting
+from instrumentation import span
+
+# Standard när varken api_base eller GITHUB_API_URL (miljön eller .env) anges
+API_BASE = "https://api.github.com"
+ETAG_CACHE_FILE = "github_etag_cache.json"
+PER_PAGE = 100
+MAX_RETRIES = 5
+MAX_WAIT = 900
+# ETag-cachen hålls som LRU och skrivs till disk efter så här många nya svar (och vid close)
+MAX_CACHE_ENTRIES = 2000
+FLUSH_EVERY = 50
+
+
+class GitHubError(Exception):
+    pass
+
+
+class GitHubClient:
+    """
+    Delad GitHub-klient: en keep-alive-session med anslutningspool, automatisk
+    paginering via Link-headern, villkorliga GET (If-None-Match) mot en lokal
+    ETag-cache och väntan vid primär/sekundär rate limit. Trådsäker; cachens
+    nycklar innehåller en hash av token så att svar inte delas mellan identiteter.
+    """
+
+    def __init__(self, token=None, api_base=None, cache_file=ETAG_CACHE_FILE,
+                 pool_size=10, max_retries=MAX_RETRIES, max_wait=MAX_WAIT, timeout=30,
+                 max_entries=MAX_CACHE_ENTRIES, flush_every=FLUSH_EVERY):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.api_base = (api_base or get_setting("GITHUB_API_URL", API_BASE)).rstrip("/")
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/vnd.github+json"})
+        if token:
+            self.session.headers["Authorization"] = f"token {token}"
+        self.identity = hashlib.sha256((token or "").encode("utf-8")).hexdigest()[:16] if token else "anonym"
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.etags = self._load_cache()
+        self.dirty = 0
+        self.reset_at = 0
+        self.stats = {"requests": 0, "not_modified": 0, "rate_limited": 0}
+
+    def _load_cache(self):
+        etags = OrderedDict()
+        if self.cache_file and os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, "r") as f:
+                    etags.update(json.load(f))
+            except (OSError, json.JSONDecodeError, TypeError, ValueError):
+                return OrderedDict()
+        while len(etags) > self.max_entries:
+            etags.popitem(last=False)
+        return etags
+
+    def save_cache(self):
+        if not self.cache_file:
+            return
+        with self.lock:
+            snapshot = list(self.etags.items())
+            self.dirty = 0
+        # Unik tmp-fil per skrivning, så att trådar och processer inte skriver i samma fil
+        directory = os.path.dirname(os.path.abspath(self.cache_file))
+        with self.save_lock:
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.cache_file) + ".", suffix=".tmp",
+                                            dir=directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(dict(snapshot), f)
+                os.replace(tmp_path, self.cache_file)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def url(self, path_or_url):
+        if path_or_url.startswith("http://") or path_or_url.startswith("https://"):
+            return path_or_url
+        return f"{self.api_base}/{path_or_url.lstrip('/')}"
+
+    def _rate_limit_wait(self, response, attempt):
+        # Sekundär rate limit anger Retry-After; primär anger när kvoten återställs
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            return float(retry_after)
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = float(response.headers.get("X-RateLimit-Reset", time.time()))
+            return max(0.0, reset - time.time()) + 1
+        if response.status_code == 429 or "rate limit" in response.text.lower():
+            return min(60.0, 2.0 ** attempt)
+        return None
+
+    def request(self, method, path_or_url, **kwargs):
+        url = self.url(path_or_url)
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            if self.reset_at > time.time():
+                time.sleep(min(self.max_wait, self.reset_at - time.time()))
+            with span("github", method=method) as current:
+                response = self.session.request(method, url, **kwargs)
+                current.labels["status"] = response.status_code
+            self._count("requests")
+            if response.headers.get("X-RateLimit-Remaining") == "0" and response.ok:
+                self.reset_at = float(response.headers.get("X-RateLimit-Reset", 0))
+            if response.status_code not in (403, 429):
+                return response
+            wait = self._rate_limit_wait(response, attempt)
+            if wait is None or attempt == self.max_retries or wait > self.max_wait:
+                return response
+            self._count("rate_limited")
+            print(f"⏳ GitHub rate limit, väntar {wait:.0f} s...")
+            time.sleep(wait)
+        return response
+
+    def _conditional_get(self, url, params=None):
+        from requests import Request
+        full_url = Request("GET", url, params=params).prepare().url
+        key = f"{self.identity} {full_url}"
+        with self.lock:
+            cached = self.etags.get(key)
+            if cached:
+                self.etags.move_to_end(key)
+        headers = {"If-None-Match": cached["etag"]} if cached else {}
+        response = self.request("GET", url, params=params, headers=headers)
+        if response.status_code == 304 and cached:
+            self._count("not_modified")
+            return cached["body"], cached.get("next")
+        if not response.ok:
+            raise GitHubError(f"GET {full_url} gav {response.status_code}: {response.text[:200]}")
+        body = response.json()
+        next_url = response.links.get("next", {}).get("url")
+        etag = response.headers.get("ETag")
+        if etag:
+            with self.lock:
+                self.etags[key] = {"etag": etag, "body": body, "next": next_url}
+                self.etags.move_to_end(key)
+                while len(self.etags) > self.max_entries:
+                    self.etags.popitem(last=False)
+                self.dirty += 1
+                flush = self.dirty >= self.flush_every
+            if flush:
+                self.save_cache()
+        return body, next_url
+
+    def get(self, path_or_url, params=None):
+        body, _ = self._conditional_get(self.url(path_or_url), params)
+        return body
+
+    def get_all(self, path_or_url, params=None):
+        """Hämtar alla sidor av en list-endpoint och returnerar en lista."""
+        params = dict(params or {})
+        params.setdefault("per_page", PER_PAGE)
+        items = []
+        url = self.url(path_or_url)
+        while url:
+            body, url = self._conditional_get(url, params)
+            items.extend(body)
+            # Link-headerns next-URL innehåller redan alla parametrar
+            params = None
+        return items
+
+    def post(self, path_or_url, payload, headers=None):
+        response = self.request("POST", path_or_url, json=payload, headers=headers)
+        if not response.ok:
+            raise GitHubError(f"POST {self.url(path_or_url)} gav {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    def close(self):
+        if self.dirty:
+            self.save_cache()
+        self.session.close()
@@ -1,29 +1,32 @@
 import os
-import requests
-from dotenv import load_dotenv
-from git import Repo, GitCommandError
 import tempfile
-from openai import OpenAI
 import re
+from clients import get_openai_client, get_github_client, get_setting
 from run_tests_with_coverage  import auto_generate_tests_if_low_coverage
-
-
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
-HEADERS = {
-    "Authorization": f"token {GITHUB_TOKEN}",
-    "Accept": "application/vnd.github.v3+json"
-}
-API_BASE = "https://api.github.com"
+from git_utils import clone_repo
+from analysis_cache import AnalysisCache, content_hash
+from github_client import GitHubError
+from review_builder import ReviewBuilder
+from review_engine import chunk_source, review_chunks
+from llm_cache import chat_completion
+from retrieval import retrieve_contexts
+from diff_scope import iter_added_lines, get_pr_changed_lines, scoped_regions, render_scoped_source
+from patch_engine import parse_patch, apply_hunks, apply_patches, write_results, print_results
+from rule_engine import check_source, only_local, apply_fixes, fix_diff, format_findings
+from file_unit import get_unit, split_lines
+from instrumentation import instrumented_run
+
+REVIEW_MODEL = "gpt-4o"
+REVIEW_SYSTEM_PROMPT = "Du är en senior Python-granskare. Ge konkreta förbättringsförslag, gärna med diff-exempel."
+SCOPED_INSTRUCTION = (
+    "Granska endast följande region. Svara med dina ändringar som en unified diff i ett ```diff-block: "
+    "en hunk (@@ -start,antal +start,antal @@) per ändring, med filens radnummer och tre rader "
+    "oförändrad kontext runt varje ändring. Skicka inte hela regionen.\n\n"
+)
 
 def get_pull_request(repo_owner, repo_name, head_branch):
-    url = f"{API_BASE}/repos/{repo_owner}/{repo_name}/pulls"
     params = {"head": f"{repo_owner}:{head_branch}", "state": "open"}
-    response = requests.get(url, headers=HEADERS, params=params)
-    response.raise_for_status()
-    prs = response.json()
+    prs = get_github_client().get(f"repos/{repo_owner}/{repo_name}/pulls", params=params)
     if prs:
         print(f"Found PR #{prs[0]['number']} for branch {head_branch}")
         return prs[0]
@@ -32,52 +35,60 @@ def get_pull_request(repo_owner, repo_name, head_branch):
         return None
 
 def get_changed_files(pr):
-    files_url = pr["url"] + "/files"
-    response = requests.get(files_url, headers=HEADERS)
-    response.raise_for_status()
-    files = response.json()
+    files = get_github_client().get_all(pr["url"] + "/files")
     print(f"Found {len(files)} changed files in PR.")
     return files
 
-def post_inline_comment(pr, file_path, body, line_position):
-    comments_url = pr["comments_url"]
-    comment = {
-        "body": body,
-        "path": file_path,
-        "position": line_position,
-        "commit_id": pr["head"]["sha"]
-    }
-    response = requests.post(comments_url, headers=HEADERS, json=comment)
-    response.raise_for_status()
-    print(f"Posted comment on {file_path} at position {line_position}")
-    return response.json()
-
-def analyze_patch_and_comment(pr, file):
+def rule_findings_for_patch(file, unit=None):
+    """
+    Lokala regelfynd på tillagda rader som [(rad, fynd, diff)]. unit är filens
+    FileUnit ur worktreen, så dess AST återanvänds; utan den körs reglerna på
+    varje tillagd rad för sig.
+    """
+    added = dict(iter_added_lines(file["patch"]))
+    filename = file["filename"]
+    results = []
+    if unit is not None:
+        code = unit.source
+        for finding in check_source(code, filename, unit.tree)["findings"]:
+            if finding["line"] in added:
+                diff = fix_diff(code, [finding], filename)
+                results.append((finding["line"], finding, diff.split("\n", 2)[2] if diff else ""))
+        return results
+
+    # Utan filens innehåll: kör reglerna på varje tillagd rad för sig
+    for line_number, line in added.items():
+        stripped = line.strip()
+        indent = line[:len(line) - len(line.lstrip())]
+        for finding in check_source(stripped, filename)["findings"]:
+            if finding["rule"] == "logging-import":
+                continue
+            fixed = apply_fixes(stripped, [finding])
+            diff = f"- {line}\n+ {indent}{fixed}" if fixed != stripped else ""
+            results.append((line_number, finding, diff))
+    return results
+
+def analyze_patch_and_comment(pr, file, review=None, unit=None):
+    # Utan review skickas förslagen för just denna fil direkt som en egen review
     patch = file.get("patch")
     if not patch:
         return
 
-    lines = patch.split("\n")
-    diff_position = 0
+    own_review = review is None
+    if own_review:
+        review = ReviewBuilder(pr, get_github_client())
 
-    for i, line in enumerate(lines):
-        diff_position += 1
+    for line_number, finding, diff in rule_findings_for_patch(file, unit):
+        comment_body = f"Förslag: {finding['message']}"
+        if diff:
+            comment_body += f"\n\n```diff\n{diff.rstrip()}\n```"
+        review.add(file["filename"], line_number, comment_body)
 
-        if line.startswith("+") and "print(" in line:
-            suggestion = line.replace("print(", "logging.info(")
-            diff_patch = f"```diff\n- {line[1:]}\n+ {suggestion[1:]}\n```"
-
-            comment_body = (
-                "Förslag: Byt ut `print` mot `logging.info` för bättre loggning.\n\n"
-                f"{diff_patch}"
-            )
-            post_inline_comment(pr, file["filename"], comment_body, diff_position)
+    if own_review:
+        review.submit()
 
 def get_pr_comments(pr):
-    comments_url = pr["comments_url"]
-    response = requests.get(comments_url, headers=HEADERS)
-    response.raise_for_status()
-    return response.json()
+    return get_github_client().get_all(pr["comments_url"])
 
 def check_for_refactor_signoff(pr):
     comments = get_pr_comments(pr)
@@ -87,158 +98,180 @@ def check_for_refactor_signoff(pr):
             return True
     return False
 
-def agent_commit_logic_with_responses(repo_path, branch):
-    from openai import OpenAI
-    client = OpenAI()
+def agent_commit_logic_with_responses(repo_path, branch, paths=None, on_commit=None):
+    from git import Repo, GitCommandError
 
     commit_prompt = (
         "Du är en Git-agent som skriver ett tydligt och kortfattat commit-meddelande "
         "för en fixup-commit baserat på ändringar i Python-kod."
     )
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
+    commit_msg = chat_completion(
+        get_openai_client(),
+        "gpt-4o",
+        [
             {"role": "system", "content": commit_prompt},
             {"role": "user", "content": "fixup commit changes"}
         ],
-        temperature=0.1
-    )
-
-    commit_msg = response.choices[0].message.content.strip()
+        0.1
+    ).strip()
 
     repo = Repo(repo_path)
     git = repo.git
 
     try:
+        git.add(*(paths or ["-u"]))
         git.commit("--fixup", "HEAD", m=commit_msg)
-        git.push("origin", branch)
+        if on_commit:
+            # Före push, så att webhook-servern känner igen sin egen synchronize-händelse
+            on_commit(repo.head.commit.hexsha)
+        git.push("origin", f"HEAD:{branch}")
         print("✅ Fixup commit pushad med meddelande:", commit_msg)
     except GitCommandError as e:
         print("❌ Fel vid commit eller push:", e)
+    return commit_msg
 
 def post_pr_comment(repo_owner, repo_name, pr_number, message, github_token):
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/issues/{pr_number}/comments"
-    headers = {
-        "Authorization": f"token {github_token}",
-        "Accept": "application/vnd.github+json"
-    }
+    url = f"repos/{repo_owner}/{repo_name}/issues/{pr_number}/comments"
+    headers = {"Authorization": f"token {github_token}"} if github_token else None
     payload = {"body": message}
-    response = requests.post(url, headers=headers, json=payload)
-
-    if response.status_code == 201:
+    try:
+        get_github_client().post(url, payload, headers=headers)
         print("📝 Kommentar publicerad på PR.")
-    else:
-        print(f"❌ Kunde inte posta kommentar: {response.status_code} {response.text}")
+    except GitHubError as e:
+        print(f"❌ Kunde inte posta kommentar: {e}")
 
 
 
-def analyze_code_with_responses_api(code_text):
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Du är en senior Python-granskare. Ge konkreta förbättringsförslag, gärna med diff-exempel."},
-            {"role": "user", "content": f"Analysera denna Python-fil:\n\n{code_text}"}
-        ],
-        temperature=0.3
-    )
-    return response.choices[0].message.content
+def review_messages(code_text, context=""):
+    messages = [{"role": "system", "content": REVIEW_SYSTEM_PROMPT}]
+    if context:
+        messages.append({"role": "user", "content": f"Relaterade tidigare ändringar i kodbasen:\n\n{context}"})
+    messages.append({"role": "user", "content": f"Analysera denna Python-fil:\n\n{code_text}"})
+    return messages
 
-def agent_static_analysis(code):
-    return analyze_code_with_responses_api(code)  # Din funktion som använder chat.completions
+def analyze_code_with_responses_api(code_text, on_delta=None):
+    return chat_completion(get_openai_client(), REVIEW_MODEL, review_messages(code_text), 0.3, stream=True, on_delta=on_delta)
 
-def generate_diff_from_analysis(original_code, analysis):
-    # Om analysen innehåller förslag att byta print() till logging.info()
-    if "byt ut print(" in analysis.lower():
-        new_code = original_code.replace("print(", "logging.info(")
-        # Skapa diff-text (kan vara enklare form)
-        diff = f"--- original\n+++ fixed\n@@ -1 +1 @@\n-{original_code}\n+{new_code}\n"
-        return diff
-    return ""
+def chunk_regions(code):
+    # För stora filer blir varje AST-bit en egen region som granskas för sig
+    chunks = chunk_source(code)
+    if len(chunks) <= 1:
+        return None
+    return [(chunk["start"], chunk["end"]) for chunk in chunks]
+
+def print_chunk_done(chunk, text):
+    print(f"[delsvar] Rader {chunk['start']}-{chunk['end']} klara ({len(text)} tecken)")
+
+def agent_static_analysis(code, cache=None, regions=None, context=""):
+    # Varje region (ändrade funktioner eller AST-bitar) granskas för sig, parallellt;
+    # utan regions är hela filen en region
+    regions = regions or [(1, max(1, len(split_lines(code))))]
+    chunks = [
+        {"start": start, "end": end, "prompt": SCOPED_INSTRUCTION + render_scoped_source(code, [(start, end)])}
+        for start, end in regions
+    ]
+
+    prompt_digest = content_hash(REVIEW_SYSTEM_PROMPT + context)
+    for chunk in chunks:
+        chunk["digest"] = content_hash(chunk["prompt"])
+        chunk["analysis"] = None
+        if cache is not None:
+            chunk["analysis"] = cache.get(chunk["digest"], "responses-review", REVIEW_MODEL, prompt_digest)
+
+    missing = [chunk for chunk in chunks if chunk["analysis"] is None]
+    if missing:
+        texts = review_chunks(missing, lambda chunk: review_messages(chunk["prompt"], context), get_openai_client(), REVIEW_MODEL, 0.3,
+                              on_chunk=print_chunk_done if len(chunks) > 1 else None)
+        for chunk, text in zip(missing, texts):
+            chunk["analysis"] = text
+            if cache is not None:
+                cache.put(chunk["digest"], "responses-review", REVIEW_MODEL, text, prompt_digest)
+    return "\n\n".join(chunk["analysis"] for chunk in chunks)
+
+def generate_diff_from_analysis(analysis):
+    # Alla ```diff-block i analysen, som en gemensam patch för filen
+    return "\n".join(extract_diff_from_analysis(analysis))
 
 
 def extract_diff_from_analysis(analysis_text):
     """
-    Extraherar kodblock från analys, tex Python
+    Extraherar diff-block från analysen
     """
     code_blocks = re.findall(r"```diff\n(.*?)\n```", analysis_text, re.DOTALL)
     return code_blocks
 
+def file_patch_from_analysis(filename, analysis):
+    # GPT:s filhuvuden (---/+++) är opålitliga; hunkarna hör alltid till filen som granskades
+    hunks = [hunk for patch in parse_patch(generate_diff_from_analysis(analysis)) for hunk in patch["hunks"]]
+    return {"path": filename, "old_path": filename, "hunks": hunks}
+
 def apply_diff_to_code(original_code, diff_text):
     """
-    Enkel diff-applikation:
-    För tillfället hanterar vi endast ett vanligt scenario: 
-    ersätt 'print(' med 'logging.info(' om diffen innehåller det.
+    Applicerar en unified diff hunk för hunk med fuzzy kontextmatchning.
+    Hunkar som inte passar avvisas och skrivs ut.
     """
-    if "print(" in original_code and "logging.info(" in diff_text:
-        return original_code.replace("print(", "logging.info(")
-    return original_code
+    hunks = [hunk for patch in parse_patch(diff_text) for hunk in patch["hunks"]]
+    new_code, applied, rejected = apply_hunks(original_code, hunks)
+    if rejected:
+        print(f"[DEBUG] {len(rejected)} av {len(hunks)} hunkar kunde inte appliceras.")
+    return new_code
 
 def agent_diff_generation(original_code, analysis):
     print("===ANALYSIS FROM GPT===")
     print(analysis)
 
-    # Försök extrahera ny kod från analysen
-    code_blocks = extract_diff_from_analysis(analysis)
-    print(f"[DEBUG] Extracted code blocks: {code_blocks}")
-
-    if code_blocks:
-        new_code = code_blocks[0].strip()
-        if new_code != original_code.strip():
-            print("[DEBUG] Förbättrad kod extraherad och skiljer sig från originalet.")
-            return "[FULL FILE REPLACEMENT]", new_code
-        else:
-            print("[DEBUG] Förbättrad kod är identisk med originalet.")
-            return None, original_code
-
-    # Fallback
-    print("[DEBUG] Inga kodblock hittades. Försöker fallback...")
-    if "byt ut print(" in analysis.lower():
-        new_code = original_code.replace("print(", "logging.info(")
-        return "[fallback]", new_code
+    diff = generate_diff_from_analysis(analysis)
+    if not diff:
+        print("[DEBUG] Inga diff-block hittades.")
+        return None, original_code
 
+    new_code = apply_diff_to_code(original_code, diff)
+    if new_code != original_code:
+        return diff, new_code
+    print("[DEBUG] Diffen ändrade ingenting.")
     return None, original_code
 
-import os
-
-# Temporärt växla katalog
-original_cwd = os.getcwd()
-os.chdir("/Users/gulbaran/autonom_kodgranskare/temp_repo")
-
-# Kör git-kommandon här...
-os.system("git add bad_code2.py")
-os.system("git commit -m 'fixup! auto-refactor bad_code2.py'")
-os.system("git push")
+def main(repo_owner="gulcoder", repo_name="code-review-bot", pr_branch="test-pr2"):
+    # Export och profilering styrs av METRICS_JSON, METRICS_PROM, PROFILE och TRACE_MEMORY
+    with instrumented_run("granskning"):
+        pr = get_pull_request(repo_owner, repo_name, pr_branch)
+        if not pr:
+            return
 
-# Tillbaka till originalmappen
-os.chdir(original_cwd)
+        review_pull_request(repo_owner, repo_name, pr)
 
+def _superseded(superseded, stage):
+    if superseded is not None and superseded.is_set():
+        print(f"⏭️ Jobbet ersattes av en nyare händelse, avbryter före {stage}.")
+        return True
+    return False
 
-def main():
-    repo_owner = "gulcoder"
-    repo_name = "code-review-bot"
-    pr_branch = "test-pr2"
-
-    pr = get_pull_request(repo_owner, repo_name, pr_branch)
-    if not pr:
-        return
-    
+def review_pull_request(repo_owner, repo_name, pr, repo_path="./temp_repo", kind=None, on_commit=None,
+                        superseded=None):
+    """
+    Granskar PR:en. kind är "signoff" (fixup-commit) eller "review" (inline-
+    kommentarer); utan kind avgörs det av om PR:en har en sign-off-kommentar.
+    on_commit anropas med fixup-commitens sha innan den pushas, och
+    superseded (threading.Event) avbryter mellan stegen.
+    """
+    pr_branch = pr["head"]["ref"]
+    repo_url = f"https://github.com/{repo_owner}/{repo_name}.git"
     files= get_changed_files(pr)
 
+    if kind is None:
+        kind = "signoff" if check_for_refactor_signoff(pr) else "review"
 
-    if check_for_refactor_signoff(pr):
-        repo_url = f"https://github.com/{repo_owner}/{repo_name}.git"
-        repo_path = "./temp_repo"
-
-        if not os.path.exists(repo_path):
-            print("Klonar repo för fixup...")
-            Repo.clone_from(repo_url, repo_path, branch=pr_branch)
-        else:
-            repo = Repo(repo_path)
-            repo.git.checkout(pr_branch)
-            repo.remotes.origin.pull()
+    # PR-headen checkas ut först: både granskningen och testgenereringen läser filerna därifrån
+    print("Förbereder worktree för PR-headen...")
+    clone_repo(repo_url, pr_branch, repo_path)
 
-        changed_any_files = False
+    if kind == "signoff":
+        file_patches = []
+        cache = AnalysisCache()
+        pr_changed_lines = get_pr_changed_lines(files)
+        # Relaterade commits för alla filers diffar i en enda embedding- och sökomgång
+        contexts = retrieve_contexts({f["filename"]: f["patch"] for f in files if f.get("patch")}, repo_path)
         
         # Här läser vi in varje fil från det klonade repot och anropar Responses API
         for file in files:
@@ -249,44 +282,72 @@ def main():
                 print(f"Filen {filename} finns inte i klonat repo, hoppar över.")
                 continue
 
-            with open(full_path, "r") as f:
-                code = f.read()
-
-            # Anropa Responses API med koden
-            #analysis = analyze_code_with_responses_api(code)
-            analysis = agent_static_analysis(code)
-            print(f"Response från Responses API för {filename}:\n{analysis}\n")
-
-            diff, new_code= agent_diff_generation(code, analysis)
-            print(f"Genererad diff för {filename}:\n{diff}\n")
-
-            if new_code and new_code != code:
-                with open(full_path, "w") as f:
-                    f.write(new_code)
-                print(f"✏️ Uppdaterade {filename} med föreslagna ändringar.")
-                changed_any_files = True
+            unit = get_unit(full_path)
+            code = unit.source
+
+            # Lokala regler först; GPT hoppas bara över när fynden täcker varje ändrad region
+            report = check_source(code, filename, unit.tree)
+            local_diff = fix_diff(code, report["findings"], filename)
+            patch = {"path": filename, "old_path": filename,
+                     "hunks": [h for p in parse_patch(local_diff) for h in p["hunks"]]}
+            changed = scoped_regions(code, pr_changed_lines.get(filename))
+            if only_local(report, changed or None):
+                print(f"Lokala regler för {filename} (GPT hoppas över):\n{format_findings(report['findings'])}\n")
+            else:
+                # Anropa Responses API med bara de ändrade delarna av koden
+                regions = changed or chunk_regions(code)
+                analysis = agent_static_analysis(code, cache, regions, contexts.get(filename, ""))
+                print(f"Response från Responses API för {filename}:\n{analysis}\n")
+                patch["hunks"] += file_patch_from_analysis(filename, analysis)["hunks"]
+
+            if patch["hunks"]:
+                print(f"Genererad diff för {filename}: {len(patch['hunks'])} hunkar")
+                file_patches.append(patch)
             else:
                 print(f"Inga ändringar för {filename}.")
-        if changed_any_files:
+        cache.print_stats()
+        cache.close()
+
+        if _superseded(superseded, "fixup-commit"):
+            return
+
+        # Torrkörning av alla filers hunkar i ett svep innan något skrivs
+        results = apply_patches(file_patches, repo_path, dry_run=True)
+        print_results(results)
+        changed_paths = write_results(results, repo_path)
+        if changed_paths:
+            print(f"✏️ Uppdaterade {len(changed_paths)} filer med föreslagna ändringar.")
             print("\n Utför fixup-commit och push..")
-            commit_msg = agent_commit_logic_with_responses(repo_path, pr_branch)
+            commit_msg = agent_commit_logic_with_responses(repo_path, pr_branch, changed_paths, on_commit)
 
             post_pr_comment(
                 repo_owner,
                 repo_name,
                 pr["number"],
                 f"Fixup-commit skapad med meddelande:\n\n```{commit_msg}",
-                GITHUB_TOKEN
+                get_setting("GITHUB_TOKEN")
             )
         else:
             print("Ingen fil ändrades - ingen fixup-commit behövs")
 
     else:
-        print("💬 Ingen refactor-signoff hittad, lägger till inline-kommentarer.")
+        print("💬 Ingen refactor-signoff, lägger till inline-kommentarer.")
+        # Filerna läses ur worktreen i stället för ett contents-anrop per fil
+        review = ReviewBuilder(pr, get_github_client())
         for file in files:
-            analyze_patch_and_comment(pr, file)
-            
-    generated, affected = auto_generate_tests_if_low_coverage()
+            full_path = os.path.join(repo_path, file["filename"])
+            unit = get_unit(full_path) if os.path.exists(full_path) else None
+            analyze_patch_and_comment(pr, file, review, unit)
+        if _superseded(superseded, "inline-kommentarer"):
+            return
+        review.submit()
+
+    if _superseded(superseded, "testgenerering"):
+        return
+    # Icke-interaktivt: körs från webhook-servern utan någon som kan svara på input()
+    generated, affected = False, []
+    if os.path.isdir(os.path.join(repo_path, "tests")):
+        generated, affected = auto_generate_tests_if_low_coverage(interactive=False, repo_path=repo_path)
     
     if generated:
         test_list = "\n".join(f"- `{file}`" for file in affected)
@@ -295,7 +356,7 @@ def main():
             repo_name,
             pr["number"],
             f"🧪 Coverage var under 75 %. Genererade automatiska enhetstester för:\n{test_list}",
-            GITHUB_TOKEN
+            get_setting("GITHUB_TOKEN")
             
         )
         
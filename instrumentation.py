@@ -0,0 +1,280 @@
+import io
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from clients import get_setting
+
+METRICS_PREFIX = "autoreview"
+# Listpris i USD per miljon tokens (prompt, completion); okända modeller räknas som 0
+PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "text-embedding-3-small": (0.02, 0.0),
+}
+
+
+class Span:
+    __slots__ = ("stage", "labels", "counts", "error")
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.counts = {}
+        self.error = False
+
+    def add(self, **counts):
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + (value or 0)
+
+
+class Recorder:
+    """
+    Samlar spans för en körning per (steg, etiketter): antal, fel, total och
+    längsta tid samt summerade räknare som tokens och kostnad. Trådsäker, så
+    LLM- och GitHub-anrop från trådpoolerna kan spelas in samtidigt.
+    """
+
+    def __init__(self, name="run"):
+        self.lock = threading.Lock()
+        self.reset(name)
+
+    def reset(self, name="run"):
+        with self.lock:
+            self.name = name
+            self.started_at = time.time()
+            self.started = time.perf_counter()
+            self.stages = {}
+
+    def observe(self, stage, seconds, error=False, labels=None, **counts):
+        key = (stage, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            entry = self.stages.get(key)
+            if entry is None:
+                entry = self.stages[key] = {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                            "counts": {}}
+            entry["count"] += 1
+            entry["errors"] += bool(error)
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            for name, value in counts.items():
+                entry["counts"][name] = entry["counts"].get(name, 0) + (value or 0)
+
+    def snapshot(self):
+        with self.lock:
+            stages = [
+                dict({"stage": stage, "labels": dict(labels)}, count=e["count"], errors=e["errors"],
+                     seconds=round(e["seconds"], 6), max_seconds=round(e["max_seconds"], 6), **e["counts"])
+                for (stage, labels), e in self.stages.items()
+            ]
+            totals = {}
+            for e in self.stages.values():
+                for name, value in e["counts"].items():
+                    totals[name] = totals.get(name, 0) + value
+            return {
+                "run": self.name,
+                "started_at": self.started_at,
+                "wall_seconds": round(time.perf_counter() - self.started, 6),
+                "stages": sorted(stages, key=lambda s: -s["seconds"]),
+                "totals": totals,
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, ensure_ascii=False)
+
+    def prometheus(self, prefix=METRICS_PREFIX):
+        """Spansen i Prometheus textformat, ett tidsserie-set per steg och etikettkombination."""
+        snapshot = self.snapshot()
+        series = {}
+        for s in snapshot["stages"]:
+            labels = dict({"stage": s["stage"]}, **s["labels"])
+            text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            series.setdefault((f"{prefix}_stage_seconds", "summary"), []).extend([
+                f"{prefix}_stage_seconds_sum{{{text}}} {s['seconds']:.6f}",
+                f"{prefix}_stage_seconds_count{{{text}}} {s['count']}",
+            ])
+            series.setdefault((f"{prefix}_stage_max_seconds", "gauge"), []).append(
+                f"{prefix}_stage_max_seconds{{{text}}} {s['max_seconds']:.6f}")
+            series.setdefault((f"{prefix}_stage_errors_total", "counter"), []).append(
+                f"{prefix}_stage_errors_total{{{text}}} {s['errors']}")
+            for name in sorted(set(s) - {"stage", "labels", "count", "errors", "seconds", "max_seconds"}):
+                metric = f"{prefix}_{name}_total"
+                series.setdefault((metric, "counter"), []).append(f"{metric}{{{text}}} {s[name]:g}")
+        lines = [f"# TYPE {prefix}_run_wall_seconds gauge", f"{prefix}_run_wall_seconds {snapshot['wall_seconds']:.6f}"]
+        for (metric, kind), samples in series.items():
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_recorder = Recorder()
+
+
+def get_recorder():
+    return _recorder
+
+
+def observe(stage, seconds, error=False, labels=None, **counts):
+    _recorder.observe(stage, seconds, error, labels, **counts)
+
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Mäter kodblocket som ett steg. Den returnerade spanen tar emot räknare
+    (span.add(tokens=...)) och etiketter som bara är kända efteråt.
+    """
+    current = Span(stage, labels)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.error = True
+        raise
+    finally:
+        _recorder.observe(stage, time.perf_counter() - start, current.error, current.labels, **current.counts)
+
+
+def timed(stage, **labels):
+    """Dekorator-varianten av span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_call(func, *args, **kwargs):
+    # För processpooler: spans i en worker når inte förälderns Recorder, så tiden skickas tillbaka
+    start = time.perf_counter()
+    return func(*args, **kwargs), time.perf_counter() - start
+
+
+def llm_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def record_usage(current, model, usage):
+    """Lägger till tokenförbrukning (response.usage) och uppskattad kostnad på en span."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    current.add(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                cost_usd=llm_cost(model, prompt_tokens, completion_tokens))
+
+
+def print_summary(snapshot=None):
+    snapshot = snapshot or _recorder.snapshot()
+    print(f"\n--- Tidsåtgång per steg ({snapshot['run']}, {snapshot['wall_seconds']:.2f} s totalt) ---")
+    for s in snapshot["stages"]:
+        labels = " ".join(f"{k}={v}" for k, v in s["labels"].items())
+        extra = ""
+        if "prompt_tokens" in s:
+            extra = f", {s['prompt_tokens']:.0f}+{s.get('completion_tokens', 0):.0f} tokens"
+        if s.get("cost_usd"):
+            extra += f", ${s['cost_usd']:.4f}"
+        errors = f", {s['errors']} fel" if s["errors"] else ""
+        print(f"{s['stage']:<10} {labels:<28} {s['count']:>5} st {s['seconds']:>8.2f} s "
+              f"(max {s['max_seconds']:.2f} s){extra}{errors}")
+    totals = snapshot["totals"]
+    if "prompt_tokens" in totals:
+        print(f"Tokens: {totals['prompt_tokens']:.0f} prompt + {totals.get('completion_tokens', 0):.0f} completion, "
+              f"uppskattad kostnad ${totals.get('cost_usd', 0):.4f}")
+
+
+def export(metrics_json=None, metrics_prom=None):
+    if metrics_json:
+        with open(metrics_json, "w") as f:
+            f.write(_recorder.to_json())
+        print(f"📊 Spans skrivna till {metrics_json}")
+    if metrics_prom:
+        with open(metrics_prom, "w") as f:
+            f.write(_recorder.prometheus())
+        print(f"📊 Prometheus-mått skrivna till {metrics_prom}")
+
+
+@contextmanager
+def profiled(profile_path=None, trace_memory=False, top=20):
+    """
+    Valfri cProfile och/eller tracemalloc runt ett kodblock för att hitta
+    heta vägar. Statistiken sparas i profile_path (läs med pstats/snakeviz)
+    och de dyraste funktionerna och största allokeringarna skrivs ut.
+    """
+    profiler = None
+    if profile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            import pstats
+            profiler.dump_stats(profile_path)
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+            print(f"\n--- cProfile (topp {top}, sparad i {profile_path}) ---")
+            print(out.getvalue())
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"\n--- tracemalloc: {current / 1e6:.1f} MB nu, {peak / 1e6:.1f} MB som mest ---")
+            for stat in snapshot.statistics("lineno")[:top]:
+                print(stat)
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("instrumentering")
+    # Utan flaggor tar instrumented_run värdena från miljön/.env
+    group.add_argument("--metrics-json", metavar="FIL",
+                       help="Skriv körningens spans som JSON (standard: METRICS_JSON)")
+    group.add_argument("--metrics-prom", metavar="FIL",
+                       help="Skriv körningens spans i Prometheus textformat (standard: METRICS_PROM)")
+    group.add_argument("--profile", metavar="FIL",
+                       help="Kör under cProfile och spara statistiken i FIL (standard: PROFILE)")
+    group.add_argument("--trace-memory", action="store_true", default=None,
+                       help="Mät minnesallokeringar med tracemalloc (standard: TRACE_MEMORY=1)")
+
+
+@contextmanager
+def instrumented_run(name, metrics_json=None, metrics_prom=None, profile=None, trace_memory=None):
+    """
+    Ramar in ett helt kommando: nollställer spansen, mäter hela körningen,
+    skriver en sammanfattning och exporterar. Argument som saknas tas från
+    miljön (METRICS_JSON, METRICS_PROM, PROFILE, TRACE_MEMORY), inklusive .env,
+    när körningen startar.
+    """
+    if trace_memory is None:
+        trace_memory = get_setting("TRACE_MEMORY", "0") == "1"
+    profile = profile or get_setting("PROFILE")
+    metrics_json = metrics_json or get_setting("METRICS_JSON")
+    metrics_prom = metrics_prom or get_setting("METRICS_PROM")
+    _recorder.reset(name)
+    try:
+        with profiled(profile, trace_memory), span("total"):
+            yield _recorder
+    finally:
+        print_summary()
+        export(metrics_json, metrics_prom)
+
+
+def run_options(args):
+    """Flaggorna från add_arguments som argument till instrumented_run."""
+    return {"metrics_json": args.metrics_json, "metrics_prom": args.metrics_prom,
+            "profile": args.profile, "trace_memory": args.trace_memory}
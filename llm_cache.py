@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from instrumentation import span, record_usage
+
+LLM_CACHE_DB = "llm_cache.db"
+MAX_ENTRIES = 20000
+TTL = 14 * 24 * 3600
+SIMILARITY_THRESHOLD = 0.97
+
+
+def messages_key(model, temperature, messages):
+    text = json.dumps({"model": model, "temperature": temperature, "messages": messages},
+                      sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def context_key(model, temperature, messages):
+    # Allt utom sista användarmeddelandets innehåll; nära dubbletter söks bara inom samma kontext
+    head = messages[:-1] + [{"role": messages[-1]["role"]}] if messages else []
+    return messages_key(model, temperature, head)
+
+
+def create_db(db_path=LLM_CACHE_DB):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS llm_responses (
+            key TEXT PRIMARY KEY,
+            context TEXT,
+            model TEXT,
+            response TEXT,
+            embedding BLOB,
+            created_at REAL,
+            accessed_at REAL,
+            hits INTEGER DEFAULT 0
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_llm_context ON llm_responses (context)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_llm_accessed ON llm_responses (accessed_at)")
+    conn.commit()
+    return conn
+
+
+def default_embed(texts):
+    # Samma delade klient och batchning som commit-sökningen i search_cache
+    from clients import get_openai_client
+    from batch_embedder import BatchEmbedder
+    return BatchEmbedder(get_openai_client()).embed(texts)
+
+
+class LLMCache:
+    """
+    Svarscache för chat completions. Exakta träffar nycklas på (modell,
+    temperatur, hash av meddelandena); med semantic=True återanvänds även svar
+    vars sista användarmeddelande är nästan identiskt (cosinus >= threshold).
+    """
+
+    def __init__(self, db_path=LLM_CACHE_DB, ttl=TTL, max_entries=MAX_ENTRIES,
+                 semantic=False, threshold=SIMILARITY_THRESHOLD, embed=default_embed):
+        self.conn = create_db(db_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.threshold = threshold
+        self.embed = embed
+        self.lock = threading.Lock()
+        self.engines = {}
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+    def _fresh(self, created_at):
+        return not self.ttl or time.time() - created_at <= self.ttl
+
+    def _touch(self, key):
+        self.conn.execute("UPDATE llm_responses SET accessed_at = ?, hits = hits + 1 WHERE key = ?",
+                          (time.time(), key))
+        self.conn.commit()
+
+    def _engine(self, context):
+        import numpy as np
+        from search_engine import SearchEngine
+
+        engine = self.engines.get(context)
+        if engine is None:
+            rows = self.conn.execute(
+                "SELECT key, embedding FROM llm_responses WHERE context = ? AND embedding IS NOT NULL",
+                (context,),
+            ).fetchall()
+            if not rows:
+                return None
+            engine = SearchEngine([k for k, _ in rows], [np.frombuffer(e, dtype=np.float32) for _, e in rows])
+            self.engines[context] = engine
+        return engine
+
+    def get(self, model, temperature, messages):
+        """Returnerar (svar, query_embedding). Svaret är None vid miss."""
+        key = messages_key(model, temperature, messages)
+        with self.lock:
+            row = self.conn.execute("SELECT response, created_at FROM llm_responses WHERE key = ?",
+                                    (key,)).fetchone()
+            if row and self._fresh(row[1]):
+                self._touch(key)
+                self.counters["exact_hits"] += 1
+                return row[0], None
+
+        query_embedding = None
+        if self.semantic and messages:
+            import numpy as np
+            query_embedding = np.asarray(self.embed([messages[-1]["content"]])[0], dtype=np.float32)
+            context = context_key(model, temperature, messages)
+            with self.lock:
+                engine = self._engine(context)
+                matches = engine.search(query_embedding, top_k=1) if engine else []
+                if matches and matches[0][1] >= self.threshold:
+                    row = self.conn.execute("SELECT response, created_at FROM llm_responses WHERE key = ?",
+                                            (matches[0][0],)).fetchone()
+                    if row and self._fresh(row[1]):
+                        self._touch(matches[0][0])
+                        self.counters["semantic_hits"] += 1
+                        return row[0], query_embedding
+
+        with self.lock:
+            self.counters["misses"] += 1
+        return None, query_embedding
+
+    def put(self, model, temperature, messages, response, query_embedding=None):
+        key = messages_key(model, temperature, messages)
+        context = context_key(model, temperature, messages)
+        blob = None
+        if query_embedding is not None:
+            import numpy as np
+            blob = np.asarray(query_embedding, dtype=np.float32).tobytes()
+        now = time.time()
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO llm_responses
+                (key, context, model, response, embedding, created_at, accessed_at, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+            ''', (key, context, model, response, blob, now, now))
+            self.conn.commit()
+            self.engines.pop(context, None)
+            self.counters["stores"] += 1
+            if self.counters["stores"] % 200 == 0:
+                self._evict()
+
+    def evict(self):
+        with self.lock:
+            return self._evict()
+
+    def _evict(self):
+        # TTL först, sedan LRU över max_entries
+        c = self.conn.cursor()
+        removed = 0
+        if self.ttl:
+            c.execute("DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.ttl,))
+            removed += c.rowcount
+        if self.max_entries:
+            c.execute('''
+                DELETE FROM llm_responses WHERE rowid IN (
+                    SELECT rowid FROM llm_responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            removed += c.rowcount
+        self.conn.commit()
+        if removed:
+            self.engines.clear()
+        self.counters["evicted"] += removed
+        return removed
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(response)), 0) FROM llm_responses"
+            ).fetchone()
+            stats = dict(self.counters)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats.update({
+            "entries": entries,
+            "response_bytes": size,
+            "hit_rate": (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0,
+            "semantic": self.semantic,
+        })
+        return stats
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    # LLM_CACHE=0 stänger av cachen, LLM_CACHE_SEMANTIC=1 slår på nära-dubblett-återanvändning
+    global _default_cache
+    if os.getenv("LLM_CACHE", "1") == "0":
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache(
+                os.getenv("LLM_CACHE_DB", LLM_CACHE_DB),
+                semantic=os.getenv("LLM_CACHE_SEMANTIC", "0") == "1",
+            )
+    return _default_cache
+
+
+def stream_completion(client, model, messages, temperature, on_delta=None, current=None):
+    """Strömmar ett chat completion-svar och returnerar hela texten."""
+    stream = client.chat.completions.create(
+        model=model, messages=messages, temperature=temperature, stream=True,
+        stream_options={"include_usage": True},
+    )
+    parts = []
+    for event in stream:
+        if not event.choices:
+            # Sista händelsen har inga choices men bär tokenförbrukningen
+            if current is not None:
+                record_usage(current, model, getattr(event, "usage", None))
+            continue
+        delta = event.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            if on_delta:
+                on_delta(delta)
+    return "".join(parts)
+
+
+def chat_completion(client, model, messages, temperature, stream=False, on_delta=None, cache="default"):
+    """Gemensam ingång för alla chat completion-anrop, med svarscache framför API:et."""
+    if cache == "default":
+        cache = get_default_cache()
+    query_embedding = None
+    if cache is not None:
+        with span("llm", model=model, cache="hit") as current:
+            cached, query_embedding = cache.get(model, temperature, messages)
+            if cached is None:
+                current.labels["cache"] = "lookup"
+        if cached is not None:
+            if on_delta:
+                on_delta(cached)
+            return cached
+
+    with span("llm", model=model, cache="miss" if cache is not None else "off") as current:
+        if stream:
+            text = stream_completion(client, model, messages, temperature, on_delta, current)
+        else:
+            response = client.chat.completions.create(model=model, messages=messages, temperature=temperature)
+            record_usage(current, model, getattr(response, "usage", None))
+            text = response.choices[0].message.content
+
+    if cache is not None and text:
+        cache.put(model, temperature, messages, text, query_embedding)
+    return text
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "evict":
+        print(f"Tog bort {LLMCache(os.getenv('LLM_CACHE_DB', LLM_CACHE_DB)).evict()} rader")
+    else:
+        print(json.dumps(LLMCache(os.getenv("LLM_CACHE_DB", LLM_CACHE_DB)).stats(), indent=2))
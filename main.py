@@ -1,39 +1,102 @@
+import os
+import argparse
 from git_utils import clone_repo
-from analyzer import get_python_files, analyze_complexity, run_bandit
-from openai_utils import analyze_code_with_gpt
-from radon.complexity import cc_rank
+from analyzer import get_python_files
+from pipeline import run_pipeline, DEFAULT_JOBS, DEFAULT_LLM_JOBS
+from analysis_cache import AnalysisCache, CACHE_DB
+from diff_scope import get_git_changed_lines, scoped_regions, render_scoped_source
+from file_unit import get_unit
+from instrumentation import add_arguments, instrumented_run, run_options
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analysera alla Python-filer i ett repo")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help="Antal processer för radon/bandit")
+    parser.add_argument("--llm-jobs", type=int, default=DEFAULT_LLM_JOBS,
+                        help="Antal samtidiga GPT-anrop")
+    parser.add_argument("--cache", default=CACHE_DB,
+                        help="SQLite-fil för resultatcachen")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Kör alla analyser utan resultatcache")
+    parser.add_argument("--base", default=None,
+                        help="Analysera bara filer och funktioner som ändrats sedan base (t.ex. origin/main)")
+    parser.add_argument("--context", type=int, default=3,
+                        help="Antal kontextrader runt ändrade funktioner i diff-läge")
+    parser.add_argument("--depth", type=int, default=None,
+                        help="Grund historik i mirror-cachen")
+    parser.add_argument("--partial", action="store_true",
+                        help="Partiell klon (--filter=blob:none) i mirror-cachen")
+    parser.add_argument("--no-retrieval", action="store_true",
+                        help="Skicka inte relaterade commits och kodbitar ur repots embedding-store och kodindex till GPT")
+    add_arguments(parser)
+    return parser.parse_args()
+
+def scope_to_diff(repo_path, base, context):
+    # Bara berörda filer till radon/bandit, bara ändrade funktioner till GPT
+    files, llm_sources, scoped = [], {}, {}
+    for path, lines in sorted(get_git_changed_lines(repo_path, base).items()):
+        full_path = os.path.join(repo_path, path)
+        if not os.path.exists(full_path):
+            continue
+        code = get_unit(full_path).source
+        files.append(full_path)
+        regions = scoped_regions(code, lines, context)
+        if regions:
+            llm_sources[full_path] = render_scoped_source(code, regions)
+            scoped[full_path] = regions
+    return files, llm_sources, scoped
 
 def main():
-    repo_url = "https://github.com/gulcoder/code-review-bot.git"
-    pr_branch = "main"
+    args = parse_args()
+    with instrumented_run("analys", **run_options(args)):
+        repo_url = "https://github.com/gulcoder/code-review-bot.git"
+        pr_branch = "main"
+
+        repo = clone_repo(repo_url, pr_branch, depth=args.depth, partial=args.partial)
+        repo_path = repo.working_dir
+
+        python_files = get_python_files(repo_path)
+        llm_sources = regions = None
+        if args.base:
+            python_files, llm_sources, regions = scope_to_diff(repo_path, args.base, args.context)
+            print(f"Diff-läge: {len(python_files)} ändrade Python-filer sedan {args.base}.")
+        cache = None if args.no_cache else AnalysisCache(args.cache)
+        from radon.complexity import cc_rank
+        from radon.metrics import mi_rank
 
-    repo = clone_repo(repo_url, pr_branch)
-    repo_path = repo.working_dir
+        for file, result in run_pipeline(python_files, jobs=args.jobs, llm_jobs=args.llm_jobs, cache=cache,
+                                         llm_sources=llm_sources, retrieval=not args.no_retrieval,
+                                         regions=regions, repo_path=repo_path):
+            print(f"\nAnalyserar {file}...")
 
-    python_files = get_python_files(repo_path)
+            for error in result["errors"]:
+                print(f"❌ {error}")
 
-    for file in python_files:
-        with open(file, "r") as f:
-            code = f.read()
+            # GPT-4 feedback
+            print("--- GPT-4 Feedback ---")
+            print(result["feedback"])
 
-        print(f"\nAnalyserar {file}...")
+            # Komplexitet
+            print("--- Komplexitet (Radon) ---")
+            for item in result["complexity"]:
+                print(f"{item['name']}: {item['complexity']} ({cc_rank(item['complexity'])})")
+            if result["maintainability"] is not None:
+                mi = result["maintainability"]
+                print(f"Maintainability index: {mi:.1f} ({mi_rank(mi)}), {result['raw']['sloc']} SLOC")
 
-        # GPT-4 feedback
-        feedback = analyze_code_with_gpt(code, file)
-        print("--- GPT-4 Feedback ---")
-        print(feedback)
+            # Lokala regler
+            print("--- Lokala regler ---")
+            for finding in result["rules"]:
+                print(f"{finding['line']}: [{finding['rule']}] {finding['message']}")
 
-        # Komplexitet
-        print("--- Komplexitet (Radon) ---")
-        complexity = analyze_complexity(file)
-        for item in complexity:
-            print(f"{item.name}: {item.complexity} ({cc_rank(item.complexity)})")
+            # Säkerhetsproblem
+            print("--- Säkerhet (Bandit) ---")
+            for issue in result["issues"]:
+                print(f"{issue['test_id']} - {issue['text']}")
 
-        # Säkerhetsproblem
-        print("--- Säkerhet (Bandit) ---")
-        issues = run_bandit(file)
-        for issue in issues:
-            print(f"{issue.test_id} - {issue.text}")
+        if cache is not None:
+            cache.print_stats()
+            cache.close()
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,10 @@
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
+import hashlib
+from clients import get_openai_client
+from review_engine import chunk_source, review_chunks, merge_reviews, MAX_CHUNK_TOKENS
 
-load_dotenv()
-client=OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
-
-def analyze_code_with_gpt(code_snippet, filename):
-    prompt = f"""
+MODEL = "gpt-4"
+TEMPERATURE = 0.3
+PROMPT_TEMPLATE = """
     Du är en erfaren Python-kodgranskare. Analysera följande fil: {filename}.
     Ge feedback om:
     - Kodstil
@@ -17,9 +15,27 @@ def analyze_code_with_gpt(code_snippet, filename):
     Kod:
     {code_snippet}
     """
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3
-    )
-    return response.choices[0].message.content
+CONTEXT_TEMPLATE = """
+    Relaterade tidigare ändringar i kodbasen, för att följa dess arkitektur och stil:
+    {context}
+    """
+
+def prompt_hash(filename, context=""):
+    # Identifierar prompten utan koden; koden själv ingår i cachens innehållshash
+    text = f"{MODEL}|{TEMPERATURE}|{PROMPT_TEMPLATE}|{MAX_CHUNK_TOKENS}|{filename}|{context}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def analyze_code_with_gpt(code_snippet, filename, on_chunk=None, on_delta=None, context=""):
+    # Stora filer delas längs funktioner/klasser och granskas bit för bit parallellt
+    chunks = chunk_source(code_snippet) or [{"start": 1, "end": 1, "label": "hela filen", "text": code_snippet}]
+
+    def build_messages(chunk):
+        name = filename if len(chunks) == 1 else f"{filename} (rader {chunk['start']}-{chunk['end']})"
+        prompt = PROMPT_TEMPLATE.format(filename=name, code_snippet=chunk["text"])
+        if context:
+            prompt = CONTEXT_TEMPLATE.format(context=context) + prompt
+        return [{"role": "user", "content": prompt}]
+
+    texts = review_chunks(chunks, build_messages, get_openai_client(), MODEL, TEMPERATURE,
+                          on_chunk=on_chunk, on_delta=on_delta)
+    return merge_reviews(chunks, texts)
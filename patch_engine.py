@@ -0,0 +1,275 @@
+import os
+import re
+from file_unit import split_lines
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+# Hur långt från angiven rad en hunk får hittas (GPT-genererade radnummer är ofta ungefärliga)
+MAX_OFFSET = 200
+# Antal kontextrader som får släppas i varje ände, som `patch --fuzz`
+FUZZ = 2
+
+
+def _strip_prefix(path):
+    path = path.split("\t")[0].strip()
+    if path.startswith(("a/", "b/")):
+        return path[2:]
+    return path
+
+
+def parse_patch(text):
+    """
+    Läser en unified diff, med eller utan filhuvuden (---/+++), och returnerar
+    [{"path", "old_path", "hunks"}]. Varje hunk är {"old_start", "lines"} där
+    lines är (tagg, text) med taggen " ", "-" eller "+". old_start är None om
+    hunkhuvudet saknar radnummer eller helt saknas.
+    """
+    files = []
+    current = None
+    hunk = None
+    remaining = None
+    old_path = None
+
+    for raw in split_lines(text):
+        if hunk is not None and remaining and raw[:1] in (" ", "-", "+", ""):
+            # Inne i en hunk med kända radantal: även "--- x" är en borttagen rad
+            tag = raw[:1] or " "
+            hunk["lines"].append((tag, raw[1:]))
+            remaining[0] -= tag != "+"
+            remaining[1] -= tag != "-"
+            if remaining[0] <= 0 and remaining[1] <= 0:
+                # Angivna antal är förbrukade; fortsätt läsa förlåtande om GPT räknat fel
+                remaining = None
+            continue
+        if raw.startswith("diff --git ") or raw.startswith("index "):
+            hunk = None
+            continue
+        if raw.startswith("--- "):
+            old_path = _strip_prefix(raw[4:])
+            hunk = None
+            continue
+        if raw.startswith("+++ ") and old_path is not None:
+            new_path = _strip_prefix(raw[4:])
+            current = {
+                "path": old_path if new_path == "/dev/null" else new_path,
+                "old_path": old_path,
+                "new_path": new_path,
+                "hunks": [],
+            }
+            files.append(current)
+            old_path = None
+            continue
+        if raw.startswith("@@"):
+            if current is None:
+                current = {"path": None, "old_path": None, "new_path": None, "hunks": []}
+                files.append(current)
+            m = HUNK_HEADER_RE.match(raw)
+            hunk = {"old_start": int(m.group(1)) if m else None, "lines": []}
+            remaining = None
+            if m:
+                remaining = [int(m.group(2) or 1), int(m.group(4) or 1)]
+                if remaining[0] <= 0 and remaining[1] <= 0:
+                    remaining = None
+            current["hunks"].append(hunk)
+            continue
+        if raw.startswith("\\"):
+            continue
+        if hunk is None:
+            if raw[:1] not in (" ", "-", "+"):
+                continue
+            # Diff utan @@-huvud: en hunk som placeras enbart via sin kontext
+            if current is None:
+                current = {"path": None, "old_path": None, "new_path": None, "hunks": []}
+                files.append(current)
+            hunk = {"old_start": None, "lines": []}
+            current["hunks"].append(hunk)
+        if raw[:1] in (" ", "-", "+"):
+            hunk["lines"].append((raw[:1], raw[1:]))
+        elif raw == "":
+            hunk["lines"].append((" ", ""))
+
+    for patch in files:
+        for h in patch["hunks"]:
+            # Tomma rader som följer med i slutet av ett kodblock är inte kontext
+            while h["lines"] and h["lines"][-1] == (" ", ""):
+                h["lines"].pop()
+        patch["hunks"] = [h for h in patch["hunks"] if any(tag != " " for tag, _ in h["lines"])]
+    return files
+
+
+def _trim(lines, fuzz):
+    """Släpper upp till fuzz kontextrader i början och slutet av hunken."""
+    lead = 0
+    while lead < fuzz and lead < len(lines) and lines[lead][0] == " ":
+        lead += 1
+    trail = 0
+    while trail < fuzz and trail < len(lines) - lead and lines[-1 - trail][0] == " ":
+        trail += 1
+    return lines[lead:len(lines) - trail], lead
+
+
+def _matches(lines, pos, block, loose):
+    if loose:
+        return all(lines[pos + i].strip() == text.strip() for i, text in enumerate(block))
+    return lines[pos:pos + len(block)] == block
+
+
+def _find(lines, block, expected, lo, max_offset):
+    """Söker blocket utåt från expected; exakt först, sedan utan hänsyn till blanktecken."""
+    hi = len(lines) - len(block)
+    if hi < lo:
+        return None
+    if expected is None:
+        expected, max_offset = lo, hi - lo
+    expected = min(max(expected, lo), hi)
+    for loose in (False, True):
+        for delta in range(max_offset + 1):
+            for pos in {expected - delta, expected + delta}:
+                if lo <= pos <= hi and _matches(lines, pos, block, loose):
+                    return pos
+            if expected - delta < lo and expected + delta > hi:
+                break
+    return None
+
+
+def _locate(lines, hunk, drift, lo, fuzz, max_offset):
+    expected = hunk["old_start"] - 1 + drift if hunk["old_start"] is not None else None
+    for f in range(fuzz + 1):
+        trimmed, lead = _trim(hunk["lines"], f)
+        block = [text for tag, text in trimmed if tag != "+"]
+        if not block:
+            # Ren insättning utan kontext: bara radnumret kan placera den
+            # (i "@@ -5,0 +6 @@" betyder 5 raden som insättningen följer efter)
+            if expected is None:
+                return None
+            pos = expected + 1 if all(tag == "+" for tag, _ in hunk["lines"]) else expected + lead
+            if not lo <= pos <= len(lines):
+                return None
+            return pos, trimmed, lead
+        pos = _find(lines, block, None if expected is None else expected + lead, lo, max_offset)
+        if pos is not None:
+            return pos, trimmed, lead
+    return None
+
+
+def apply_hunks(code, hunks, fuzz=FUZZ, max_offset=MAX_OFFSET):
+    """
+    Applicerar hunkarna på koden och returnerar (ny_kod, applicerade, avvisade).
+    Varje hunk letas upp i ett fönster runt sin angivna rad, så kostnaden
+    följer hunkstorleken. En hunk som inte hittas, eller som överlappar en
+    annan hunk, avvisas. Raderna räknas som ast och rule_engine räknar dem
+    (\r\n, \r och \n); varje oförändrad rad behåller sitt eget radslut och
+    nya rader får filens vanligaste.
+    """
+    raw_lines = split_lines(code, keepends=True)
+    lines = [line.rstrip("\r\n") for line in raw_lines]
+    endings = [raw[len(text):] for raw, text in zip(raw_lines, lines)]
+    newline = max(("\n", "\r\n", "\r"), key=endings.count)
+    located = []
+    rejected = []
+    drift = 0
+    for i, hunk in enumerate(hunks):
+        found = _locate(lines, hunk, drift, 0, fuzz, max_offset)
+        if found is None:
+            rejected.append(hunk)
+            continue
+        pos, trimmed, lead = found
+        end = pos + sum(1 for tag, _ in trimmed if tag != "+")
+        located.append((pos, end, i, trimmed, hunk))
+        if hunk["old_start"] is not None and end > pos:
+            drift = pos - lead - (hunk["old_start"] - 1)
+
+    out = []
+    cursor = 0
+    applied = []
+    for pos, end, _, trimmed, hunk in sorted(located, key=lambda h: (h[0], h[2])):
+        if pos < cursor:
+            rejected.append(hunk)
+            continue
+        out.extend(raw_lines[cursor:pos])
+        for tag, text in trimmed:
+            if tag == " ":
+                # Behåll filens egen rad, den kan skilja i blanktecken och radslut
+                out.append(raw_lines[pos])
+                pos += 1
+            elif tag == "-":
+                pos += 1
+            else:
+                out.append(text + newline)
+        cursor = pos
+        applied.append(hunk)
+
+    if not applied:
+        return code, applied, rejected
+    out.extend(raw_lines[cursor:])
+    # En rad som var sist i filen utan radslut kan ha hamnat mitt i
+    out = [line if line.endswith(("\n", "\r")) else line + newline for line in out]
+    if out and code and not code.endswith(("\n", "\r")):
+        out[-1] = out[-1].rstrip("\r\n")
+    return "".join(out), applied, rejected
+
+
+def render_hunk(hunk):
+    header = f"@@ -{hunk['old_start']} @@" if hunk["old_start"] is not None else "@@"
+    return "\n".join([header] + [tag + text for tag, text in hunk["lines"]])
+
+
+def apply_patches(file_patches, repo_path=".", dry_run=False, fuzz=FUZZ):
+    """
+    Applicerar patchar för många filer i ett svep: varje fil läses och skrivs
+    en gång även om flera patchar rör den. Med dry_run skrivs ingenting och
+    resultatet kan granskas (och sedan skrivas med write_results).
+    Returnerar [{"path", "applied", "rejected", "new_text", "created"}].
+    """
+    grouped = {}
+    for patch in file_patches:
+        if not patch.get("path"):
+            raise ValueError("Patchen saknar filnamn")
+        entry = grouped.setdefault(patch["path"], {"hunks": [], "created": False})
+        entry["hunks"].extend(patch["hunks"])
+        entry["created"] |= patch.get("old_path") == "/dev/null"
+
+    results = []
+    for path, entry in grouped.items():
+        full_path = os.path.join(repo_path, path)
+        if os.path.exists(full_path):
+            with open(full_path, "r", newline="") as f:
+                original = f.read()
+        elif entry["created"]:
+            original = ""
+        else:
+            results.append({"path": path, "applied": [], "rejected": entry["hunks"],
+                            "new_text": None, "created": False})
+            continue
+        new_text, applied, rejected = apply_hunks(original, entry["hunks"], fuzz)
+        results.append({
+            "path": path,
+            "applied": applied,
+            "rejected": rejected,
+            "new_text": new_text if applied and new_text != original else None,
+            "created": entry["created"] and not original,
+        })
+    if not dry_run:
+        write_results(results, repo_path)
+    return results
+
+
+def write_results(results, repo_path="."):
+    written = []
+    for result in results:
+        if result["new_text"] is None:
+            continue
+        full_path = os.path.join(repo_path, result["path"])
+        os.makedirs(os.path.dirname(full_path) or ".", exist_ok=True)
+        with open(full_path, "w", newline="") as f:
+            f.write(result["new_text"])
+        written.append(result["path"])
+    return written
+
+
+def print_results(results):
+    for result in results:
+        status = "ändras" if result["new_text"] is not None else "oförändrad"
+        print(f"{result['path']}: {len(result['applied'])} hunkar applicerade, "
+              f"{len(result['rejected'])} avvisade ({status})")
+        for hunk in result["rejected"]:
+            print(f"  ❌ Avvisad hunk:\n{render_hunk(hunk)}")
@@ -0,0 +1,146 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from importlib import metadata
+from analyzer import run_bandit_files, run_radon_files
+from analysis_cache import content_hash
+from file_unit import get_unit
+from openai_utils import analyze_code_with_gpt, prompt_hash, MODEL
+from retrieval import retrieve_contexts
+from review_engine import set_llm_jobs
+from rule_engine import check_source, only_local, format_findings
+from instrumentation import span, observe, timed_call
+
+DEFAULT_JOBS = os.cpu_count() or 1
+DEFAULT_LLM_JOBS = 4
+
+def _result(future, label):
+    if future is None:
+        return None, None
+    try:
+        return future.result(), None
+    except Exception as e:
+        return None, f"{label} misslyckades: {e}"
+
+def _observe_shard(future, stage, files):
+    # Sharden körs i en worker-process; tiden mäts där och kommer tillbaka med resultatet
+    if future.exception() is None:
+        observe(stage, future.result()[1], files=files)
+    else:
+        observe(stage, 0.0, error=True, files=files)
+
+def _submit_shards(pool, func, stage, paths, codes, jobs):
+    """Delar paths i högst jobs shards som körs med func i processpoolen; ger {fil: future}."""
+    shards = max(1, min(jobs, len(paths)))
+    futures = {}
+    for i in range(shards):
+        shard = paths[i::shards]
+        if not shard:
+            continue
+        future = pool.submit(timed_call, func, shard, {f: codes[f] for f in shard})
+        future.add_done_callback(lambda fut, n=len(shard): _observe_shard(fut, stage, n))
+        futures.update((f, future) for f in shard)
+    return futures
+
+def _cached(cache, digest, tool, version, prompt=""):
+    if cache is None:
+        return None
+    return cache.get(digest, tool, version, prompt)
+
+def run_pipeline(files, jobs=DEFAULT_JOBS, llm_jobs=DEFAULT_LLM_JOBS, cache=None, llm_sources=None,
+                 retrieval=False, regions=None, repo_path="."):
+    """
+    Läser och parsar varje fil en gång (FileUnit) och kör bandit och radon i
+    en körning per shard i en processpool (med källkoden ur FileUnit) samt
+    GPT-anropen i en trådpool (högst llm_jobs samtidiga anrop, även räknat
+    över filernas delbitar). Resultaten ges i samma ordning som files så
+    fort de är klara. Med en AnalysisCache körs bara
+    filer vars innehåll (eller verktygsversion/prompt) har ändrats.
+    llm_sources kan ersätta filinnehållet som skickas till GPT, t.ex. med
+    bara de ändrade funktionerna i diff-läge. Med retrieval hämtas relaterade
+    commits och kodbitar ur repo_paths embedding-store och kodindex för alla filer i ett svep
+    och läggs i prompten.
+    Lokala AST-regler körs alltid; bara filer där reglernas fynd täcker
+    varje ändrad region (regions per fil, annars varje toppnivåblock)
+    skickas inte till GPT.
+    """
+    files = list(files)
+    with span("read") as current:
+        current.add(files=len(files))
+        units = {f: get_unit(f) for f in files}
+    codes = {f: unit.source for f, unit in units.items()}
+    digests = {f: unit.hash for f, unit in units.items()}
+    llm_codes = {f: (llm_sources or {}).get(f, codes[f]) for f in files}
+    with span("rules") as current:
+        current.add(files=len(files))
+        rules = {f: check_source(unit.source, f, unit.tree) for f, unit in units.items()}
+    local_only = {f for f in files if only_local(rules[f], (regions or {}).get(f))}
+    llm_files = [f for f in files if f not in local_only]
+    contexts = {}
+    if retrieval:
+        with span("retrieval") as current:
+            current.add(files=len(llm_files))
+            contexts = retrieve_contexts({f: llm_codes[f] for f in llm_files}, repo_path)
+
+    # Versionerna ur paketmetadata, så att radon och bandit inte importeras vid full cacheträff
+    radon_version, bandit_version = metadata.version("radon"), metadata.version("bandit")
+    keys = {
+        f: {
+            "radon": (digests[f], "radon", f"{radon_version}+mi", ""),
+            "bandit": (digests[f], "bandit", bandit_version, ""),
+            "llm": (content_hash(llm_codes[f]), "llm", MODEL, prompt_hash(f, contexts.get(f, ""))),
+        }
+        for f in files
+    }
+    cached = {
+        f: {tool: _cached(cache, *key) for tool, key in keys[f].items() if not (tool == "llm" and f in local_only)}
+        for f in files
+    }
+    for f in local_only:
+        cached[f]["llm"] = "Lokala regler räckte, ingen GPT-granskning:\n" + format_findings(rules[f]["findings"])
+
+    jobs = max(1, jobs)
+    set_llm_jobs(llm_jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as local_pool, \
+            ThreadPoolExecutor(max_workers=max(1, llm_jobs)) as llm_pool:
+        bandit_shard = _submit_shards(local_pool, run_bandit_files, "bandit",
+                                      [f for f in files if cached[f]["bandit"] is None], codes, jobs)
+        radon_shard = _submit_shards(local_pool, run_radon_files, "radon",
+                                     [f for f in files if cached[f]["radon"] is None], codes, jobs)
+        llm_futures = {
+            f: llm_pool.submit(analyze_code_with_gpt, llm_codes[f], f, context=contexts.get(f, ""))
+            for f in files if cached[f]["llm"] is None
+        }
+
+        for filepath in files:
+            results = dict(cached[filepath])
+            fresh = {}
+            fresh["llm"], llm_error = _result(llm_futures.get(filepath), "GPT-analys")
+            shard_result, complexity_error = _result(radon_shard.get(filepath), "Radon")
+            if shard_result is not None:
+                metrics = shard_result[0][filepath]
+                if "error" in metrics:
+                    complexity_error = f"Radon misslyckades: {metrics['error']}"
+                else:
+                    fresh["radon"] = metrics
+            shard_result, bandit_error = _result(bandit_shard.get(filepath), "Bandit")
+            if shard_result is not None:
+                fresh["bandit"] = shard_result[0].get(filepath, [])
+
+            for tool, value in fresh.items():
+                if value is None:
+                    continue
+                results[tool] = value
+                if cache is not None:
+                    digest, _, version, prompt = keys[filepath][tool]
+                    cache.put(digest, tool, version, value, prompt)
+
+            metrics = results["radon"] or {}
+            yield filepath, {
+                "feedback": results["llm"],
+                "complexity": metrics.get("complexity", []),
+                "maintainability": metrics.get("maintainability"),
+                "raw": metrics.get("raw"),
+                "issues": results["bandit"] or [],
+                "rules": rules[filepath]["findings"],
+                "errors": [e for e in (llm_error, complexity_error, bandit_error) if e],
+            }
@@ -0,0 +1,182 @@
+import os
+import threading
+import subprocess
+from collections import OrderedDict
+from analysis_cache import content_hash
+from clients import get_openai_client
+from batch_embedder import BatchEmbedder, estimate_tokens, truncate_text
+
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+CONTEXT_TOKENS = int(os.getenv("RETRIEVAL_CONTEXT_TOKENS", "1500"))
+MIN_SCORE = 0.3
+SNIPPET_TOKENS = 600
+MIN_PART_TOKENS = 100
+# Återanvänds mellan filer och anrop i samma process, som begränsade LRU:er
+QUERY_CACHE_SIZE = 256
+SNIPPET_CACHE_SIZE = 512
+
+_query_embeddings = OrderedDict()
+_snippets = OrderedDict()
+_lock = threading.Lock()
+
+
+def _memo_get(memo, key):
+    with _lock:
+        value = memo.get(key)
+        if value is not None:
+            memo.move_to_end(key)
+        return value
+
+
+def _memo_put(memo, key, value, max_size):
+    with _lock:
+        memo[key] = value
+        memo.move_to_end(key)
+        while len(memo) > max_size:
+            memo.popitem(last=False)
+
+
+def embed_queries(texts, client=None):
+    """Embeddar alla texter i ett batchanrop; nyligen embeddade texter hämtas ur minnet."""
+    digests = [content_hash(text) for text in texts]
+    vectors = {}
+    missing = {}
+    for digest, text in zip(digests, texts):
+        vector = _memo_get(_query_embeddings, digest)
+        if vector is None:
+            missing.setdefault(digest, text)
+        else:
+            vectors[digest] = vector
+    if missing:
+        if client is None:
+            client = get_openai_client()
+        for digest, vector in zip(missing, BatchEmbedder(client).embed(list(missing.values()))):
+            vectors[digest] = vector
+            _memo_put(_query_embeddings, digest, vector, QUERY_CACHE_SIZE)
+    return [vectors[digest] for digest in digests]
+
+
+def commit_snippet(sha, repo_path):
+    """Commitens meddelande och diff ur repot i repo_path, kapad till SNIPPET_TOKENS."""
+    key = (os.path.abspath(repo_path), sha)
+    snippet = _memo_get(_snippets, key)
+    if snippet is None:
+        result = subprocess.run(
+            ["git", "show", "--unified=0", "--no-color", "--format=%B", sha],
+            cwd=repo_path, capture_output=True, text=True, errors="replace",
+        )
+        text = result.stdout.strip() if result.returncode == 0 else ""
+        snippet = truncate_text(text, SNIPPET_TOKENS) if text else ""
+        _memo_put(_snippets, key, snippet, SNIPPET_CACHE_SIZE)
+    return snippet
+
+
+def relative_path(name, repo_path):
+    """Frågans filnamn relativt repots rot, i samma form som code_indexer sparar sökvägarna."""
+    path = str(name)
+    if os.path.isabs(path):
+        path = os.path.relpath(path, os.path.abspath(repo_path))
+    return os.path.normpath(path)
+
+
+_code_engine = None
+_code_engine_key = None
+
+
+def load_code_engine(db_path=None, repo_path="."):
+    """
+    SearchEngine över kodbitarna från code_indexer; byggs om när databasen
+    ändrats. Utan db_path läses CODE_DB i roten av repo_path.
+    """
+    global _code_engine, _code_engine_key
+    from code_indexer import CODE_DB
+    from embedding_cache import create_db, load_code_chunks
+    from search_engine import SearchEngine
+
+    db_path = db_path or os.path.join(repo_path, CODE_DB)
+    if not os.path.exists(db_path):
+        return None, []
+    key = (os.path.abspath(db_path), os.path.getmtime(db_path))
+    if _code_engine is None or _code_engine_key != key:
+        conn = create_db(db_path)
+        rows = load_code_chunks(conn)
+        conn.close()
+        if not rows:
+            return None, []
+        engine = SearchEngine(range(len(rows)), [row["embedding"] for row in rows])
+        _code_engine = (engine, rows)
+        _code_engine_key = key
+    return _code_engine
+
+
+def pack_context(candidates, budget=CONTEXT_TOKENS):
+    """
+    Lägger till kandidater (poäng, rubrik, snippet) i poängordning så länge de
+    ryms i tokenbudgeten. snippet kan vara en funktion så att git bara anropas
+    för träffar som faktiskt kommer med.
+    """
+    parts, used = [], 0
+    for score, header, snippet in sorted(candidates, key=lambda c: -c[0]):
+        if score < MIN_SCORE:
+            continue
+        snippet = snippet() if callable(snippet) else snippet
+        if not snippet:
+            continue
+        part = f"### {header} (likhet {score:.2f})\n{snippet}"
+        tokens = estimate_tokens(part)
+        if used + tokens > budget:
+            # Kapa hellre sista träffen än att lämna budgeten oanvänd
+            if budget - used < MIN_PART_TOKENS:
+                break
+            part = truncate_text(part, budget - used)
+            tokens = estimate_tokens(part)
+        parts.append(part)
+        used += tokens
+    return "\n\n".join(parts)
+
+
+def retrieve_contexts(queries, repo_path, top_k=TOP_K, budget=CONTEXT_TOKENS, engine=None, client=None,
+                      code_engine=None):
+    """
+    Hämtar relaterade commits (embedding-storen) och kodbitar (code_indexer)
+    för varje fil. queries är {filnamn: diff eller kod} med filnamn relativa
+    repo_path eller absoluta; storen, kodindexet och commitarna läses ur
+    repo_path, inte ur arbetskatalogen. Alla frågor embeddas i ett batchanrop
+    och poängsätts i ett svep per källa. Returnerar
+    {filnamn: kontexttext} (tom sträng utan träffar).
+    """
+    contexts = {name: "" for name in queries}
+    if engine is None:
+        from search_cache import load_engine
+        engine = load_engine(repo_path)
+    code_engine, code_rows = code_engine or load_code_engine(repo_path=repo_path)
+    engines = [e for e in (engine, code_engine) if e is not None and len(e)]
+    if not engines or not queries:
+        return contexts
+    names = list(queries)
+    try:
+        vectors = embed_queries([queries[name] for name in names], client)
+    except Exception as e:
+        print(f"⚠️ Kunde inte embedda frågorna för kontextsökning: {e}")
+        return contexts
+
+    candidates = {name: [] for name in names}
+    if engine is not None and len(engine):
+        for name, hits in zip(names, engine.search_batch(vectors, top_k)):
+            candidates[name].extend(
+                (score, f"Commit {sha[:10]}", lambda sha=sha: commit_snippet(sha, repo_path))
+                for sha, score in hits
+            )
+    if code_engine is not None and len(code_engine):
+        # Hämta några extra så att filens egna bitar kan sorteras bort
+        for name, hits in zip(names, code_engine.search_batch(vectors, top_k * 3)):
+            own = relative_path(name, repo_path)
+            kept = [(code_rows[i], score) for i, score in hits if os.path.normpath(code_rows[i]["path"]) != own]
+            candidates[name].extend(
+                (score, f"{row['path']} rader {row['start']}-{row['end']} ({row['label']})",
+                 truncate_text(row["text"], SNIPPET_TOKENS))
+                for row, score in kept[:top_k]
+            )
+    for name in names:
+        contexts[name] = pack_context(candidates[name], budget)
+    return contexts
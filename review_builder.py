@@ -0,0 +1,58 @@
+MAX_COMMENTS_PER_REVIEW = 50
+
+
+class ReviewBuilder:
+    """
+    Samlar alla inline-förslag för en PR och skickar dem som en eller ett fåtal
+    pull request-reviews i stället för ett POST-anrop per kommentar.
+    """
+
+    def __init__(self, pr, github, max_comments=MAX_COMMENTS_PER_REVIEW):
+        self.pr = pr
+        self.github = github
+        self.max_comments = max_comments
+        self.comments = []
+
+    def add(self, path, line, body, side="RIGHT"):
+        self.comments.append({"path": path, "line": line, "side": side, "body": body})
+
+    def __len__(self):
+        return len(self.comments)
+
+    def _existing_keys(self):
+        url = self.pr.get("review_comments_url") or self.pr["url"] + "/comments"
+        return {
+            (c.get("path"), c.get("line"), c.get("body", "").strip())
+            for c in self.github.get_all(url)
+        }
+
+    def pending(self):
+        # Hoppa över dubbletter, både inom denna körning och mot befintliga kommentarer
+        seen = self._existing_keys()
+        unique = []
+        for comment in self.comments:
+            key = (comment["path"], comment["line"], comment["body"].strip())
+            if key not in seen:
+                seen.add(key)
+                unique.append(comment)
+        return unique
+
+    def submit(self, body="Automatisk granskning från AutoReview-Bot.", event="COMMENT"):
+        comments = self.pending()
+        if not comments:
+            print("Inga nya inline-förslag att skicka.")
+            return []
+
+        chunks = [comments[i:i + self.max_comments] for i in range(0, len(comments), self.max_comments)]
+        reviews = []
+        for n, chunk in enumerate(chunks, 1):
+            review_body = body if len(chunks) == 1 else f"{body} (del {n}/{len(chunks)})"
+            reviews.append(self.github.post(self.pr["url"] + "/reviews", {
+                "commit_id": self.pr["head"]["sha"],
+                "body": review_body,
+                "event": event,
+                "comments": chunk,
+            }))
+        print(f"Skickade {len(comments)} inline-förslag i {len(reviews)} review(s).")
+        self.comments = []
+        return reviews
@@ -0,0 +1,158 @@
+import ast
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from batch_embedder import estimate_tokens
+from llm_cache import chat_completion
+from file_unit import split_lines
+
+MAX_CHUNK_TOKENS = 3000
+REVIEW_JOBS = 4
+# Gemensamt tak för samtidiga granskningsanrop i processen, även när review_chunks
+# körs från flera trådar (t.ex. pipelinens LLM-pool); sätts med set_llm_jobs
+_llm_slots = threading.BoundedSemaphore(REVIEW_JOBS)
+
+
+def set_llm_jobs(jobs):
+    global _llm_slots
+    _llm_slots = threading.BoundedSemaphore(max(1, jobs))
+
+
+def _node_start(node):
+    return min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+
+
+def _label(node, prefix):
+    name = getattr(node, "name", None)
+    return f"{prefix}{name}" if name else "modulnivå"
+
+
+def _split_lines(lines, start, end, max_tokens, label):
+    units, current_start, current_tokens = [], start, 0
+    for n in range(start, end + 1):
+        tokens = estimate_tokens(lines[n - 1])
+        if n > current_start and current_tokens + tokens > max_tokens:
+            units.append((current_start, n - 1, f"{label} (del {len(units) + 1})"))
+            current_start, current_tokens = n, 0
+        current_tokens += tokens
+    units.append((current_start, end, f"{label} (del {len(units) + 1})" if units else label))
+    return units
+
+
+def _units(nodes, lines, max_tokens, prefix=""):
+    units = []
+    for node in nodes:
+        start, end = _node_start(node), node.end_lineno
+        label = _label(node, prefix)
+        if estimate_tokens("".join(lines[start - 1:end])) <= max_tokens:
+            units.append((start, end, label))
+        elif isinstance(node, ast.ClassDef) and node.body:
+            # För stor klass: klasshuvudet för sig och sedan metod för metod
+            body_start = _node_start(node.body[0])
+            if body_start > start:
+                units.append((start, body_start - 1, f"{label} (huvud)"))
+            units.extend(_units(node.body, lines, max_tokens, f"{node.name}."))
+        else:
+            units.extend(_split_lines(lines, start, end, max_tokens, label))
+    return units
+
+
+def chunk_source(code, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    Delar upp koden längs AST-gränser (funktioner och klasser) i bitar under
+    max_tokens. Bitarna täcker hela filen; kommentarer mellan definitioner
+    följer med nästa bit. Returnerar [{"start", "end", "label", "text"}].
+    """
+    lines = split_lines(code, keepends=True)
+    if not lines:
+        return []
+    if estimate_tokens(code) <= max_tokens:
+        return [{"start": 1, "end": len(lines), "label": "hela filen", "text": code}]
+    try:
+        units = _units(ast.parse(code).body, lines, max_tokens)
+    except SyntaxError:
+        units = []
+    if not units:
+        units = _split_lines(lines, 1, len(lines), max_tokens, "rader")
+
+    # Gör intervallen sammanhängande så att inga rader faller bort
+    covered = []
+    previous_end = 0
+    for i, (start, end, label) in enumerate(units):
+        end = len(lines) if i == len(units) - 1 else end
+        covered.append((previous_end + 1, end, label))
+        previous_end = end
+
+    # Packa ihop små grannbitar så länge de ryms i budgeten
+    chunks = []
+    for start, end, label in covered:
+        text = "".join(lines[start - 1:end])
+        if chunks and estimate_tokens(chunks[-1]["text"] + text) <= max_tokens:
+            chunks[-1]["end"] = end
+            if label not in chunks[-1]["label"].split(", "):
+                chunks[-1]["label"] += f", {label}"
+            chunks[-1]["text"] += text
+        else:
+            chunks.append({"start": start, "end": end, "label": label, "text": text})
+    return chunks
+
+
+def definition_chunks(code, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    En bit per toppnivåfunktion och klass, oavsett filens storlek; bara
+    definitioner över max_tokens delas (som i chunk_source). Modulkod i följd
+    blir en egen bit. Grannar packas inte ihop och rader mellan
+    definitionerna tas inte med. Returnerar [{"start", "end", "label", "text"}].
+    """
+    lines = split_lines(code, keepends=True)
+    try:
+        units = _units(ast.parse(code).body, lines, max_tokens)
+    except SyntaxError:
+        units = _split_lines(lines, 1, len(lines), max_tokens, "rader") if lines else []
+
+    chunks = []
+    for start, end, label in units:
+        text = "".join(lines[start - 1:end])
+        previous = chunks[-1] if chunks else None
+        if previous and label == previous["label"] == "modulnivå" \
+                and estimate_tokens(previous["text"] + text) <= max_tokens:
+            previous["end"] = end
+            previous["text"] = "".join(lines[previous["start"] - 1:end])
+        else:
+            chunks.append({"start": start, "end": end, "label": label, "text": text})
+    return chunks
+
+
+def review_chunks(chunks, build_messages, client, model, temperature, jobs=REVIEW_JOBS,
+                  on_chunk=None, on_delta=None):
+    """
+    Granskar bitarna samtidigt med strömmande anrop (via svarscachen).
+    Anropen delar processens tak från set_llm_jobs, så nästlade anrop inte
+    multiplicerar samtidigheten. on_chunk(chunk, text) anropas så fort en
+    bit är klar; returvärdet är texterna i samma ordning som chunks.
+    """
+    slots = _llm_slots
+
+    def review(chunk):
+        delta_cb = (lambda delta: on_delta(chunk, delta)) if on_delta else None
+        with slots:
+            return chat_completion(client, model, build_messages(chunk), temperature, stream=True,
+                                   on_delta=delta_cb)
+
+    results = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(chunks)))) as pool:
+        futures = {pool.submit(review, chunk): i for i, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if on_chunk:
+                on_chunk(chunks[i], results[i])
+    return results
+
+
+def merge_reviews(chunks, texts):
+    if len(chunks) == 1:
+        return texts[0]
+    return "\n\n".join(
+        f"## Rader {chunk['start']}-{chunk['end']} ({chunk['label']})\n{text.strip()}"
+        for chunk, text in zip(chunks, texts)
+    )
@@ -0,0 +1,334 @@
+import ast
+import difflib
+import re
+from file_unit import split_lines
+
+# nodtyp -> [regelfunktioner]; fylls av @rule
+RULES = {}
+# Filer med fynd och som mest så här komplexa funktioner granskas inte av GPT
+SIMPLE_COMPLEXITY = 5
+BRANCH_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.Try, ast.ExceptHandler, ast.With,
+                ast.AsyncWith, ast.BoolOp, ast.IfExp, ast.comprehension, ast.Assert)
+MUTABLE_CALLS = ("list", "dict", "set")
+
+
+def rule(rule_id, *node_types):
+    """
+    Registrerar en regel för nodtyperna. Regeln anropas som func(node, ctx)
+    under den gemensamma AST-genomgången och returnerar fynd (eller None).
+    """
+    def register(func):
+        func.rule_id = rule_id
+        for node_type in node_types:
+            RULES.setdefault(node_type, []).append(func)
+        return func
+    return register
+
+
+def _char_col(line, col):
+    # AST:ns kolumner är byte-offset i UTF-8
+    return len(line.encode("utf-8")[:col].decode("utf-8", errors="ignore"))
+
+
+def edit(ctx, lineno, col, end_lineno, end_col, text):
+    """Ersätter källtexten mellan två AST-positioner med text."""
+    return {
+        "line": lineno,
+        "col": _char_col(ctx["lines"][lineno - 1], col),
+        "end_line": end_lineno,
+        "end_col": _char_col(ctx["lines"][end_lineno - 1], end_col),
+        "text": text,
+    }
+
+
+def insert_line(lineno, text):
+    return {"line": lineno, "col": 0, "end_line": lineno, "end_col": 0, "text": text + "\n"}
+
+
+def finding(ctx, node, rule_id, message, edits=None):
+    return {
+        "rule": rule_id,
+        "path": ctx["path"],
+        "line": node.lineno,
+        "end_line": getattr(node, "end_lineno", node.lineno),
+        "col": node.col_offset,
+        "message": message,
+        "edits": edits or [],
+    }
+
+
+def _segment(ctx, node):
+    # ast.get_source_segment delar upp hela filen vid varje anrop; läs ur radtabellen i stället
+    line = ctx["lines"][node.lineno - 1]
+    if node.lineno != node.end_lineno:
+        return None
+    return line[_char_col(line, node.col_offset):_char_col(line, node.end_col_offset)]
+
+
+@rule("print-logging", ast.Call)
+def print_call(node, ctx):
+    if not (isinstance(node.func, ast.Name) and node.func.id == "print"):
+        return None
+    edits = []
+    # Bara ett enkelt argument kan flyttas rakt till logging.info utan att ändra betydelse
+    if len(node.args) == 1 and not node.keywords and not isinstance(node.args[0], ast.Starred):
+        f = node.func
+        edits.append(edit(ctx, f.lineno, f.col_offset, f.end_lineno, f.end_col_offset, "logging.info"))
+        ctx["needs_logging"] = True
+    return finding(ctx, node, "print-logging", "Byt ut `print` mot `logging.info` för bättre loggning.", edits)
+
+
+@rule("bare-except", ast.ExceptHandler)
+def bare_except(node, ctx):
+    if node.type is not None:
+        return None
+    line = ctx["lines"][node.lineno - 1]
+    start = _char_col(line, node.col_offset)
+    m = re.match(r"except\s*:", line[start:])
+    edits = []
+    if m:
+        edits.append({"line": node.lineno, "col": start, "end_line": node.lineno,
+                      "end_col": start + m.end(), "text": "except Exception:"})
+    return finding(ctx, node, "bare-except",
+                   "Naket `except:` fångar även KeyboardInterrupt och SystemExit; fånga `Exception` eller något smalare.",
+                   edits)
+
+
+def _is_mutable(node):
+    if isinstance(node, (ast.List, ast.Dict, ast.Set, ast.ListComp, ast.DictComp, ast.SetComp)):
+        return True
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in MUTABLE_CALLS)
+
+
+@rule("mutable-default", ast.FunctionDef, ast.AsyncFunctionDef)
+def mutable_default(node, ctx):
+    args = node.args
+    positional = args.posonlyargs + args.args
+    pairs = list(zip(positional[len(positional) - len(args.defaults):], args.defaults))
+    pairs += [(a, d) for a, d in zip(args.kwonlyargs, args.kw_defaults) if d is not None]
+    mutable = [(a, d) for a, d in pairs if _is_mutable(d)]
+    if not mutable:
+        return None
+
+    results = []
+    first = node.body[0]
+    anchor = first.lineno
+    if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and isinstance(first.value.value, str):
+        # Efter docstringen
+        anchor = first.end_lineno + 1
+    line = ctx["lines"][first.lineno - 1]
+    indent = line[:len(line) - len(line.lstrip())]
+    # Fix bara när kroppen börjar på en egen rad efter signaturen
+    can_fix = (first.lineno > max([node.lineno] + [d.end_lineno for _, d in mutable])
+               and first.col_offset == len(indent.encode("utf-8")))
+    for arg, default in mutable:
+        edits = []
+        if can_fix and default.lineno == default.end_lineno:
+            edits = [
+                edit(ctx, default.lineno, default.col_offset, default.end_lineno, default.end_col_offset, "None"),
+                insert_line(anchor, f"{indent}if {arg.arg} is None:\n{indent}    {arg.arg} = {_segment(ctx, default)}"),
+            ]
+        results.append(finding(ctx, default, "mutable-default",
+                               f"Muterbart standardvärde för `{arg.arg}` i `{node.name}` delas mellan anrop; "
+                               f"använd None och skapa värdet i funktionen.", edits))
+    return results
+
+
+@rule("none-comparison", ast.Compare)
+def none_comparison(node, ctx):
+    results = []
+    left = node.left
+    for op, right in zip(node.ops, node.comparators):
+        if isinstance(op, (ast.Eq, ast.NotEq)) and (
+                isinstance(right, ast.Constant) and right.value is None
+                or isinstance(left, ast.Constant) and left.value is None):
+            new_op = "is" if isinstance(op, ast.Eq) else "is not"
+            edits = []
+            if left.end_lineno == right.lineno:
+                line = ctx["lines"][right.lineno - 1]
+                start = _char_col(line, left.end_col_offset)
+                end = _char_col(line, right.col_offset)
+                gap = line[start:end]
+                symbol = "==" if isinstance(op, ast.Eq) else "!="
+                if gap.count(symbol) == 1:
+                    edits.append({"line": right.lineno, "col": start, "end_line": right.lineno, "end_col": end,
+                                  "text": gap.replace(symbol, new_op)})
+            results.append(finding(ctx, node, "none-comparison",
+                                   f"Jämför med None med `{new_op}` i stället för `{'==' if new_op == 'is' else '!='}`.",
+                                   edits))
+        left = right
+    return results
+
+
+@rule("literal-identity", ast.Compare)
+def literal_identity(node, ctx):
+    results = []
+    left = node.left
+    for op, right in zip(node.ops, node.comparators):
+        literal = next((n for n in (left, right) if isinstance(n, ast.Constant)
+                        and isinstance(n.value, (str, bytes, int, float)) and not isinstance(n.value, bool)), None)
+        if isinstance(op, (ast.Is, ast.IsNot)) and literal is not None:
+            new_op = "==" if isinstance(op, ast.Is) else "!="
+            edits = []
+            if left.end_lineno == right.lineno:
+                line = ctx["lines"][right.lineno - 1]
+                start = _char_col(line, left.end_col_offset)
+                end = _char_col(line, right.col_offset)
+                gap = line[start:end]
+                old = "is not" if isinstance(op, ast.IsNot) else "is"
+                if re.fullmatch(rf"\s*{old}\s*", gap):
+                    edits.append({"line": right.lineno, "col": start, "end_line": right.lineno, "end_col": end,
+                                  "text": gap.replace(old, new_op)})
+            results.append(finding(ctx, node, "literal-identity",
+                                   f"`is` mot en literal jämför identitet, inte värde; använd `{new_op}`.", edits))
+        left = right
+    return results
+
+
+@rule("fstring-without-placeholders", ast.JoinedStr)
+def fstring_without_placeholders(node, ctx):
+    if any(isinstance(v, ast.FormattedValue) for v in node.values) or node.lineno != node.end_lineno:
+        return None
+    line = ctx["lines"][node.lineno - 1]
+    start = _char_col(line, node.col_offset)
+    prefix = re.match(r"[rRbBuU]?[fF][rR]?", line[start:])
+    edits = []
+    if prefix:
+        edits.append({"line": node.lineno, "col": start, "end_line": node.lineno, "end_col": start + prefix.end(),
+                      "text": re.sub("[fF]", "", prefix.group())})
+    return finding(ctx, node, "fstring-without-placeholders", "f-strängen saknar platshållare; ta bort `f`.", edits)
+
+
+def _logging_import(tree):
+    for node in tree.body:
+        if isinstance(node, ast.Import) and any(alias.name == "logging" for alias in node.names):
+            return True
+    return False
+
+
+def _import_line(tree):
+    # Efter modulens docstring och __future__-importer
+    line = 1
+    for node in tree.body:
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str) \
+                and node is tree.body[0]:
+            line = node.end_lineno + 1
+        elif isinstance(node, ast.ImportFrom) and node.module == "__future__":
+            line = node.end_lineno + 1
+        else:
+            break
+    return line
+
+
+def check_source(source, path="<kod>", tree=None):
+    """
+    Kör alla registrerade regler i en enda AST-genomgång. Returnerar
+    {"findings", "max_complexity", "regions", "nodes", "checks"} där
+    max_complexity är en grov cyklomatisk uppskattning för filens mest
+    förgrenade funktion (kod på modulnivå räknas som en egen funktion) och
+    regions är filens toppnivåblock.
+    """
+    if tree is None:
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            return {"findings": [], "max_complexity": None, "regions": [], "nodes": 0, "checks": 0}
+    ctx = {"path": path, "source": source, "lines": split_lines(source), "needs_logging": False}
+    findings = []
+    nodes = checks = 0
+    complexity = {tree: 1}
+    stack = [(tree, tree)]
+    while stack:
+        node, function = stack.pop()
+        nodes += 1
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            function = node
+            complexity[node] = 1
+        elif isinstance(node, BRANCH_NODES):
+            complexity[function] += len(node.values) - 1 if isinstance(node, ast.BoolOp) else 1
+        for func in RULES.get(type(node), ()):
+            checks += 1
+            result = func(node, ctx)
+            if isinstance(result, list):
+                findings.extend(result)
+            elif result:
+                findings.append(result)
+        stack.extend((child, function) for child in reversed(list(ast.iter_child_nodes(node))))
+
+    if ctx["needs_logging"] and not _logging_import(tree):
+        line = _import_line(tree)
+        findings.append({"rule": "logging-import", "path": path, "line": line, "end_line": line, "col": 0,
+                         "message": "Importera logging för logging.info-ersättningarna.",
+                         "edits": [insert_line(line, "import logging")]})
+    findings.sort(key=lambda f: (f["line"], f["col"], f["rule"]))
+    return {"findings": findings, "max_complexity": max(complexity.values()),
+            "regions": top_level_regions(tree), "nodes": nodes, "checks": checks}
+
+
+def top_level_regions(tree):
+    """Varje toppnivåfunktion och klass som (start, slut); övrig modulkod i följd blir en region."""
+    regions = []
+    previous_def = True
+    for node in tree.body:
+        is_def = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        if regions and not is_def and not previous_def:
+            regions[-1] = (regions[-1][0], node.end_lineno)
+        else:
+            regions.append((start, node.end_lineno))
+        previous_def = is_def
+    return regions
+
+
+def only_local(report, regions=None):
+    """
+    Sant bara om reglernas fynd täcker varje ändrad region (utan regions:
+    varje toppnivåblock i filen) och koden är enkel nog att inte behöva GPT.
+    Annars är fynden ett tillägg till GPT-granskningen, inte en ersättning.
+    """
+    if report["max_complexity"] is None or report["max_complexity"] > SIMPLE_COMPLEXITY:
+        return False
+    regions = report["regions"] if regions is None else regions
+    # logging-importen följer av andra fynd och säger inget om sin egen region
+    lines = [f["line"] for f in report["findings"] if f["rule"] != "logging-import"]
+    return bool(regions) and all(any(start <= line <= end for line in lines) for start, end in regions)
+
+
+def apply_fixes(source, findings):
+    """Applicerar fyndens edits bakifrån; edits som överlappar en redan tagen hoppas över."""
+    lines = split_lines(source, keepends=True)
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    spans = []
+    for f in findings:
+        for e in f["edits"]:
+            if e["line"] > len(lines) + 1:
+                continue
+            start = offsets[e["line"] - 1] + e["col"]
+            end = offsets[e["end_line"] - 1] + e["end_col"]
+            spans.append((start, end, e["text"]))
+    result = source
+    limit = len(source) + 1
+    for start, end, text in sorted(spans, key=lambda s: (s[0], s[1]), reverse=True):
+        if end > limit:
+            continue
+        result = result[:start] + text + result[end:]
+        limit = start
+    return result
+
+
+def fix_diff(source, findings, path):
+    """Unified diff för alla fixar i filen, i samma format som patch_engine läser."""
+    fixed = apply_fixes(source, findings)
+    if fixed == source:
+        return ""
+    return "".join(difflib.unified_diff(
+        split_lines(source, keepends=True), split_lines(fixed, keepends=True),
+        fromfile=f"a/{path}", tofile=f"b/{path}", n=3,
+    ))
+
+
+def format_findings(findings):
+    return "\n".join(f"{f['path']}:{f['line']}: [{f['rule']}] {f['message']}" for f in findings)
@@ -1,13 +1,24 @@
 import os
+import re
+import glob
 import json
+import shutil
+import pathlib
+import argparse
 import subprocess
-from openai import OpenAI
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import ast
+from clients import get_openai_client
+from llm_cache import chat_completion
+from file_unit import get_unit
+from instrumentation import span, add_arguments, instrumented_run, run_options
 
-load_dotenv()
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+GENERATE_JOBS = 4
+VALIDATE_JOBS = os.cpu_count() or 1
+VALIDATE_TIMEOUT = 300
+RUNS_DIR = ".coverage_runs"
+# unittest skriver "Ran N tests in ..." till stderr; 3.11 avslutar med 0 även när N är 0
+RAN_RE = re.compile(r"^Ran (\d+) tests? in ", re.MULTILINE)
 
 def generate_unit_tests(code_text, filename, feedback):
     feedback_note = ""
@@ -25,87 +36,133 @@ def generate_unit_tests(code_text, filename, feedback):
     )
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
+        return chat_completion(
+            get_openai_client(),
+            "gpt-4o",
+            [
                 {"role": "system", "content": "Du skriver enhetstester i Python."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.3
+            0.3
         )
-        return response.choices[0].message.content
     except Exception as e:
         print(f"Fel vid generering av test med GPT: {e}")
         return ""
 
-def save_test_file(test_code, original_filename):
+def generated_test_name(original_filename, repo_path="temp_repo"):
+    # Hela modulsökvägen i namnet, så att pkg/a/util.py och pkg/b/util.py får olika testfiler
+    relative = os.path.splitext(os.path.relpath(original_filename, repo_path))[0]
+    return "test_gen_" + re.sub(r"\W", "_", relative.replace(os.sep, "__"))
+
+def save_test_file(test_code, original_filename, repo_path="temp_repo"):
+    """
+    Sparar testkoden i en ny fil under tests/ och returnerar sökvägen, eller
+    None om koden inte parsar. Befintliga filer skrivs aldrig över; finns
+    namnet redan får filen ett löpnummer.
+    """
     try:
         ast.parse(test_code)
     except SyntaxError as e:
         print(f"Fel i genererad testkod för {original_filename}: {e}")
         print("Hoppar över denna fil.")
-        return False
+        return None
 
-    test_dir = os.path.join("temp_repo", "tests")
+    test_dir = os.path.join(repo_path, "tests")
     os.makedirs(test_dir, exist_ok=True)
-    test_filename = f"test_{os.path.basename(original_filename)}"
-    test_path = os.path.join(test_dir, test_filename)
-
-    with open(test_path, "w") as f:
+    name = generated_test_name(original_filename, repo_path)
+    suffix = 1
+    while True:
+        test_path = os.path.join(test_dir, f"{name}.py" if suffix == 1 else f"{name}_{suffix}.py")
+        try:
+            # O_EXCL: filen skapas bara om den inte redan finns, även när flera körningar delar repot
+            fd = os.open(test_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            break
+        except FileExistsError:
+            suffix += 1
+    with os.fdopen(fd, "w") as f:
         f.write(test_code)
 
     print(f"✅ Sparade testfil: {test_path}")
-    return True
+    return test_path
 
-def ensure_tests_package():
-    test_dir = os.path.join("temp_repo", "tests")
+def ensure_tests_package(repo_path="temp_repo"):
+    test_dir = os.path.join(repo_path, "tests")
     os.makedirs(test_dir, exist_ok=True)
     init_path = os.path.join(test_dir, "__init__.py")
     if not os.path.exists(init_path):
         with open(init_path, "w") as f:
             f.write("# Init file for tests package\n")
 
-def get_uncovered_files(threshold=75.0):
-    repo_path = "temp_repo"
-    original_cwd = os.getcwd()
-    os.chdir(repo_path)
+def coverage_json(repo_path, data_file=".coverage"):
+    """Skapar en JSON-rapport ur en coverage-datafil och returnerar {fil: procent}."""
+    report = os.path.join(RUNS_DIR, "coverage.json")
+    with span("coverage", step="json"):
+        result = subprocess.run(
+            ["coverage", "json", "--data-file", data_file, "-o", report],
+            cwd=repo_path, capture_output=True, text=True
+        )
+    report_path = os.path.join(repo_path, report)
+    if result.returncode != 0 or not os.path.exists(report_path):
+        print("❌ Coverage.json hittades inte - inga tester körda eller coverage kunde inte samlas in.")
+        return None
+    try:
+        with open(report_path, "r") as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        print(f"Kunde inte läsa coverage.json: {e}")
+        return None
+    return {
+        file: info.get("summary", {}).get("percent_covered", 100.0)
+        for file, info in data.get("files", {}).items()
+    }
 
-    print("🔄 Kör tester med coverage...")
-    result = subprocess.run(
-        ["coverage", "run", "-m", "unittest", "discover", "-s", "tests"],
-        capture_output=True, text=True
-    )
+def run_baseline_coverage(repo_path="temp_repo"):
+    # Parallellt dataläge (-p) så att valideringskörningarna kan slås ihop med baslinjen senare
+    runs_dir = os.path.join(repo_path, RUNS_DIR)
+    shutil.rmtree(runs_dir, ignore_errors=True)
+    os.makedirs(runs_dir)
+    env = dict(os.environ, COVERAGE_FILE=os.path.join(RUNS_DIR, ".coverage.baseline"))
+    with span("coverage", step="baseline"):
+        result = subprocess.run(
+            ["coverage", "run", "-p", "-m", "unittest", "discover", "-s", "tests"],
+            cwd=repo_path, env=env, capture_output=True, text=True
+        )
     if result.returncode != 0:
         print("❌ Fel vid testkörning med coverage:")
         print(result.stderr)
-        os.chdir(original_cwd)
-        return []
+        return None
+    return combine_coverage(repo_path, ["baseline"])
 
-    print("🔄 Skapar coverage JSON-rapport...")
-    result = subprocess.run(
-        ["coverage", "json", "-o", "coverage.json"],
-        capture_output=True, text=True
-    )
-    if result.returncode != 0 or not os.path.exists("coverage.json"):
-        print("❌ Coverage.json hittades inte - inga tester körda eller coverage kunde inte samlas in.")
-        os.chdir(original_cwd)
-        return []
+def combine_coverage(repo_path, tags):
+    """Slår ihop datafilerna för de givna körningarna med coverage combine och läser procenten."""
+    paths = []
+    for tag in tags:
+        paths.extend(os.path.relpath(p, repo_path)
+                     for p in glob.glob(os.path.join(repo_path, RUNS_DIR, f".coverage.{tag}.*")))
+    if not paths:
+        return None
+    data_file = os.path.join(RUNS_DIR, "combined")
+    with span("coverage", step="combine"):
+        result = subprocess.run(
+            ["coverage", "combine", "--keep", "-q", "--data-file", data_file] + paths,
+            cwd=repo_path, capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        print(f"❌ coverage combine misslyckades: {result.stderr.strip()}")
+        return None
+    return coverage_json(repo_path, data_file)
 
-    try:
-        with open("coverage.json", "r") as f:
-            data = json.load(f)
-    except json.JSONDecodeError as e:
-        print(f"Kunde inte läsa coverage.json: {e}")
-        os.chdir(original_cwd)
+def get_uncovered_files(threshold=75.0, repo_path="temp_repo", percents=None):
+    if percents is None:
+        print("🔄 Kör tester med coverage...")
+        percents = run_baseline_coverage(repo_path)
+    if not percents:
         return []
 
     uncovered = []
-    for file, info in data.get("files", {}).items():
-        percent = info.get("summary", {}).get("percent_covered", 100.0)
+    for file, percent in percents.items():
         if percent < threshold and file.endswith(".py"):
             uncovered.append((os.path.join(repo_path, file), percent))
-
-    os.chdir(original_cwd)
     return uncovered
 
 def load_feedback(filename="feedback.json"):
@@ -126,22 +183,25 @@ def ask_for_feedback(test_file_path):
         else:
             print("Skriv '👍' för tumme-upp eller '👎' för tumme-ned.")
 
-def auto_generate_tests_if_low_coverage(threshold=75.0):
-    uncovered_files = get_uncovered_files(threshold)
+def auto_generate_tests_if_low_coverage(threshold=75.0, interactive=True, repo_path="temp_repo"):
+    uncovered_files = get_uncovered_files(threshold, repo_path)
     if not uncovered_files:
         print("✅ Coverage är tillräcklig. Inga tester behöver genereras.")
         return False, []
 
+    if not interactive:
+        results = generate_tests_batch(uncovered_files, repo_path)
+        return bool(results), [filepath for filepath, _, _ in results]
+
     feedback = load_feedback()
     changed_files = []
 
     for filepath, percent in uncovered_files:
         print(f"🔍 Genererar tester för {filepath} ({percent:.1f}%)")
-        with open(filepath, "r") as f:
-            code = f.read()
+        code = get_unit(filepath).source
 
         test_code = generate_unit_tests(code, filepath, feedback)
-        if save_test_file(test_code, filepath):
+        if save_test_file(test_code, filepath, repo_path):
             print(f"Ber om feedback för {filepath}")
             is_good = ask_for_feedback(filepath)
             feedback[filepath] = is_good
@@ -150,21 +210,103 @@ def auto_generate_tests_if_low_coverage(threshold=75.0):
     save_feedback(feedback)
 
     print("🔁 Kör om coverage efter genererade tester...")
-    subprocess.run(["coverage", "run", "-m", "unittest", "discover", "-s", "tests"])
-    subprocess.run(["coverage", "report"], cwd="temp_repo")
+    with span("coverage", step="rerun"):
+        subprocess.run(["coverage", "run", "-m", "unittest", "discover", "-s", "tests"], cwd=repo_path)
+        subprocess.run(["coverage", "report"], cwd=repo_path)
 
     return True, changed_files
 
+def validate_test(repo_path, filepath, test_path, tag):
+    """
+    Kör en genererad testfil för sig i en egen process, med coverage bara
+    för målmodulen. Datafilen får taggen så att den kan slås ihop efteråt.
+    En fil som inte kör några tester godkänns inte.
+    """
+    module = os.path.splitext(os.path.relpath(test_path, repo_path))[0].replace(os.sep, ".")
+    env = dict(os.environ, COVERAGE_FILE=os.path.join(RUNS_DIR, f".coverage.{tag}"))
+    try:
+        with span("coverage", step="validate"):
+            result = subprocess.run(
+                ["coverage", "run", "-p", f"--include={os.path.relpath(filepath, repo_path)}",
+                 "-m", "unittest", module],
+                cwd=repo_path, env=env, capture_output=True, text=True, timeout=VALIDATE_TIMEOUT
+            )
+    except subprocess.TimeoutExpired:
+        return False, "timeout"
+    ran = RAN_RE.search(result.stderr)
+    if result.returncode == 0 and (ran is None or int(ran.group(1)) == 0):
+        return False, "inga tester kördes"
+    return result.returncode == 0, (result.stderr.strip().splitlines() or [""])[-1]
+
+def generate_tests_batch(uncovered_files, repo_path="temp_repo", feedback=None,
+                         generate_jobs=GENERATE_JOBS, validate_jobs=VALIDATE_JOBS):
+    """
+    Icke-interaktivt läge: genererar tester för alla filer samtidigt, validerar
+    varje testfil isolerat i parallella processer och räknar täckningsökningen
+    per fil genom att slå ihop valideringsdatan med baslinjen. Tester som
+    inte går igenom tas bort. Returnerar [(fil, före, efter)] för godkända tester.
+    """
+    feedback = load_feedback() if feedback is None else feedback
+    ensure_tests_package(repo_path)
+
+    def generate(item):
+        filepath, percent = item
+        print(f"🔍 Genererar tester för {filepath} ({percent:.1f}%)")
+        code = get_unit(filepath).source
+        return generate_unit_tests(code, filepath, feedback)
+
+    with ThreadPoolExecutor(max_workers=max(1, generate_jobs)) as pool:
+        test_codes = list(pool.map(generate, uncovered_files))
+
+    candidates = []
+    for (filepath, percent), test_code in zip(uncovered_files, test_codes):
+        test_path = save_test_file(test_code, filepath, repo_path) if test_code else None
+        if test_path:
+            candidates.append((filepath, percent, test_path, f"gen{len(candidates)}"))
+
+    with ThreadPoolExecutor(max_workers=max(1, validate_jobs)) as pool:
+        outcomes = list(pool.map(lambda c: validate_test(repo_path, c[0], c[2], c[3]), candidates))
+
+    passed = []
+    for (filepath, percent, test_path, tag), (ok, detail) in zip(candidates, outcomes):
+        feedback[filepath] = ok
+        if ok:
+            passed.append((filepath, percent, tag))
+        else:
+            print(f"❌ Genererat test för {filepath} gick inte igenom ({detail}), tar bort det.")
+            pathlib.Path(test_path).unlink(missing_ok=True)
+    save_feedback(feedback)
+
+    if not passed:
+        return []
+    after = combine_coverage(repo_path, ["baseline"] + [tag for _, _, tag in passed]) or {}
+    results = []
+    for filepath, percent, _ in passed:
+        new_percent = after.get(os.path.relpath(filepath, repo_path), percent)
+        print(f"📈 {filepath}: {percent:.1f}% → {new_percent:.1f}%")
+        results.append((filepath, percent, new_percent))
+    return results
+
 def main():
-    print("🚀 Kör GPT-baserad testgenerator...")
-    ensure_tests_package()
-    generated, affected = auto_generate_tests_if_low_coverage()
-    if generated:
-        print("🧪 Genererade tester för:")
-        for file in affected:
-            print(f" - {file}")
-    else:
-        print("✅ Coverage OK – inga tester behövde genereras.")
+    parser = argparse.ArgumentParser(description="Generera enhetstester för filer med låg coverage")
+    parser.add_argument("repo_path", nargs="?", default="temp_repo")
+    parser.add_argument("--threshold", type=float, default=75.0)
+    parser.add_argument("--non-interactive", action="store_true",
+                        help="Generera och validera alla tester parallellt utan att fråga om feedback")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented_run("testgenerering", **run_options(args)):
+        print("🚀 Kör GPT-baserad testgenerator...")
+        ensure_tests_package(args.repo_path)
+        generated, affected = auto_generate_tests_if_low_coverage(args.threshold, not args.non_interactive,
+                                                                  args.repo_path)
+        if generated:
+            print("🧪 Genererade tester för:")
+            for file in affected:
+                print(f" - {file}")
+        else:
+            print("✅ Coverage OK – inga tester behövde genereras.")
 
 if __name__ == "__main__":
     main()
@@ -1,16 +1,13 @@
 import os
-import json
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from clients import get_openai_client
+from search_engine import SearchEngine
+from vector_store import EmbeddingStore, STORE_PATH
+from batch_embedder import BatchEmbedder
+from ann_index import load_or_build_index
 
 CACHE_FILE = "embedding_cache.json"
-
-def get_embedding(text, model="text-embedding-3-small"):
-    response = client.embeddings.create(input=text, model=model)
-    return response.data[0].embedding
+# Under denna storlek är en exakt sökning snabb nog och ger perfekt recall
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "20000"))
 
 def cosine_similarity(vec1, vec2):
     import math
@@ -21,24 +18,44 @@ def cosine_similarity(vec1, vec2):
         return 0
     return dot / (norm1 * norm2)
 
-def search_cache(query, top_k=3):
-    if not os.path.exists(CACHE_FILE):
-        print(f"Ingen cachefil {CACHE_FILE} hittades.")
-        return []
+_engine = None
+_engine_key = None
 
-    with open(CACHE_FILE, "r") as f:
-        cache = json.load(f)
+def load_engine(repo_path="."):
+    # Storen ligger i roten av repot vars historik den indexerar (där build_cache körs).
+    # Bygg om matrisen endast när storen (eller den gamla JSON-cachen) har ändrats
+    global _engine, _engine_key
+    store = EmbeddingStore(os.path.join(repo_path, STORE_PATH))
+    if store.exists():
+        key = (os.path.abspath(store.index_path), store.mtime())
+        if _engine is None or _engine_key != key:
+            _engine = SearchEngine.from_store(store)
+            if len(store) >= ANN_MIN_ROWS:
+                _engine.index = load_or_build_index(store, _engine.matrix)
+            _engine_key = key
+        return _engine
 
-    query_emb = get_embedding(query)
+    cache_file = os.path.join(repo_path, CACHE_FILE)
+    if not os.path.exists(cache_file):
+        return None
+    print(f"Läser gammal JSON-cache {cache_file}; migrera med `python vector_store.py {cache_file}`.")
+    key = (os.path.abspath(cache_file), os.path.getmtime(cache_file))
+    if _engine is None or _engine_key != key:
+        _engine = SearchEngine.from_cache_file(cache_file)
+        _engine_key = key
+    return _engine
 
-    scores = []
-    for sha, emb in cache.items():
-        score = cosine_similarity(query_emb, emb)
-        scores.append((sha, score))
+def search_cache(query, top_k=3):
+    return search_cache_batch([query], top_k)[0]
 
-    scores.sort(key=lambda x: x[1], reverse=True)
+def search_cache_batch(queries, top_k=3):
+    engine = load_engine()
+    if engine is None:
+        print(f"Ingen embedding-store {STORE_PATH} eller cachefil {CACHE_FILE} hittades.")
+        return [[] for _ in queries]
 
-    return scores[:top_k]
+    query_embs = BatchEmbedder(get_openai_client()).embed(queries)
+    return engine.search_batch(query_embs, top_k)
 
 if __name__ == "__main__":
     query = input("Skriv din sökfråga: ")
@@ -0,0 +1,85 @@
+import json
+import numpy as np
+
+# Rader per block när en float16-matris poängsätts, så att bara ett block i taget omvandlas
+SCORE_BLOCK = 65536
+
+
+class SearchEngine:
+    """
+    Håller embeddings som en förnormaliserad matris så att en sökning blir en
+    enda matris–vektor-multiplikation följt av argpartition. Med
+    normalized=True används matrisen som den är, t.ex. storens memmap utan kopia.
+    """
+
+    def __init__(self, shas, matrix, index=None, normalized=False):
+        self.shas = list(shas)
+        self.index = index
+        if normalized and isinstance(matrix, np.ndarray):
+            self.matrix = matrix
+        else:
+            matrix = np.asarray(matrix, dtype=np.float32)
+            if not normalized:
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                matrix = matrix / norms
+            self.matrix = matrix
+        if self.matrix.ndim != 2 or self.matrix.shape[0] != len(self.shas):
+            raise ValueError("Matrisen måste ha en rad per commit")
+
+    @classmethod
+    def from_cache_file(cls, cache_file):
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+        if not cache:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+        return cls(cache.keys(), list(cache.values()))
+
+    @classmethod
+    def from_store(cls, store):
+        return cls(store.shas, store.matrix(), normalized=store.normalized)
+
+    def __len__(self):
+        return len(self.shas)
+
+    def _normalize_queries(self, query_embs):
+        queries = np.asarray(query_embs, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return queries / norms
+
+    def _top_k(self, scores, top_k):
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return []
+        if k < scores.shape[0]:
+            idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            idx = np.arange(scores.shape[0])
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return [(self.shas[i], float(scores[i])) for i in idx]
+
+    def search(self, query_emb, top_k=3, nprobe=None):
+        return self.search_batch([query_emb], top_k, nprobe)[0]
+
+    def search_batch(self, query_embs, top_k=3, nprobe=None):
+        if len(self) == 0:
+            return [[] for _ in range(len(query_embs))]
+        queries = self._normalize_queries(query_embs)
+        if self.index is not None:
+            # Approximativ sökning; nprobe styr recall mot latens
+            kwargs = {"nprobe": nprobe} if nprobe else {}
+            results = self.index.search_batch(self.matrix, queries, top_k, **kwargs)
+            return [[(self.shas[i], score) for i, score in row] for row in results]
+        return [self._top_k(row, top_k) for row in self._scores(queries)]
+
+    def _scores(self, queries):
+        if self.matrix.dtype == np.float32:
+            return queries @ self.matrix.T
+        scores = np.empty((queries.shape[0], self.matrix.shape[0]), dtype=np.float32)
+        for start in range(0, self.matrix.shape[0], SCORE_BLOCK):
+            block = np.asarray(self.matrix[start:start + SCORE_BLOCK], dtype=np.float32)
+            scores[:, start:start + SCORE_BLOCK] = queries @ block.T
+        return scores
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import ann_index
+from ann_index import IVFIndex, index_path, load_or_build_index
+from vector_store import EmbeddingStore
+
+
+class LoadOrBuildIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "store")
+        self.rng = np.random.default_rng(0)
+
+    def store(self, shas, dim=8, path=None):
+        store = EmbeddingStore(path or self.path)
+        store.append(shas, self.rng.standard_normal((len(shas), dim)))
+        return store
+
+    def test_reused_and_extended_for_same_store(self):
+        store = self.store([f"a{i}" for i in range(40)])
+        load_or_build_index(store, store.matrix())
+        store.append(["b0", "b1"], self.rng.standard_normal((2, 8)))
+        with mock.patch.object(IVFIndex, "train") as train:
+            index = load_or_build_index(store, store.matrix())
+        train.assert_not_called()
+        self.assertEqual(len(index), 42)
+        self.assertEqual(IVFIndex.load(index_path(store)).fingerprint["last_sha"], "b1")
+
+    def test_retrained_for_other_store(self):
+        store = self.store([f"a{i}" for i in range(40)])
+        load_or_build_index(store, store.matrix())
+        # Samma sökväg men en ny store med annan dimension och andra rader
+        for name in os.listdir(self.tmp):
+            if not name.endswith(".npz"):
+                os.remove(os.path.join(self.tmp, name))
+        other = self.store([f"c{i}" for i in range(50)], dim=4)
+        index = load_or_build_index(other, other.matrix())
+        self.assertEqual((index.dim, len(index)), (4, 50))
+        self.assertEqual(index.fingerprint["first_sha"], "c0")
+
+    def test_old_index_without_fingerprint_retrained(self):
+        store = self.store([f"a{i}" for i in range(40)])
+        IVFIndex.train(store.matrix()).save(index_path(store))
+        self.assertIsNone(IVFIndex.load(index_path(store)).fingerprint)
+        index = load_or_build_index(store, store.matrix())
+        self.assertEqual(IVFIndex.load(index_path(store)).fingerprint, index.fingerprint)
+
+    def test_train_does_not_copy_normalized_store(self):
+        store = EmbeddingStore(self.path, dtype="float16")
+        store.append([f"a{i}" for i in range(200)], self.rng.standard_normal((200, 8)))
+        normalize = ann_index.normalize
+        shapes = []
+        with mock.patch.object(ann_index, "MAX_TRAIN_SAMPLE", 50), \
+                mock.patch.object(ann_index, "ASSIGN_BATCH", 64), \
+                mock.patch.object(ann_index, "normalize",
+                                  side_effect=lambda m: shapes.append(np.shape(m)) or normalize(m)):
+            index = IVFIndex.train(store.matrix(), nlist=4, normalized=True)
+        self.assertEqual(len(index), 200)
+        self.assertTrue(all(shape[0] < 200 for shape in shapes))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from code_indexer import chunk_file
+
+SOURCE = '''import os
+
+LIMIT = 3
+
+
+def first():
+    return 1
+
+
+@staticmethod
+def second():
+    return 2
+
+
+class Third:
+    def method(self):
+        return 3
+'''
+
+
+class ChunkFileTest(unittest.TestCase):
+    def test_one_chunk_per_definition_in_small_file(self):
+        chunks = chunk_file("x.py", SOURCE)
+        self.assertEqual([c["label"] for c in chunks], ["modulnivå", "first", "second", "Third"])
+        self.assertEqual((chunks[0]["start"], chunks[0]["end"]), (1, 3))
+        self.assertTrue(chunks[2]["text"].startswith("@staticmethod"))
+
+    def test_only_oversized_definitions_split(self):
+        big = "def big():\n" + "".join(f"    x{i} = {i} * {i} + {i}\n" for i in range(200))
+        chunks = chunk_file("x.py", SOURCE + "\n\n" + big, max_tokens=200)
+        labels = [c["label"] for c in chunks]
+        self.assertEqual(labels[:4], ["modulnivå", "first", "second", "Third"])
+        self.assertGreater(len(labels), 5)
+        self.assertTrue(all(label.startswith("big (del ") for label in labels[4:]))
+
+    def test_moved_function_keeps_hash(self):
+        before = {c["label"]: c["hash"] for c in chunk_file("x.py", SOURCE)}
+        after = {c["label"]: c["hash"] for c in chunk_file("x.py", "\n\n" + SOURCE)}
+        self.assertEqual(before["first"], after["first"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,22 @@
+import unittest
+
+from diff_scope import scoped_regions, render_scoped_source
+
+CODE = "import os\n\x0c\ndef f():\n    return '\x1c'\n\n\x0c\ndef g():\n    a = 1\n    return a\n"
+
+
+class ScopedRegionsTest(unittest.TestCase):
+    def test_form_feed_keeps_ast_line_numbers(self):
+        # def g står på rad 7 enligt ast; str.splitlines skulle räkna fler rader
+        self.assertEqual(scoped_regions(CODE, {8}, context=0), [(7, 9)])
+
+    def test_rendered_region_is_the_function(self):
+        text = render_scoped_source(CODE, [(7, 9)])
+        self.assertEqual(text, "# Rader 7-9\ndef g():\n    a = 1\n    return a")
+
+    def test_total_counts_ast_lines(self):
+        self.assertEqual(scoped_regions(CODE, {9}, context=5), [(2, 9)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+from extract_commits import iter_commit_texts
+
+
+class IterCommitTextsTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repo)
+        self.git("init", "-q")
+        self.shas = []
+        for i in range(3):
+            with open(os.path.join(self.repo, "a.py"), "w") as f:
+                f.write("".join(f"x{n} = {i}\n" for n in range(50)))
+            self.git("add", "a.py")
+            self.git("commit", "-q", "-m", f"Commit {i}\n\nBeskrivning {i}")
+            self.shas.append(self.git("rev-parse", "HEAD"))
+
+    def git(self, *args):
+        return subprocess.run(["git", "-C", self.repo, "-c", "user.name=t", "-c", "user.email=t@t", *args],
+                              check=True, capture_output=True, text=True).stdout.strip()
+
+    def test_commits_in_order_with_message_and_diff(self):
+        commits = list(iter_commit_texts(repo_path=self.repo))
+        self.assertEqual([sha for sha, _ in commits], self.shas)
+        self.assertIn("Commit 1\n\nBeskrivning 1", commits[1][1])
+        self.assertIn("+x0 = 1", commits[1][1])
+
+    def test_since_and_truncation(self):
+        commits = list(iter_commit_texts(since=self.shas[0], max_diff_chars=100, repo_path=self.repo))
+        self.assertEqual([sha for sha, _ in commits], self.shas[1:])
+        self.assertTrue(commits[0][1].endswith("[... diff kapad ...]"))
+
+    def test_stopping_early_is_quiet(self):
+        commits = iter_commit_texts(repo_path=self.repo)
+        self.assertEqual(next(commits)[0], self.shas[0])
+        commits.close()
+
+    def test_git_error_reported(self):
+        with self.assertRaisesRegex(RuntimeError, "git log misslyckades: .*finns-inte"):
+            list(iter_commit_texts(rev_range="finns-inte", repo_path=self.repo))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+from git_utils import ensure_mirror, mirror_path, prepare_worktree
+
+
+def git(repo, *args):
+    return subprocess.run(["git", "-C", repo, "-c", "user.name=t", "-c", "user.email=t@t", *args],
+                          check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit(repo, filename, content, message):
+    with open(os.path.join(repo, filename), "w") as f:
+        f.write(content)
+    git(repo, "add", filename)
+    git(repo, "commit", "-q", "-m", message)
+    return git(repo, "rev-parse", "HEAD")
+
+
+class WorktreeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.origin = os.path.join(self.tmp, "origin")
+        os.makedirs(self.origin)
+        git(self.origin, "init", "-q", "-b", "main")
+        commit(self.origin, "a.py", "x = 1\n", "första")
+        git(self.origin, "checkout", "-q", "-b", "feature")
+        self.feature_sha = commit(self.origin, "a.py", "x = 2\n", "feature")
+        git(self.origin, "checkout", "-q", "main")
+        # file:// så att git använder det vanliga protokollet (och respekterar --depth)
+        self.url = "file://" + self.origin
+        self.mirrors = os.path.join(self.tmp, "mirrors")
+
+    def worktree(self, branch, name="wt", **kwargs):
+        return prepare_worktree(self.url, branch, os.path.join(self.tmp, name), mirror_root=self.mirrors, **kwargs)
+
+    def read(self, repo, filename="a.py"):
+        with open(os.path.join(repo.working_dir, filename)) as f:
+            return f.read()
+
+    def test_checks_out_branch_head_detached(self):
+        repo = self.worktree("feature")
+        self.assertEqual(repo.head.commit.hexsha, self.feature_sha)
+        self.assertTrue(repo.head.is_detached)
+        self.assertEqual(self.read(repo), "x = 2\n")
+        self.assertTrue(os.path.isdir(mirror_path(self.url, self.mirrors)))
+
+    def test_reuse_fetches_new_commits_and_cleans(self):
+        repo = self.worktree("main")
+        with open(os.path.join(repo.working_dir, "skräp.txt"), "w") as f:
+            f.write("kvar från förra jobbet")
+        with open(os.path.join(repo.working_dir, "a.py"), "w") as f:
+            f.write("ändrad lokalt\n")
+        sha = commit(self.origin, "a.py", "x = 3\n", "ny")
+
+        repo = self.worktree("main")
+        self.assertEqual(repo.head.commit.hexsha, sha)
+        self.assertEqual(self.read(repo), "x = 3\n")
+        self.assertFalse(os.path.exists(os.path.join(repo.working_dir, "skräp.txt")))
+        mirror = ensure_mirror(self.url, mirror_root=self.mirrors)
+        self.assertEqual(len(mirror.git.worktree("list").splitlines()), 2)
+
+    def test_same_branch_in_two_worktrees(self):
+        first = self.worktree("feature", "wt1")
+        second = self.worktree("feature", "wt2")
+        self.assertEqual(first.head.commit.hexsha, second.head.commit.hexsha)
+
+    def test_replaces_directory_that_is_not_a_worktree(self):
+        target = os.path.join(self.tmp, "wt")
+        os.makedirs(target)
+        with open(os.path.join(target, "gammal.txt"), "w") as f:
+            f.write("x")
+        repo = self.worktree("main")
+        self.assertFalse(os.path.exists(os.path.join(target, "gammal.txt")))
+        self.assertEqual(self.read(repo), "x = 1\n")
+
+    def test_shallow_mirror(self):
+        commit(self.origin, "a.py", "x = 4\n", "fler")
+        repo = self.worktree("main", depth=1)
+        mirror = ensure_mirror(self.url, depth=1, mirror_root=self.mirrors)
+        self.assertEqual(mirror.git.rev_parse("--is-shallow-repository"), "true")
+        self.assertEqual(self.read(repo), "x = 4\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_github import start_fake_github
+from github_client import GitHubClient
+
+
+class GitHubClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server, self.state = start_fake_github()
+        self.tmp = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmp, "etags.json")
+        files = [{"filename": f"f{i}.py", "status": "modified", "patch": "@@ -1 +1 @@\n-a\n+b"} for i in range(250)]
+        self.state.add_pull(1, "gren", files=files)
+        self.state.add_pull(2, "annan")
+        self.prefix = f"repos/{self.state.owner}/{self.state.repo}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def client(self, token="t1", **kwargs):
+        client = GitHubClient(token, api_base=self.state.base_url, cache_file=self.cache_file, **kwargs)
+        self.addCleanup(client.session.close)
+        return client
+
+    def gets(self):
+        return [path for method, path in self.state.requests if method == "GET"]
+
+    def test_pagination_one_get_per_page(self):
+        files = self.client().get_all(f"{self.prefix}/pulls/1/files")
+        self.assertEqual(len(files), 250)
+        self.assertEqual(len(self.gets()), 3)
+
+    def test_second_get_is_not_modified(self):
+        client = self.client()
+        first = client.get(f"{self.prefix}/pulls/1")
+        second = client.get(f"{self.prefix}/pulls/1")
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.gets()), 2)
+        self.assertEqual(client.stats["not_modified"], 1)
+
+    def test_cache_not_shared_between_tokens(self):
+        first = self.client("t1")
+        first.get(f"{self.prefix}/pulls/1")
+        first.close()
+        other = self.client("t2")
+        other.get(f"{self.prefix}/pulls/1")
+        self.assertEqual(other.stats["not_modified"], 0)
+        same = self.client("t1")
+        same.get(f"{self.prefix}/pulls/1")
+        self.assertEqual(same.stats["not_modified"], 1)
+
+    def test_cache_is_bounded(self):
+        client = self.client(max_entries=2)
+        for number in (1, 2, 1):
+            client.get(f"{self.prefix}/pulls/{number}")
+        client.get(f"{self.prefix}/pulls/1/comments")
+        self.assertEqual(len(client.etags), 2)
+        # Den senast använda PR:en finns kvar, den äldsta är borta
+        self.assertTrue(any(key.endswith("/pulls/1") for key in client.etags))
+        self.assertFalse(any(key.endswith("/pulls/2") for key in client.etags))
+
+    def test_flush_in_batches_and_on_close(self):
+        client = self.client(flush_every=2)
+        client.get(f"{self.prefix}/pulls/1")
+        self.assertFalse(os.path.exists(self.cache_file))
+        client.get(f"{self.prefix}/pulls/2")
+        with open(self.cache_file) as f:
+            self.assertEqual(len(json.load(f)), 2)
+        client.get(f"{self.prefix}/pulls/1/comments")
+        client.close()
+        with open(self.cache_file) as f:
+            self.assertEqual(len(json.load(f)), 3)
+
+    def test_concurrent_gets(self):
+        client = self.client(flush_every=1)
+        paths = [f"{self.prefix}/pulls/{n}{suffix}" for n in (1, 2) for suffix in ("", "/comments", "/reviews")]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(client.get, paths * 5))
+        client.close()
+        with open(self.cache_file) as f:
+            self.assertEqual(len(json.load(f)), len(paths))
+        self.assertEqual(client.stats["requests"], len(paths) * 5)
+        self.assertEqual([name for name in os.listdir(self.tmp) if name.endswith(".tmp")], [])
+
+    def test_api_url_read_when_client_is_created(self):
+        # GITHUB_API_URL sätts efter importen, som när .env läses först vid användning
+        with mock.patch.dict(os.environ, {"GITHUB_API_URL": self.state.base_url}):
+            client = GitHubClient("t1", cache_file=self.cache_file)
+        self.addCleanup(client.session.close)
+        self.assertEqual(client.api_base, self.state.base_url.rstrip("/"))
+        client.get(f"{self.prefix}/pulls/1")
+        self.assertEqual(len(self.gets()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+from unittest import mock
+
+import github_commenter
+from file_unit import FileUnit
+from rule_engine import check_source
+
+
+class RuleFindingsForPatchTest(unittest.TestCase):
+    def test_file_unit_tree_reused(self):
+        unit = FileUnit("a.py", "import logging\n\ndef f():\n    print('x')\n")
+        file = {"filename": "a.py", "patch": "@@ -3,1 +3,2 @@\n def f():\n+    print('x')"}
+        with mock.patch.object(github_commenter, "check_source", side_effect=check_source) as check:
+            results = github_commenter.rule_findings_for_patch(file, unit)
+        self.assertIs(check.call_args.args[2], unit.tree)
+        self.assertEqual([line for line, _, _ in results], [4])
+        self.assertIn("+    logging.info('x')", results[0][2])
+
+
+if __name__ == "__main__":
+    unittest.main()
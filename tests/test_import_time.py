@@ -0,0 +1,57 @@
+import os
+import sys
+import subprocess
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Kommandoradsmodulerna; att importera dem ska gå snabbt och inte ha sidoeffekter
+CLI_MODULES = ["main", "github_commenter", "webhook_server", "run_tests_with_coverage", "build_cache",
+               "search_cache", "code_indexer", "pipeline"]
+# Tunga beroenden som bara får laddas när de faktiskt används
+HEAVY = ["openai", "bandit", "radon", "git", "requests", "dotenv"]
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "200"))
+RUNS = 3
+
+
+def import_profile(module):
+    """
+    Kör `python -X importtime` på modulen och ger (egen kumulativ tid i ms,
+    importerade moduler, om .env lästes).
+    """
+    # Utan nycklar i miljön: en import som försöker bygga en klient syns som ett fel
+    env = {k: v for k, v in os.environ.items() if k not in ("OPENAI_API_KEY", "GITHUB_TOKEN")}
+    code = f"import {module}, clients; print(clients._config_loaded)"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, env=env, cwd=ROOT)
+    if result.returncode != 0:
+        raise AssertionError(f"import {module} misslyckades:\n{result.stderr.strip().splitlines()[-1]}")
+    total = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            total = int(cumulative) / 1000
+    return total, imported, result.stdout.strip() == "True"
+
+
+class ImportTimeTest(unittest.TestCase):
+    def test_cli_modules_import_fast_without_side_effects(self):
+        for module in CLI_MODULES:
+            with self.subTest(module=module):
+                profiles = [import_profile(module) for _ in range(RUNS)]
+                fastest = min(ms for ms, _, _ in profiles)
+                _, imported, config_loaded = profiles[0]
+                heavy = sorted({name.split(".")[0] for name in imported if name.split(".")[0] in HEAVY})
+                self.assertEqual(heavy, [], f"{module} importerar {', '.join(heavy)} vid start")
+                self.assertFalse(config_loaded, f"{module} läser .env vid import")
+                self.assertLessEqual(fastest, BUDGET_MS, f"{module}: {fastest:.1f} ms > {BUDGET_MS:.0f} ms")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from contextlib import redirect_stdout
+from io import StringIO
+
+from instrumentation import instrumented_run, span
+
+
+class InstrumentedRunTest(unittest.TestCase):
+    def test_export_paths_read_when_run_starts(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, "metrics.json")
+        # Satt efter importen, som när .env läses först vid användning
+        with mock.patch.dict(os.environ, {"METRICS_JSON": path}), redirect_stdout(StringIO()):
+            with instrumented_run("test"):
+                with span("steg"):
+                    pass
+        with open(path) as f:
+            self.assertIn("steg", json.dumps(json.load(f)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from patch_engine import parse_patch, apply_hunks, apply_patches
+from rule_engine import check_source, fix_diff
+
+
+def hunks(diff):
+    return [h for p in parse_patch(diff) for h in p["hunks"]]
+
+
+class ApplyHunksTest(unittest.TestCase):
+    def test_form_feed_is_part_of_line(self):
+        code = "def f():\n    return 1\n\x0c\ndef g():\n    return 2\n"
+        diff = "@@ -4,2 +4,2 @@\n def g():\n-    return 2\n+    return 3\n"
+        new_code, applied, rejected = apply_hunks(code, hunks(diff))
+        self.assertEqual(new_code, "def f():\n    return 1\n\x0c\ndef g():\n    return 3\n")
+        self.assertEqual((len(applied), rejected), (1, []))
+
+    def test_form_feed_line_as_context(self):
+        diff = "@@ -1,3 +1,3 @@\n a\n \x0c\n-b\n+c\n"
+        self.assertEqual(apply_hunks("a\n\x0c\nb\n", hunks(diff))[0], "a\n\x0c\nc\n")
+
+    def test_crlf_kept(self):
+        diff = "@@ -2 +2 @@\n-b\n+c\n"
+        self.assertEqual(apply_hunks("a\r\nb\r\n", hunks(diff))[0], "a\r\nc\r\n")
+
+    def test_offset_tolerated(self):
+        code = "".join(f"x{i} = {i}\n" for i in range(20))
+        # Hunken säger rad 3 men texten står på rad 13
+        diff = "@@ -3,3 +3,3 @@\n x11 = 11\n-x12 = 12\n+x12 = 0\n x13 = 13\n"
+        new_code, applied, rejected = apply_hunks(code, hunks(diff))
+        self.assertIn("x12 = 0\n", new_code)
+        self.assertEqual((len(applied), rejected), (1, []))
+
+    def test_conflicting_hunks_rejected(self):
+        code = "a\nb\nc\n"
+        first = hunks("@@ -2 +2 @@\n-b\n+B\n")
+        second = hunks("@@ -2 +2 @@\n-b\n+X\n")
+        new_code, applied, rejected = apply_hunks(code, first + second)
+        self.assertEqual(new_code, "a\nB\nc\n")
+        self.assertEqual(applied, first)
+        self.assertEqual(rejected, second)
+
+    def test_headerless_diff(self):
+        diff = " def f():\n-    print('x')\n+    return 'x'\n"
+        patches = parse_patch(diff)
+        self.assertEqual(patches[0]["path"], None)
+        self.assertIsNone(patches[0]["hunks"][0]["old_start"])
+        new_code = apply_hunks("import os\ndef f():\n    print('x')\n", patches[0]["hunks"])[0]
+        self.assertEqual(new_code, "import os\ndef f():\n    return 'x'\n")
+
+    def test_fix_diff_applies_after_form_feed(self):
+        source = "import logging\n\x0c\ndef f():\n    print('x')\n"
+        diff = fix_diff(source, check_source(source, "x.py")["findings"], "x.py")
+        new_code, applied, rejected = apply_hunks(source, hunks(diff))
+        self.assertEqual(new_code, "import logging\n\x0c\ndef f():\n    logging.info('x')\n")
+        self.assertEqual(rejected, [])
+
+    def test_fix_diff_applies_with_lone_carriage_return(self):
+        # ast och rule_engine räknar ett ensamt \r som radslut; apply_hunks måste räkna likadant
+        source = "import logging\rdef f():\r    print('x')\r"
+        diff = fix_diff(source, check_source(source, "x.py")["findings"], "x.py")
+        new_code, applied, rejected = apply_hunks(source, hunks(diff))
+        self.assertEqual(rejected, [])
+        self.assertEqual(new_code, "import logging\rdef f():\r    logging.info('x')\r")
+
+    def test_mixed_line_endings_kept(self):
+        diff = "@@ -2 +2,2 @@\n-b\n+B\n+c\n"
+        self.assertEqual(apply_hunks("a\r\nb\r\nd\n", hunks(diff))[0], "a\r\nB\r\nc\r\nd\n")
+
+    def test_missing_final_newline_kept(self):
+        self.assertEqual(apply_hunks("a\nb", hunks("@@ -2 +2,2 @@\n-b\n+B\n+c\n"))[0], "a\nB\nc")
+        self.assertEqual(apply_hunks("a\nb", hunks("@@ -1 +1 @@\n-a\n+A\n"))[0], "A\nb")
+
+
+class ApplyPatchesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def test_crlf_round_trip(self):
+        path = os.path.join(self.tmp, "a.py")
+        with open(path, "wb") as f:
+            f.write(b"a\r\nb\r\nc\r\n")
+        diff = "--- a/a.py\n+++ b/a.py\n@@ -2 +2,2 @@\n-b\n+B\n+d\n"
+        results = apply_patches(parse_patch(diff), repo_path=self.tmp)
+        self.assertEqual(results[0]["rejected"], [])
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"a\r\nB\r\nd\r\nc\r\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
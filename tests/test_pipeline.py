@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pipeline
+from instrumentation import get_recorder
+
+
+class PipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.files = []
+        sources = {
+            "enkel.py": "def f(a):\n    if a:\n        return 1\n    return 2\n",
+            "farlig.py": "import subprocess\n\ndef g(cmd):\n    return subprocess.call(cmd, shell=True)\n",
+            "trasig.py": "def h(:\n",
+        }
+        for name, source in sources.items():
+            path = os.path.join(self.tmp, name)
+            with open(path, "w") as f:
+                f.write(source)
+            self.files.append(path)
+
+    def test_radon_and_bandit_run_in_process_pool(self):
+        get_recorder().reset("test")
+        with mock.patch.object(pipeline, "analyze_code_with_gpt", return_value="ok"):
+            results = dict(pipeline.run_pipeline(self.files, jobs=2, llm_jobs=1))
+        self.assertEqual(list(results), self.files)
+        enkel, farlig, trasig = (results[f] for f in self.files)
+        self.assertEqual([c["name"] for c in enkel["complexity"]], ["f"])
+        self.assertEqual(enkel["errors"], [])
+        self.assertTrue(any(issue["test_id"] == "B602" for issue in farlig["issues"]))
+        self.assertTrue(any(e.startswith("Radon misslyckades") for e in trasig["errors"]))
+        stages = {s["stage"]: s for s in get_recorder().snapshot()["stages"]}
+        self.assertEqual(stages["radon"]["files"], 3)
+        self.assertEqual(stages["bandit"]["files"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import retrieval
+from fake_embeddings import FakeEmbeddingClient, fake_vector
+from retrieval import commit_snippet, embed_queries, relative_path, retrieve_contexts
+from search_engine import SearchEngine
+from code_indexer import index_repo
+from vector_store import EmbeddingStore, STORE_PATH
+
+
+class RetrievalTest(unittest.TestCase):
+    def setUp(self):
+        retrieval._query_embeddings.clear()
+        retrieval._snippets.clear()
+
+    def test_query_memo_is_bounded(self):
+        client = FakeEmbeddingClient()
+        with mock.patch.object(retrieval, "QUERY_CACHE_SIZE", 3):
+            embed_queries([f"fråga {i}" for i in range(10)], client)
+        self.assertEqual(len(retrieval._query_embeddings), 3)
+
+    def test_relative_path(self):
+        repo = os.path.abspath("repo")
+        self.assertEqual(relative_path(os.path.join(repo, "pkg", "a.py"), repo), os.path.join("pkg", "a.py"))
+        self.assertEqual(relative_path("./pkg/a.py", repo), os.path.join("pkg", "a.py"))
+
+    def test_own_file_excluded_but_not_suffix_matches(self):
+        query = "def f(): pass"
+        vector = fake_vector(query, 1536)
+        rows = [
+            {"path": "a.py", "start": 1, "end": 1, "label": "f", "text": "def f(): pass"},
+            {"path": "pkg/a.py", "start": 1, "end": 1, "label": "f", "text": "def f(): pass"},
+        ]
+        code_engine = (SearchEngine(range(2), [vector, vector]), rows)
+        empty = SearchEngine([], np.zeros((0, 1536), dtype=np.float32))
+        contexts = retrieve_contexts({"pkg/a.py": query}, ".", engine=empty, client=FakeEmbeddingClient(),
+                                     code_engine=code_engine)
+        self.assertIn("a.py rader", contexts["pkg/a.py"])
+        self.assertNotIn("pkg/a.py rader", contexts["pkg/a.py"])
+
+
+class CommitSnippetTest(unittest.TestCase):
+    def test_reads_commit_from_given_repo(self):
+        repo = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, repo)
+
+        def git(*args):
+            return subprocess.run(["git", "-C", repo, "-c", "user.name=t", "-c", "user.email=t@t", *args],
+                                  check=True, capture_output=True, text=True).stdout.strip()
+
+        git("init", "-q")
+        with open(os.path.join(repo, "a.py"), "w") as f:
+            f.write("x = 1\n")
+        git("add", "a.py")
+        git("commit", "-q", "-m", "Lägg till a")
+        sha = git("rev-parse", "HEAD")
+        self.assertIn("Lägg till a", commit_snippet(sha, repo))
+        self.assertIn("+x = 1", commit_snippet(sha, repo))
+
+    def test_store_and_code_index_read_from_repo_path(self):
+        repo = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, repo)
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+
+        def git(*args):
+            return subprocess.run(["git", "-C", repo, "-c", "user.name=t", "-c", "user.email=t@t", *args],
+                                  check=True, capture_output=True, text=True).stdout.strip()
+
+        git("init", "-q")
+        with open(os.path.join(repo, "a.py"), "w") as f:
+            f.write("def f():\n    return 1\n")
+        git("add", "a.py")
+        git("commit", "-q", "-m", "Lägg till f")
+        sha = git("rev-parse", "HEAD")
+        query = "def f(): return 2"
+        EmbeddingStore(os.path.join(repo, STORE_PATH)).append([sha], [fake_vector(query, 1536)])
+        index_repo(repo, client=FakeEmbeddingClient())
+
+        # Arbetskatalogen är en annan än repot
+        cwd = os.getcwd()
+        os.chdir(other)
+        self.addCleanup(os.chdir, cwd)
+        self.assertEqual([row["path"] for row in retrieval.load_code_engine(repo_path=repo)[1]], ["a.py"])
+        contexts = retrieve_contexts({"b.py": query}, repo, client=FakeEmbeddingClient())
+        self.assertIn(f"Commit {sha[:10]}", contexts["b.py"])
+        self.assertIn("Lägg till f", contexts["b.py"])
+
+
+if __name__ == "__main__":
+    unittest.main()
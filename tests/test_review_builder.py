@@ -0,0 +1,41 @@
+import unittest
+
+from fake_github import start_fake_github
+from github_client import GitHubClient
+from review_builder import ReviewBuilder
+
+
+class ReviewBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.server, self.state = start_fake_github()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.github = GitHubClient("t", api_base=self.state.base_url, cache_file=None)
+        self.addCleanup(self.github.session.close)
+        self.pr = self.state.add_pull(1, "gren")
+
+    def posts(self):
+        return [path for method, path in self.state.requests if method == "POST"]
+
+    def test_comments_batched_into_few_reviews(self):
+        review = ReviewBuilder(self.pr, self.github, max_comments=50)
+        for line in range(1, 121):
+            review.add("a.py", line, f"Förslag {line}")
+        review.submit()
+        self.assertEqual(self.posts(), ["/repos/gulcoder/code-review-bot/pulls/1/reviews"] * 3)
+        self.assertEqual(len(self.state.review_comments[1]), 120)
+
+    def test_duplicates_not_posted_again(self):
+        first = ReviewBuilder(self.pr, self.github)
+        first.add("a.py", 1, "Förslag")
+        first.add("a.py", 1, "Förslag")
+        first.submit()
+        again = ReviewBuilder(self.pr, self.github)
+        again.add("a.py", 1, "Förslag")
+        self.assertEqual(again.submit(), [])
+        self.assertEqual(len(self.posts()), 1)
+        self.assertEqual(len(self.state.review_comments[1]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
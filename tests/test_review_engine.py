@@ -0,0 +1,54 @@
+import ast
+import time
+import threading
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+import review_engine
+from review_engine import chunk_source, review_chunks, set_llm_jobs
+
+
+class ReviewChunksTest(unittest.TestCase):
+    def tearDown(self):
+        set_llm_jobs(review_engine.REVIEW_JOBS)
+
+    def test_nested_calls_share_one_limit(self):
+        lock = threading.Lock()
+        active = [0, 0]
+
+        def fake_completion(client, model, messages, temperature, stream=False, on_delta=None):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return messages
+
+        chunks = [{"start": i, "end": i, "text": str(i)} for i in range(8)]
+        set_llm_jobs(2)
+        with mock.patch.object(review_engine, "chat_completion", fake_completion):
+            # Som pipelinen: flera filer i en trådpool som var och en granskar sina bitar
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                results = list(pool.map(
+                    lambda _: review_chunks(chunks, lambda c: c["text"], None, "m", 0.0), range(4)))
+        self.assertEqual(results[0], [str(i) for i in range(8)])
+        self.assertEqual(active[1], 2)
+
+
+class ChunkSourceTest(unittest.TestCase):
+    def test_form_feed_keeps_ast_line_numbers(self):
+        body = "".join(f"    x{i} = {i}\n" for i in range(40))
+        code = "def f():\n" + body + "\x0c\ns = 'a\u2028b'\n" + "def g():\n" + body
+        chunks = chunk_source(code, max_tokens=150)
+        g = next(n for n in ast.parse(code).body if getattr(n, "name", None) == "g")
+        lines = code.split("\n")[:-1]
+        for chunk in chunks:
+            # Varje bit innehåller exakt raderna start-end räknade som ast räknar dem
+            self.assertEqual(chunk["text"], "".join(line + "\n" for line in lines[chunk["start"] - 1:chunk["end"]]))
+        self.assertEqual(chunks[-1]["end"], g.end_lineno)
+        self.assertTrue(any(c["start"] <= g.lineno and "def g():" in c["text"] for c in chunks))
+
+if __name__ == "__main__":
+    unittest.main()
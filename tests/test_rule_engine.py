@@ -0,0 +1,57 @@
+import ast
+import unittest
+
+from rule_engine import check_source, apply_fixes, only_local
+
+
+def fixed(source):
+    return apply_fixes(source, check_source(source, "x.py")["findings"])
+
+
+class RuleFixTest(unittest.TestCase):
+    def test_print_becomes_logging(self):
+        self.assertEqual(fixed("def f():\n    print('x')\n"),
+                         "import logging\ndef f():\n    logging.info('x')\n")
+
+    def test_form_feed_keeps_ast_line_numbers(self):
+        # str.splitlines skulle räkna \x0c som en egen rad och flytta fixen till fel rad
+        source = "import logging\n\x0c\ndef f():\n    print('x')"
+        self.assertEqual(fixed(source), "import logging\n\x0c\ndef f():\n    logging.info('x')")
+
+    def test_line_separator_in_string_literal(self):
+        source = "def f(x=[]):\n    s = 'a\u2028b'\n    return x == None\n"
+        result = fixed(source)
+        ast.parse(result)
+        self.assertIn("s = 'a\u2028b'", result)
+        self.assertIn("return x is None", result)
+        self.assertIn("def f(x=None):", result)
+
+    def test_crlf(self):
+        self.assertEqual(fixed("if a == None:\r\n    pass\r\n"), "if a is None:\r\n    pass\r\n")
+
+
+class OnlyLocalTest(unittest.TestCase):
+    def test_one_finding_does_not_skip_whole_file(self):
+        source = "def f():\n    print('x')\n\ndef g(a):\n    return a + 1\n"
+        self.assertFalse(only_local(check_source(source, "x.py")))
+
+    def test_findings_in_every_region(self):
+        source = "def f():\n    print('x')\n\ndef g(a):\n    print(a)\n"
+        self.assertTrue(only_local(check_source(source, "x.py")))
+
+    def test_changed_regions_decide(self):
+        source = "def f():\n    print('x')\n\ndef g(a):\n    return a + 1\n"
+        report = check_source(source, "x.py")
+        self.assertTrue(only_local(report, [(1, 2)]))
+        self.assertFalse(only_local(report, [(1, 2), (4, 5)]))
+
+    def test_module_level_code_counts(self):
+        branches = "".join(f"if x == {i}:\n    print({i})\n" for i in range(6))
+        source = "def f():\n    print('x')\n" + branches
+        report = check_source(source, "x.py")
+        self.assertGreater(report["max_complexity"], 5)
+        self.assertFalse(only_local(report))
+
+
+if __name__ == "__main__":
+    unittest.main()
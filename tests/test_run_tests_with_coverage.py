@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import run_tests_with_coverage
+from run_tests_with_coverage import save_test_file, generate_tests_batch, validate_test, RUNS_DIR
+
+
+class SaveTestFileTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repo)
+        for path in ("pkg/a/util.py", "pkg/b/util.py"):
+            os.makedirs(os.path.join(self.repo, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(self.repo, path), "w") as f:
+                f.write("def f():\n    return 1\n")
+
+    def path(self, relative):
+        return os.path.join(self.repo, relative)
+
+    def test_same_basename_gets_separate_files(self):
+        first = save_test_file("x = 1\n", self.path("pkg/a/util.py"), self.repo)
+        second = save_test_file("x = 2\n", self.path("pkg/b/util.py"), self.repo)
+        self.assertNotEqual(first, second)
+        self.assertEqual(os.path.basename(first), "test_gen_pkg__a__util.py")
+
+    def test_existing_file_is_never_overwritten(self):
+        existing = save_test_file("x = 1\n", self.path("pkg/a/util.py"), self.repo)
+        again = save_test_file("x = 2\n", self.path("pkg/a/util.py"), self.repo)
+        self.assertTrue(again.endswith("_2.py"))
+        with open(existing) as f:
+            self.assertEqual(f.read(), "x = 1\n")
+
+    def test_failed_tests_removed_without_touching_others(self):
+        tests_dir = self.path("tests")
+        os.makedirs(tests_dir)
+        with open(os.path.join(tests_dir, "test_util.py"), "w") as f:
+            f.write("# handskrivet\n")
+        uncovered = [(self.path("pkg/a/util.py"), 10.0), (self.path("pkg/b/util.py"), 20.0)]
+        with mock.patch.object(run_tests_with_coverage, "generate_unit_tests", return_value="x = 1\n"), \
+                mock.patch.object(run_tests_with_coverage, "validate_test", return_value=(False, "fel")), \
+                mock.patch.object(run_tests_with_coverage, "save_feedback"):
+            self.assertEqual(generate_tests_batch(uncovered, self.repo, feedback={}), [])
+        self.assertEqual(sorted(os.listdir(tests_dir)), ["__init__.py", "test_util.py"])
+
+
+class ValidateTestTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repo)
+        os.makedirs(os.path.join(self.repo, "tests"))
+        os.makedirs(os.path.join(self.repo, RUNS_DIR))
+        for path in ("util.py", "tests/__init__.py"):
+            with open(os.path.join(self.repo, path), "w") as f:
+                f.write("def f():\n    return 1\n" if path == "util.py" else "")
+
+    def validate(self, test_code):
+        test_path = os.path.join(self.repo, "tests", "test_gen_util.py")
+        with open(test_path, "w") as f:
+            f.write(test_code)
+        return validate_test(self.repo, os.path.join(self.repo, "util.py"), test_path, "gen")
+
+    def test_module_without_tests_rejected(self):
+        self.assertEqual(self.validate("import unittest\nimport util\n"), (False, "inga tester kördes"))
+
+    def test_passing_test_accepted(self):
+        ok, _ = self.validate("import unittest\nimport util\n\n\n"
+                              "class T(unittest.TestCase):\n    def test_f(self):\n"
+                              "        self.assertEqual(util.f(), 1)\n")
+        self.assertTrue(ok)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from search_engine import SearchEngine
+from vector_store import EmbeddingStore
+
+
+class EmbeddingStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "store")
+        rng = np.random.default_rng(0)
+        self.vectors = rng.standard_normal((50, 8)).astype(np.float32) * 3
+        self.shas = [f"sha{i}" for i in range(50)]
+
+    def exact(self, query, k=5):
+        matrix = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        scores = matrix @ (query / np.linalg.norm(query))
+        return [self.shas[i] for i in np.argsort(-scores)[:k]]
+
+    def test_rows_stored_normalized_and_searched_without_copy(self):
+        store = EmbeddingStore(self.path)
+        store.append(self.shas, self.vectors)
+        store = EmbeddingStore(self.path)
+        self.assertTrue(store.normalized)
+        np.testing.assert_allclose(np.linalg.norm(store.matrix(), axis=1), 1.0, rtol=1e-5)
+        engine = SearchEngine.from_store(store)
+        self.assertIsInstance(engine.matrix, np.memmap)
+        query = self.vectors[7] + 0.1
+        self.assertEqual([sha for sha, _ in engine.search(query, 5)], self.exact(query))
+
+    def test_float16_store_scored_in_blocks(self):
+        store = EmbeddingStore(self.path, dtype="float16")
+        store.append(self.shas, self.vectors)
+        engine = SearchEngine.from_store(EmbeddingStore(self.path))
+        self.assertEqual(engine.matrix.dtype, np.float16)
+        query = self.vectors[3]
+        self.assertEqual(engine.search(query, 1)[0][0], "sha3")
+
+    def test_old_store_upgraded_in_place(self):
+        # En äldre store: rå, onormaliserade rader och inget normalized-fält i indexet
+        with open(f"{self.path}.bin", "wb") as f:
+            f.write(self.vectors.tobytes())
+        with open(f"{self.path}.index.json", "w") as f:
+            json.dump({"dim": 8, "dtype": "float32", "shas": self.shas}, f)
+        store = EmbeddingStore(self.path)
+        self.assertFalse(store.normalized)
+        query = self.vectors[11]
+        self.assertEqual(SearchEngine.from_store(store).search(query, 1)[0][0], "sha11")
+
+        store.normalize()
+        store = EmbeddingStore(self.path)
+        self.assertTrue(store.normalized)
+        np.testing.assert_allclose(np.linalg.norm(store.matrix(), axis=1), 1.0, rtol=1e-5)
+        self.assertEqual([sha for sha, _ in SearchEngine.from_store(store).search(query, 5)], self.exact(query))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+import unittest
+
+import webhook_server
+from webhook_server import JobQueue, WebhookServer, event_to_job, verify_signature
+
+PAYLOADS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "webhook_payloads")
+
+
+def load_payload(name):
+    with open(os.path.join(PAYLOADS, name), "r") as f:
+        recorded = json.load(f)
+    return recorded["event"], json.dumps(recorded["payload"]).encode("utf-8")
+
+
+def sign(secret, body):
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+class SignatureTest(unittest.TestCase):
+    def test_unsigned_rejected_without_secret(self):
+        self.assertFalse(verify_signature("", b"{}", None))
+        self.assertTrue(verify_signature("", b"{}", None, allow_unsigned=True))
+
+    def test_signature_checked_with_secret(self):
+        body = b'{"a": 1}'
+        self.assertTrue(verify_signature("hemlig", body, sign("hemlig", body)))
+        self.assertFalse(verify_signature("hemlig", body, sign("annan", body)))
+        self.assertFalse(verify_signature("hemlig", body, None, allow_unsigned=True))
+
+    def test_serve_refuses_public_host_without_secret(self):
+        with self.assertRaises(SystemExit):
+            asyncio.run(webhook_server.serve("0.0.0.0", 0, 1, 10, secret=""))
+
+
+class ReplayTest(unittest.TestCase):
+    def replay(self, names, secret="hemlig", handler=None):
+        handled = []
+
+        async def run():
+            queue = JobQueue(handler or handled.append, workers=1)
+            server = WebhookServer(queue, secret)
+            statuses = []
+            # Alla händelser tas emot innan workern startar, som en skur från GitHub
+            for name in names:
+                event, body = load_payload(name)
+                statuses.append(server.receive(event, body, sign(secret, body))[0])
+            queue.start()
+            await queue.join()
+            await queue.stop()
+            return statuses, queue
+
+        statuses, queue = asyncio.run(run())
+        return statuses, handled, queue
+
+    def test_ignored_comment(self):
+        statuses, handled, _ = self.replay(["issue_comment_ignored.json"])
+        self.assertEqual(statuses, [200])
+        self.assertEqual(handled, [])
+
+    def test_signoff_survives_coalescing_with_synchronize(self):
+        statuses, handled, queue = self.replay(["issue_comment_signoff.json", "pull_request_synchronize.json"])
+        self.assertEqual(statuses, [202, 202])
+        self.assertEqual([job.kind for job in handled], ["signoff"])
+        self.assertEqual(queue.counters["coalesced"], 1)
+
+    def test_review_then_signoff_runs_signoff(self):
+        _, handled, _ = self.replay(["pull_request_opened.json", "issue_comment_signoff.json"])
+        self.assertEqual([job.kind for job in handled], ["signoff"])
+
+    def test_truncated_payload_rejected(self):
+        statuses, handled, _ = self.replay(["pull_request_truncated.json", "pull_request_opened.json"])
+        self.assertEqual(statuses, [400, 202])
+        self.assertEqual([job.kind for job in handled], ["review"])
+
+    def test_truncated_payload_answered_over_http(self):
+        async def run():
+            server = await asyncio.start_server(WebhookServer(JobQueue(lambda job: None), "hemlig").handle,
+                                                "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            event, body = load_payload("pull_request_truncated.json")
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write((f"POST /webhook HTTP/1.1\r\nX-GitHub-Event: {event}\r\n"
+                          f"X-Hub-Signature-256: {sign('hemlig', body)}\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return response
+
+        response = asyncio.run(run())
+        self.assertTrue(response.startswith(b"HTTP/1.1 400 "), response)
+        self.assertIn("Ogiltig payload".encode(), response)
+
+    def test_bad_signature_rejected(self):
+        async def run():
+            server = WebhookServer(JobQueue(lambda job: None), "hemlig")
+            event, body = load_payload("pull_request_opened.json")
+            return server.receive(event, body, sign("fel", body))[0]
+
+        self.assertEqual(asyncio.run(run()), 401)
+
+    def test_bot_push_synchronize_ignored(self):
+        event, body = load_payload("pull_request_synchronize.json")
+        payload = json.loads(body)
+        sha = payload["pull_request"]["head"]["sha"]
+        self.assertIsNotNone(event_to_job(event, payload))
+        self.assertIsNone(event_to_job(event, payload, ignored_shas={sha}))
+
+
+class QueueTest(unittest.TestCase):
+    def test_same_pr_requeued_instead_of_polling(self):
+        runs = []
+
+        def handler(job):
+            runs.append(("start", job.kind))
+            time.sleep(0.2)
+            runs.append(("end", job.kind))
+
+        async def run():
+            queue = JobQueue(handler, workers=2)
+            queue.start()
+            _, body = load_payload("pull_request_opened.json")
+            first = event_to_job("pull_request", json.loads(body))
+            queue.submit(first)
+            await asyncio.sleep(0.05)
+            _, body = load_payload("issue_comment_signoff.json")
+            second = event_to_job("issue_comment", json.loads(body))
+            queue.submit(second)
+            await asyncio.sleep(0.05)
+            # Den andra workern är ledig igen medan det första jobbet fortfarande körs
+            deferred = dict(queue.deferred)
+            await queue.join()
+            await queue.stop()
+            return first, deferred
+
+        first, deferred = asyncio.run(run())
+        self.assertTrue(first.superseded.is_set())
+        self.assertEqual(len(deferred), 1)
+        self.assertEqual(runs, [("start", "review"), ("end", "review"), ("start", "signoff"), ("end", "signoff")])
+
+
+if __name__ == "__main__":
+    unittest.main()
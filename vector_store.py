@@ -0,0 +1,164 @@
+import os
+import json
+import argparse
+import numpy as np
+
+STORE_PATH = "embedding_store"
+DTYPES = ("float32", "float16")
+NORMALIZE_BLOCK = 65536
+
+
+def unit_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class EmbeddingStore:
+    """
+    Binär embedding-lagring: en rå float32/float16-matris (<path>.bin) som läses
+    via np.memmap och ett litet sha→rad-index (<path>.index.json).
+    Nya rader läggs alltid till i slutet; indexet skrivs atomiskt sist, så en
+    avbruten skrivning lämnar bara bytes som ignoreras och skrivs över vid nästa append.
+    Raderna sparas normaliserade så att sökningen kan läsa memmapen direkt;
+    äldre stores utan normalisering uppgraderas med normalize().
+    """
+
+    def __init__(self, path=STORE_PATH, dtype="float32"):
+        self.path = path
+        self.data_path = f"{path}.bin"
+        self.index_path = f"{path}.index.json"
+        self.shas = []
+        self.dim = None
+        self.dtype = dtype
+        self.normalized = True
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            self.shas = index["shas"]
+            self.dim = index["dim"]
+            self.dtype = index["dtype"]
+            self.normalized = index.get("normalized", False)
+        if self.dtype not in DTYPES:
+            raise ValueError(f"Dtype måste vara en av {DTYPES}, inte {self.dtype}")
+        self.rows = {sha: i for i, sha in enumerate(self.shas)}
+
+    def __len__(self):
+        return len(self.shas)
+
+    def __contains__(self, sha):
+        return sha in self.rows
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    @property
+    def last_sha(self):
+        return self.shas[-1] if self.shas else None
+
+    def mtime(self):
+        return os.path.getmtime(self.index_path)
+
+    def matrix(self):
+        # Zero-copy: raderna läses direkt från disk via memmap
+        if not self.shas:
+            return np.zeros((0, self.dim or 0), dtype=self.dtype)
+        return np.memmap(self.data_path, dtype=self.dtype, mode="r", shape=(len(self.shas), self.dim))
+
+    def get(self, sha):
+        row = self.rows.get(sha)
+        if row is None:
+            return None
+        return self.matrix()[row]
+
+    def append(self, shas, vectors):
+        new = [(sha, vec) for sha, vec in zip(shas, vectors) if sha not in self.rows]
+        if not new:
+            return 0
+        matrix = np.asarray([vec for _, vec in new], dtype=np.float32)
+        if matrix.ndim != 2:
+            raise ValueError("Embeddings måste vara en lista av vektorer")
+        if self.normalized:
+            matrix = unit_rows(matrix)
+        matrix = matrix.astype(self.dtype, copy=False)
+        if self.dim is None:
+            self.dim = int(matrix.shape[1])
+        elif matrix.shape[1] != self.dim:
+            raise ValueError(f"Fel dimension {matrix.shape[1]}, storen har {self.dim}")
+
+        row_bytes = self.dim * np.dtype(self.dtype).itemsize
+        with open(self.data_path, "ab") as f:
+            # Kapa eventuella rester från en tidigare avbruten skrivning
+            f.truncate(len(self.shas) * row_bytes)
+            f.write(matrix.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        for sha, _ in new:
+            self.rows[sha] = len(self.shas)
+            self.shas.append(sha)
+        self._write_index()
+        return len(new)
+
+    def normalize(self):
+        """Normaliserar en äldre stores rader på plats, blockvis; gör ingenting om de redan är det."""
+        if self.normalized:
+            return
+        if self.shas:
+            matrix = np.memmap(self.data_path, dtype=self.dtype, mode="r+", shape=(len(self.shas), self.dim))
+            for start in range(0, len(self.shas), NORMALIZE_BLOCK):
+                matrix[start:start + NORMALIZE_BLOCK] = unit_rows(matrix[start:start + NORMALIZE_BLOCK])
+            matrix.flush()
+            del matrix
+        # Avbryts det här körs normaliseringen om nästa gång, vilket inte ändrar redan normaliserade rader
+        self.normalized = True
+        self._write_index()
+
+    def _write_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype, "normalized": self.normalized, "shas": self.shas}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+
+def migrate_json(json_path, store):
+    with open(json_path, "r") as f:
+        cache = json.load(f)
+    return store.append(list(cache.keys()), list(cache.values()))
+
+
+def migrate_db(db_path, store):
+    # create_db uppgraderar en gammal databas med JSON-embeddings till BLOB-schemat först
+    from embedding_cache import create_db, iter_embedding_batches
+    conn = create_db(db_path)
+    added = 0
+    try:
+        for hashes, _, matrix in iter_embedding_batches(conn):
+            added += store.append(hashes, matrix)
+    finally:
+        conn.close()
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrera embedding_cache.json/.db till den binära storen")
+    parser.add_argument("sources", nargs="+", help="embedding_cache.json och/eller embedding_cache.db")
+    parser.add_argument("--store", default=STORE_PATH)
+    parser.add_argument("--dtype", choices=DTYPES, default="float32")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.store, dtype=args.dtype)
+    for source in args.sources:
+        if source.endswith(".db"):
+            added = migrate_db(source, store)
+        else:
+            added = migrate_json(source, store)
+        print(f"Migrerade {added} embeddings från {source}")
+    print(f"Storen {args.store} innehåller nu {len(store)} embeddings ({store.dtype}, dim {store.dim})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+import os
+import sys
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import threading
+from collections import deque
+from clients import get_github_client, get_setting
+
+QUEUE_SIZE = 100
+WORKERS = 2
+WORKSPACE_DIR = "workspaces"
+MAX_BODY = 5 * 1024 * 1024
+PR_ACTIONS = ("opened", "synchronize", "reopened", "ready_for_review")
+SIGNOFF_COMMAND = "/refactor sign-off"
+# Vid sammanslagning behålls det starkaste jobbet: en sign-off får inte bli en vanlig granskning
+KIND_PRIORITY = {"review": 0, "signoff": 1}
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+# Commits som boten själv har pushat; deras synchronize-händelser ignoreras
+BOT_COMMITS_KEPT = 1000
+bot_commits = deque(maxlen=BOT_COMMITS_KEPT)
+
+
+def verify_signature(secret, body, signature_header, allow_unsigned=False):
+    # Utan hemlighet godtas bara osignerade anrop när servern uttryckligen tillåter det (loopback, replay)
+    if not secret:
+        return allow_unsigned
+    if not signature_header or not signature_header.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature_header[len("sha256="):])
+
+
+class Job:
+    def __init__(self, owner, repo, number, kind, pr_url, delivery=None):
+        self.owner = owner
+        self.repo = repo
+        self.number = number
+        self.kind = kind
+        self.pr_url = pr_url
+        self.delivery = delivery
+        self.enqueued_at = time.monotonic()
+        # Sätts när en nyare händelse för samma PR ersätter jobbet medan det körs
+        self.superseded = threading.Event()
+
+    @property
+    def key(self):
+        return (self.owner, self.repo, self.number)
+
+    def __repr__(self):
+        return f"Job({self.owner}/{self.repo}#{self.number} {self.kind})"
+
+
+def _field(payload, *keys):
+    """Värdet under keys i payloaden; ValueError om något led saknas."""
+    value = payload
+    for key in keys:
+        if not isinstance(value, dict) or value.get(key) in (None, ""):
+            raise ValueError(f"payloaden saknar {'.'.join(keys)}")
+        value = value[key]
+    return value
+
+
+def event_to_job(event, payload, delivery=None, ignored_shas=()):
+    """
+    Översätter en GitHub-händelse till ett Job, eller None om den ska
+    ignoreras. synchronize för en head-commit i ignored_shas (botens egna
+    fixup-commits) ignoreras. En händelse som ska köras men saknar PR-nummer,
+    URL eller repository ger ValueError.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("payloaden är inte ett JSON-objekt")
+    if event == "pull_request" and payload.get("action") in PR_ACTIONS:
+        pr = _field(payload, "pull_request")
+        if payload["action"] == "synchronize" and (pr.get("head") or {}).get("sha") in ignored_shas:
+            return None
+        return Job(_field(payload, "repository", "owner", "login"), _field(payload, "repository", "name"),
+                   _field(pr, "number"), "review", _field(pr, "url"), delivery)
+    if event == "issue_comment" and payload.get("action") == "created":
+        issue = payload.get("issue") or {}
+        body = (payload.get("comment") or {}).get("body") or ""
+        if "pull_request" in issue and SIGNOFF_COMMAND in body.lower():
+            return Job(_field(payload, "repository", "owner", "login"), _field(payload, "repository", "name"),
+                       _field(issue, "number"), "signoff", _field(issue, "pull_request", "url"), delivery)
+    return None
+
+
+class LatencyStats:
+    def __init__(self, window=1000):
+        self.count = 0
+        self.total = 0.0
+        self.window = window
+        self.recent = []
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+        if len(self.recent) > self.window:
+            self.recent.pop(0)
+
+    def quantile(self, q):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def merge_jobs(old, new):
+    # Den nyare händelsen gäller, men med det starkaste slaget av de två
+    if KIND_PRIORITY.get(old.kind, 0) > KIND_PRIORITY.get(new.kind, 0):
+        new.kind = old.kind
+    new.enqueued_at = min(old.enqueued_at, new.enqueued_at)
+    return new
+
+
+class JobQueue:
+    """
+    Begränsad jobbkö med sammanslagning per PR: en ny händelse för en PR som
+    redan väntar ersätter det köade jobbet (med det starkaste slaget), och ett
+    pågående jobb för samma PR markeras som ersatt så att det avbryts mellan
+    stegen. Ett jobb vars PR redan körs ställs åt sidan och köas om när
+    körningen är klar, i stället för att hålla en worker.
+    """
+
+    def __init__(self, handler, maxsize=QUEUE_SIZE, workers=WORKERS):
+        self.handler = handler
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.pending = {}
+        self.running = {}
+        self.deferred = {}
+        self.workers = workers
+        self.tasks = []
+        self.counters = {"enqueued": 0, "coalesced": 0, "rejected": 0,
+                         "completed": 0, "failed": 0, "superseded": 0}
+        self.wait_latency = LatencyStats()
+        self.run_latency = LatencyStats()
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def submit(self, job):
+        """Returnerar 'queued', 'coalesced' eller 'rejected'."""
+        running = self.running.get(job.key)
+        if running is not None:
+            running.superseded.set()
+            self.counters["superseded"] += 1
+        if job.key in self.pending:
+            self.pending[job.key] = merge_jobs(self.pending[job.key], job)
+            self.counters["coalesced"] += 1
+            return "coalesced"
+        try:
+            self.queue.put_nowait(job.key)
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            return "rejected"
+        self.pending[job.key] = job
+        self.counters["enqueued"] += 1
+        return "queued"
+
+    async def _worker(self):
+        while True:
+            key = await self.queue.get()
+            job = self.pending.pop(key)
+            if key in self.running:
+                # Samma PR körs i en annan worker: köas om när den är klar
+                old = self.deferred.get(key)
+                self.deferred[key] = merge_jobs(old, job) if old else job
+                self.queue.task_done()
+                continue
+            self.running[key] = job
+            self.wait_latency.observe(time.monotonic() - job.enqueued_at)
+            start = time.monotonic()
+            try:
+                await asyncio.to_thread(self.handler, job)
+                self.counters["completed"] += 1
+            except Exception as e:
+                self.counters["failed"] += 1
+                print(f"❌ {job} misslyckades: {e}")
+            finally:
+                self.run_latency.observe(time.monotonic() - start)
+                del self.running[key]
+                self._requeue(key)
+                self.queue.task_done()
+
+    def _requeue(self, key):
+        job = self.deferred.pop(key, None)
+        if job is None:
+            return
+        if key in self.pending:
+            self.pending[key] = merge_jobs(job, self.pending[key])
+            return
+        try:
+            self.queue.put_nowait(key)
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            return
+        self.pending[key] = job
+
+    async def join(self):
+        await self.queue.join()
+
+    def metrics(self):
+        lines = [
+            "# TYPE review_queue_depth gauge",
+            f"review_queue_depth {self.queue.qsize()}",
+            "# TYPE review_jobs_running gauge",
+            f"review_jobs_running {len(self.running)}",
+        ]
+        for name, value in self.counters.items():
+            lines.append(f"# TYPE review_jobs_{name}_total counter")
+            lines.append(f"review_jobs_{name}_total {value}")
+        for name, stats in (("wait", self.wait_latency), ("run", self.run_latency)):
+            metric = f"review_job_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for q in (0.5, 0.95):
+                lines.append(f'{metric}{{quantile="{q}"}} {stats.quantile(q):.6f}')
+            lines.append(f"{metric}_sum {stats.total:.6f}")
+            lines.append(f"{metric}_count {stats.count}")
+        return "\n".join(lines) + "\n"
+
+
+def run_review_job(job):
+    # Importeras här så att servern startar utan OpenAI/Git-beroenden laddade
+    import github_commenter
+
+    if job.superseded.is_set():
+        print(f"⏭️ {job} ersattes innan start, hoppar över.")
+        return
+    pr = get_github_client().get(job.pr_url)
+    repo_path = os.path.join(WORKSPACE_DIR, f"{job.owner}-{job.repo}-{job.number}")
+    github_commenter.review_pull_request(job.owner, job.repo, pr, repo_path=repo_path, kind=job.kind,
+                                         on_commit=bot_commits.append, superseded=job.superseded)
+
+
+class WebhookServer:
+    def __init__(self, queue, secret, allow_unsigned=False):
+        self.queue = queue
+        self.secret = secret
+        self.allow_unsigned = allow_unsigned
+
+    async def handle(self, reader, writer):
+        try:
+            status, body = await self._dispatch(reader)
+        except (asyncio.IncompleteReadError, ValueError, json.JSONDecodeError) as e:
+            status, body = 400, f"Ogiltig begäran: {e}\n"
+        data = body.encode("utf-8")
+        reason = {200: "OK", 202: "Accepted", 400: "Bad Request", 401: "Unauthorized",
+                  404: "Not Found", 413: "Payload Too Large", 503: "Service Unavailable"}.get(status, "")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("utf-8") + data
+        )
+        await writer.drain()
+        writer.close()
+
+    async def _dispatch(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = request_line.split(" ", 2)
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if method == "GET" and path == "/metrics":
+            from instrumentation import get_recorder
+            return 200, self.queue.metrics() + get_recorder().prometheus()
+        if method == "GET" and path == "/llm-cache/stats":
+            from llm_cache import get_default_cache
+            cache = get_default_cache()
+            return 200, json.dumps(cache.stats() if cache else {"enabled": False}) + "\n"
+        if method == "GET" and path == "/healthz":
+            return 200, "ok\n"
+        if method != "POST" or path != "/webhook":
+            return 404, "Finns inte\n"
+
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY:
+            return 413, "För stor payload\n"
+        body = await reader.readexactly(length)
+        return self.receive(headers.get("x-github-event"), body,
+                            headers.get("x-hub-signature-256"), headers.get("x-github-delivery"))
+
+    def receive(self, event, body, signature=None, delivery=None):
+        if not verify_signature(self.secret, body, signature, self.allow_unsigned):
+            return 401, "Ogiltig signatur\n"
+        if event == "ping":
+            return 200, "pong\n"
+        try:
+            job = event_to_job(event, json.loads(body), delivery, bot_commits)
+        except ValueError as e:
+            # Korrekt signerad men ofullständig payload: svara 400 i stället för att tappa anslutningen
+            return 400, f"Ogiltig payload: {e}\n"
+        if job is None:
+            return 200, "Ignorerad händelse\n"
+        result = self.queue.submit(job)
+        if result == "rejected":
+            return 503, "Kön är full\n"
+        return 202, f"{result}: {job}\n"
+
+
+async def serve(host, port, workers, queue_size, secret=None):
+    # Hemligheten läses (och .env laddas) först när servern startar, inte vid import
+    if secret is None:
+        secret = get_setting("GITHUB_WEBHOOK_SECRET", "")
+    # Osignerade anrop kan starta granskningar, pushar och körning av PR-kod
+    if not secret and host not in LOOPBACK_HOSTS:
+        raise SystemExit("GITHUB_WEBHOOK_SECRET saknas; utan hemlighet startar servern bara på 127.0.0.1.")
+    if not secret:
+        print("⚠️ Ingen GITHUB_WEBHOOK_SECRET, tar emot osignerade anrop på loopback.")
+    queue = JobQueue(run_review_job, maxsize=queue_size, workers=workers)
+    queue.start()
+    server = await asyncio.start_server(WebhookServer(queue, secret, allow_unsigned=not secret).handle, host, port)
+    print(f"🚀 Webhook-server lyssnar på http://{host}:{port}/webhook ({workers} workers)")
+    async with server:
+        await server.serve_forever()
+
+
+async def replay(paths, secret=None, workers=WORKERS):
+    """Kör inspelade payloads genom signaturkontroll och kö utan att anropa GitHub."""
+    if secret is None:
+        secret = get_setting("GITHUB_WEBHOOK_SECRET", "")
+    handled = []
+
+    def record(job):
+        time.sleep(0.01)
+        handled.append(job)
+
+    queue = JobQueue(record, workers=workers)
+    queue.start()
+    # Replay körs lokalt och anropar inte GitHub; osignerade inspelningar godtas
+    server = WebhookServer(queue, secret, allow_unsigned=True)
+    for path in paths:
+        with open(path, "r") as f:
+            recorded = json.load(f)
+        body = json.dumps(recorded["payload"]).encode("utf-8")
+        signature = recorded.get("signature")
+        if signature is None and secret:
+            signature = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        status, message = server.receive(recorded["event"], body, signature)
+        print(f"{os.path.basename(path)}: {status} {message.strip()}")
+    await queue.join()
+    await queue.stop()
+    print(f"Körda jobb: {handled}")
+    print(queue.metrics(), end="")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook-server för AutoReview-Bot")
+    sub = parser.add_subparsers(dest="command")
+    serve_parser = sub.add_parser("serve")
+    serve_parser.add_argument("--host", default="0.0.0.0")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--workers", type=int, default=WORKERS)
+    serve_parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    replay_parser = sub.add_parser("replay")
+    replay_parser.add_argument("payloads", nargs="+", help="Inspelade webhook-payloads (JSON)")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        asyncio.run(replay(args.payloads))
+    elif args.command == "serve":
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue_size))
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()